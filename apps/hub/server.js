@@ -983,8 +983,13 @@ async function tcpEcho(host, port, msg) {
   return lines[lines.length - 1] || data.trim();
 }
 
+// Giữ TLS session theo host:port để các lần gọi sau bắt tay rút gọn (resumption)
+const tlsSessions = new Map();
+
 async function tlsEcho(host, port, msg) {
-  const sock = tls.connect({ host, port, rejectUnauthorized: false });
+  const key = `${host}:${port}`;
+  const sock = tls.connect({ host, port, rejectUnauthorized: false, session: tlsSessions.get(key) });
+  sock.on('session', (session) => tlsSessions.set(key, session));
   await new Promise((r) => sock.once('secureConnect', r));
   sock.write(String(msg) + '\n');
   const data = await readSocketForAWhile(sock);
@@ -1063,7 +1068,14 @@ app.get('/api/tools/mcast/feed', async (req, res) => {
   try {
     const type = String(req.query.type || 'all');
     const limit = String(req.query.limit || '100');
-    const url = `http://${MCAST_HOST}:${MCAST_HTTP_PORT}/feed?type=${encodeURIComponent(type)}&limit=${encodeURIComponent(limit)}`;
+    let url = `http://${MCAST_HOST}:${MCAST_HTTP_PORT}/feed?type=${encodeURIComponent(type)}&limit=${encodeURIComponent(limit)}`;
+    // since=<seq>: chỉ lấy event mới; wait=<giây>: long-poll tới khi có event mới
+    if (req.query.since !== undefined) {
+      url += `&since=${encodeURIComponent(String(req.query.since))}`;
+      if (req.query.wait !== undefined) {
+        url = url.replace('/feed?', '/feed/wait?') + `&timeout=${encodeURIComponent(String(req.query.wait))}`;
+      }
+    }
     const r = await fetch(url);
     const data = await r.json();
     res.json(data);
@@ -1,63 +1,397 @@
+import os
+import selectors
 import socket
+import sys
 import threading
 import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import admission, framing, log, metrics, runtime
+from common.framing import LineReader, LineTooLong
+from common.limits import raise_fd_limit
+from common.timerwheel import TimerWheel
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "9001"))
+
+# thread = 1 thread / client (mặc định), select = 1 event loop (epoll) cho mọi client,
+# async = common.runtime (asyncio, WORKERS process chung port)
+SERVER_MODE = os.getenv("SERVER_MODE", "thread").lower()
+MAX_CONNECTIONS = int(os.getenv("MAX_CONNECTIONS", "20000"))
+IDLE_TIMEOUT = int(os.getenv("IDLE_TIMEOUT", "300"))
+REPORT_INTERVAL = float(os.getenv("REPORT_INTERVAL", "10"))
+
+WELCOME = b"Welcome to TCP Echo Server! Type 'quit' to exit.\n"
+RECV_SIZE = 64 * 1024
+# select: reply chờ gửi vượt HIGH -> ngừng đọc client đó, xuống dưới LOW mới đọc tiếp
+# (client pipeline mà không đọc reply không làm phình RAM của server)
+WRITE_HIGH_WATER = int(os.getenv("WRITE_HIGH_WATER", str(256 * 1024)))
+WRITE_LOW_WATER = int(os.getenv("WRITE_LOW_WATER", str(64 * 1024)))
+
+CONNECTIONS = metrics.counter("tcp_echo_connections_total", "Kết nối đã accept")
+ACTIVE = metrics.gauge("tcp_echo_connections_active", "Kết nối đang mở")
+MESSAGES = metrics.counter("tcp_echo_messages_total", "Số dòng đã echo")
+BYTES_IN = metrics.counter("tcp_echo_received_bytes_total", "Byte nhận từ client")
+BYTES_OUT = metrics.counter("tcp_echo_sent_bytes_total", "Byte gửi cho client")
+TIMEOUTS = metrics.counter("tcp_echo_errors_total", "Kết nối đóng do lỗi", reason="timeout")
+RESETS = metrics.counter("tcp_echo_errors_total", reason="reset")
+ERRORS = metrics.counter("tcp_echo_errors_total", reason="error")
+
+LOG = log.get("tcp-echo")
+MSG = log.sampled("tcp-echo.msg")  # mỗi dòng echo: tối đa LOG_RATE record/giây
+
+# MAX_CONNECTIONS / MAX_PER_IP / ACCEPT_RATE, vượt -> trả BUSY rồi đóng ngay
+ADMISSION = admission.Admission("tcp-echo", max_total=MAX_CONNECTIONS)
+
+
+def reply_lines(addr, lines) -> tuple:
+    """Trả lời từng dòng theo thứ tự -> (bytes gửi 1 lần, client đã quit?)."""
+    MESSAGES.inc(len(lines))
+    out, quit_ = framing.reply_lines(lines, b"ECHO: ", b"Bye!\n",
+                                     lambda msg: MSG.info("📩 [RECV] %s: %s", addr, msg))
+    if quit_:
+        LOG.info("👋 [QUIT] %s requested quit.", addr)
+    return out, quit_
 
-HOST = "0.0.0.0"
-PORT = 9001
 
 def handle_client(conn: socket.socket, addr):
-    print(f"✅ [CONNECT] Client connected: {addr}")
-    conn.settimeout(300)
+    LOG.info("✅ [CONNECT] Client connected: %s", addr)
+    conn.settimeout(IDLE_TIMEOUT)
+    reader = LineReader()
+    CONNECTIONS.inc()
+    ACTIVE.inc()
 
     try:
         with conn:
-            conn.sendall(b"Welcome to TCP Echo Server! Type 'quit' to exit.\n")
+            conn.sendall(WELCOME)
             while True:
-                data = conn.recv(4096)
+                data = conn.recv(RECV_SIZE)
                 if not data:
-                    print(f"🔌 [DISCONNECT] {addr} closed connection.")
+                    LOG.info("🔌 [DISCONNECT] %s closed connection.", addr)
                     break
+                BYTES_IN.inc(len(data))
 
-                msg = data.decode("utf-8", errors="ignore").strip()
-                print(f"📩 [RECV] {addr}: {msg}")
-
-                if msg.lower() in ("quit", "exit", "q"):
-                    conn.sendall(b"Bye!\n")
-                    print(f"👋 [QUIT] {addr} requested quit.")
+                out, quit_ = reply_lines(addr, reader.feed(data))
+                if out:
+                    conn.sendall(out)
+                    BYTES_OUT.inc(len(out))
+                if quit_:
                     break
 
-                # Echo back
-                reply = f"ECHO: {msg}\n"
-                conn.sendall(reply.encode("utf-8"))
-
     except socket.timeout:
-        print(f"⏳ [TIMEOUT] {addr} timeout.")
+        TIMEOUTS.inc()
+        LOG.warning("⏳ [TIMEOUT] %s timeout.", addr)
     except ConnectionResetError:
-        print(f"⚠️ [RESET] {addr} connection reset.")
+        RESETS.inc()
+        LOG.warning("⚠️ [RESET] %s connection reset.", addr)
     except Exception as e:
-        print(f"❌ [ERROR] {addr}: {e}")
+        ERRORS.inc()
+        LOG.error("❌ [ERROR] %s: %s", addr, e)
     finally:
+        ACTIVE.dec()
+        ADMISSION.release(addr)
         try:
             conn.close()
         except:
             pass
 
 
+def rejected(addr, reason: str):
+    LOG.warning("🚫 [BUSY] %s rejected (%s).", addr, reason)
+
+
+def serve_threads(server_sock: socket.socket):
+    while True:
+        conn, addr = server_sock.accept()
+        reason = ADMISSION.check(addr)
+        if reason is not None:
+            # Từ chối ngay trong thread accept, không tạo thread cho client này
+            admission.reject(conn)
+            rejected(addr, reason)
+            continue
+        t = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
+        t.start()
+        LOG.info("🧵 [THREAD] Active threads: %s", threading.active_count() - 1)
+
+
+class Connection:
+    """Trạng thái của 1 client trong event loop (buffer vào/ra riêng)."""
+
+    __slots__ = ("sock", "addr", "reader", "outbuf", "timer", "closing", "events")
+
+    def __init__(self, sock: socket.socket, addr):
+        self.sock = sock
+        self.addr = addr
+        self.reader = LineReader()
+        self.outbuf = bytearray(WELCOME)
+        self.timer = None  # deadline idle trong TimerWheel
+        self.closing = False
+        self.events = selectors.EVENT_READ | selectors.EVENT_WRITE  # đang đăng ký với selector
+
+
+class SelectorEchoServer:
+    """Echo server 1 thread dùng selectors (epoll trên Linux).
+
+    Client idle chỉ tốn 1 fd + vài buffer nhỏ, không tốn thread nên có thể
+    giữ hàng chục nghìn kết nối trong 1 process. Idle timeout dùng TimerWheel:
+    có dữ liệu chỉ lùi deadline (O(1)), không quét lại toàn bộ kết nối.
+    """
+
+    def __init__(self, server_sock: socket.socket, max_connections: int = MAX_CONNECTIONS):
+        self.server_sock = server_sock
+        self.max_connections = max_connections
+        self.sel = selectors.DefaultSelector()
+        self.conns = {}
+        self.accepting = False
+        self.total_accepted = 0
+        self.peak = 0
+        self.wheel = TimerWheel(now=time.monotonic())
+        ACTIVE.fn = lambda: len(self.conns)
+
+    # ---------- accept ----------
+    def _resume_accept(self):
+        if not self.accepting:
+            self.sel.register(self.server_sock, selectors.EVENT_READ, None)
+            self.accepting = True
+
+    def _pause_accept(self):
+        # Đủ MAX_CONNECTIONS -> ngừng accept, client mới nằm chờ trong backlog của kernel
+        if self.accepting:
+            self.sel.unregister(self.server_sock)
+            self.accepting = False
+            LOG.warning("🚧 [LIMIT] %s connections open, accept paused.", len(self.conns))
+
+    def _accept(self):
+        while len(self.conns) < self.max_connections:
+            try:
+                sock, addr = self.server_sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # EMFILE/ENFILE: hết fd -> thử lại ở vòng sau
+                ERRORS.inc()
+                LOG.error("❌ [ACCEPT] %s", e)
+                return
+
+            reason = ADMISSION.check(addr)
+            if reason is not None:
+                admission.reject(sock)
+                rejected(addr, reason)
+                continue
+            sock.setblocking(False)
+            conn = Connection(sock, addr)
+            if IDLE_TIMEOUT > 0:
+                conn.timer = self.wheel.schedule(conn, IDLE_TIMEOUT, "idle")
+            self.conns[sock.fileno()] = conn
+            self.total_accepted += 1
+            self.peak = max(self.peak, len(self.conns))
+            CONNECTIONS.inc()
+            LOG.info("✅ [CONNECT] Client connected: %s", addr)
+            self.sel.register(sock, conn.events, conn)
+
+        self._pause_accept()
+
+    # ---------- per connection ----------
+    def _close(self, conn: Connection):
+        if conn.timer is not None:
+            self.wheel.cancel(conn.timer)
+            conn.timer = None
+        fd = conn.sock.fileno()
+        try:
+            self.sel.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+        if self.conns.pop(fd, None) is not None:
+            ADMISSION.release(conn.addr)
+        if len(self.conns) < self.max_connections:
+            self._resume_accept()
+
+    def _on_readable(self, conn: Connection):
+        try:
+            data = conn.sock.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionResetError:
+            RESETS.inc()
+            LOG.warning("⚠️ [RESET] %s connection reset.", conn.addr)
+            self._close(conn)
+            return
+        except OSError as e:
+            # vd. ETIMEDOUT / EHOSTUNREACH: chỉ đóng kết nối này, không để lỗi thoát khỏi vòng select
+            ERRORS.inc()
+            LOG.error("❌ [ERROR] %s: %s", conn.addr, e)
+            self._close(conn)
+            return
+
+        if not data:
+            LOG.info("🔌 [DISCONNECT] %s closed connection.", conn.addr)
+            self._close(conn)
+            return
+
+        BYTES_IN.inc(len(data))
+        if conn.timer is not None:
+            conn.timer.deadline = self.wheel.now + IDLE_TIMEOUT
+        if conn.closing:
+            return
+        try:
+            out, conn.closing = reply_lines(conn.addr, conn.reader.feed(data))
+        except LineTooLong as e:
+            ERRORS.inc()
+            LOG.error("❌ [ERROR] %s: %s", conn.addr, e)
+            self._close(conn)
+            return
+
+        conn.outbuf += out
+        self._flush(conn)
+
+    def _flush(self, conn: Connection):
+        if conn.outbuf:
+            try:
+                n = conn.sock.send(conn.outbuf)
+            except (BlockingIOError, InterruptedError):
+                n = 0
+            except OSError as e:
+                ERRORS.inc()
+                LOG.error("❌ [ERROR] %s: %s", conn.addr, e)
+                self._close(conn)
+                return
+            del conn.outbuf[:n]
+            BYTES_OUT.inc(n)
+
+        pending = len(conn.outbuf)
+        if pending:
+            # Còn dữ liệu chưa gửi -> chờ socket writable; quá HIGH thì thôi đọc
+            # cho tới khi client nhận bớt xuống LOW
+            paused = not conn.events & selectors.EVENT_READ
+            if pending >= WRITE_HIGH_WATER or (paused and pending > WRITE_LOW_WATER):
+                events = selectors.EVENT_WRITE
+            else:
+                events = selectors.EVENT_READ | selectors.EVENT_WRITE
+        elif conn.closing:
+            self._close(conn)
+            return
+        else:
+            events = selectors.EVENT_READ
+        if events != conn.events:
+            self.sel.modify(conn.sock, events, conn)
+            conn.events = events
+
+    # ---------- housekeeping ----------
+    def _expire(self, now: float):
+        # Cả lô kết nối hết hạn trong tick này đóng 1 lượt
+        for timer in self.wheel.advance(now):
+            TIMEOUTS.inc()
+            LOG.warning("⏳ [TIMEOUT] %s timeout.", timer.owner.addr)
+            self._close(timer.owner)
+
+    def report(self):
+        print(
+            f"📊 [CONNS] open={len(self.conns)}/{self.max_connections} "
+            f"peak={self.peak} accepted={self.total_accepted} "
+            f"timeouts={self.wheel.expired.get('idle', 0)}"
+        )
+
+    def serve_forever(self):
+        self.server_sock.setblocking(False)
+        self._resume_accept()
+
+        next_report = time.monotonic() + REPORT_INTERVAL
+        while True:
+            for key, mask in self.sel.select(timeout=1.0):
+                conn = key.data
+                if conn is None:
+                    self._accept()
+                    continue
+                if mask & selectors.EVENT_READ:
+                    self._on_readable(conn)
+                if mask & selectors.EVENT_WRITE and conn.sock.fileno() in self.conns:
+                    self._flush(conn)
+
+            now = time.monotonic()
+            self._expire(now)
+            if now >= next_report:
+                self.report()
+                next_report = now + REPORT_INTERVAL
+
+
+class EchoHandler(runtime.StreamHandler):
+    """Chế độ async: cùng giao thức, accept/timeout/drain do common.runtime lo."""
+
+    async def handle(self, conn: runtime.Connection):
+        LOG.info("✅ [CONNECT] Client connected: %s", conn.addr)
+        CONNECTIONS.inc()
+        reader = LineReader()
+        conn.write(WELCOME)
+        while True:
+            data = await conn.read(RECV_SIZE)
+            if not data:
+                LOG.info("🔌 [DISCONNECT] %s closed connection.", conn.addr)
+                return
+            BYTES_IN.inc(len(data))
+
+            out, quit_ = reply_lines(conn.addr, reader.feed(data))
+            if out:
+                conn.write(out)
+                BYTES_OUT.inc(len(out))
+            if quit_:
+                await conn.drain()
+                return
+            await conn.flush()
+
+    def closed(self, conn: runtime.Connection, reason: str, exc: BaseException = None):
+        if reason == "timeout":
+            TIMEOUTS.inc()
+            LOG.warning("⏳ [TIMEOUT] %s timeout.", conn.addr)
+        elif reason == "reset":
+            RESETS.inc()
+            LOG.warning("⚠️ [RESET] %s connection reset.", conn.addr)
+        elif reason == "error":
+            ERRORS.inc()
+            LOG.error("❌ [ERROR] %s: %s", conn.addr, exc)
+
+    def rejected(self, addr, reason: str):
+        rejected(addr, reason)
+
+
+def serve_async():
+    raise_fd_limit()
+    server = runtime.Server(max_connections=MAX_CONNECTIONS)
+    server.add_tcp(EchoHandler(), PORT, HOST, name="tcp-echo", idle_timeout=IDLE_TIMEOUT,
+                    admission=ADMISSION)
+    ACTIVE.fn = lambda: server.active
+    runtime.serve(server)
+
+
 def main():
     print("🚀 Starting TCP Echo Server...")
-    print(f"📡 Listening on {HOST}:{PORT}")
+    print(f"📡 Listening on {HOST}:{PORT} (mode={SERVER_MODE})")
+    print(f"🚦 Admission: {ADMISSION.describe()}")
+    if SERVER_MODE == "async":
+        serve_async()
+        return
 
     server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_sock.bind((HOST, PORT))
-    server_sock.listen(50)
+    metrics.start_from_env()
 
     try:
-        while True:
-            conn, addr = server_sock.accept()
-            t = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
-            t.start()
-            print(f"🧵 [THREAD] Active threads: {threading.active_count() - 1}")
+        if SERVER_MODE == "select":
+            raise_fd_limit()
+            server_sock.listen(admission.LISTEN_BACKLOG)
+            server = SelectorEchoServer(server_sock)
+            try:
+                server.serve_forever()
+            finally:
+                server.report()
+        else:
+            server_sock.listen(admission.LISTEN_BACKLOG)
+            serve_threads(server_sock)
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by Ctrl+C")
     finally:
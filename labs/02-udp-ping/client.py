@@ -1,5 +1,16 @@
+import argparse
+import json
+import selectors
 import socket
+import struct
+import sys
+import threading
 import time
+from collections import deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.histogram import Histogram
 
 SERVER_HOST = "127.0.0.1"
 SERVER_PORT = 9002
@@ -7,9 +18,16 @@ SERVER_PORT = 9002
 PING_COUNT = 10
 TIMEOUT_SEC = 1.0
 
-def main():
+# Cùng định dạng nhị phân với server.py (NPNG -> NPON)
+BIN_PING = struct.Struct("!4sIQ")
+BIN_PONG = struct.Struct("!4sIQQ")
+PING_MAGIC = b"NPNG"
+PONG_MAGIC = b"NPON"
+
+
+def classic(host: str, port: int):
     print("🧑‍💻 UDP Ping Client")
-    print(f"➡️ Server: {SERVER_HOST}:{SERVER_PORT}")
+    print(f"➡️ Server: {host}:{port}")
     print(f"⏱️ Timeout: {TIMEOUT_SEC}s | Count: {PING_COUNT}\n")
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -25,7 +43,7 @@ def main():
 
         start = time.time()
         try:
-            sock.sendto(msg.encode("utf-8"), (SERVER_HOST, SERVER_PORT))
+            sock.sendto(msg.encode("utf-8"), (host, port))
             data, _ = sock.recvfrom(4096)
             end = time.time()
 
@@ -52,5 +70,250 @@ def main():
         print(f"RTT(ms): min={min(rtts):.2f}  avg={sum(rtts)/len(rtts):.2f}  max={max(rtts):.2f}")
     print("==============================")
 
+
+class Measurement:
+    """Gửi ping theo tốc độ cố định trên nhiều socket, ghép reply theo seq."""
+
+    def __init__(self, host, port, rate, duration, streams, size, window, timeout):
+        self.addr = (host, port)
+        self.rate = rate
+        self.streams = streams
+        self.size = max(size, BIN_PING.size)
+        self.window = window
+        self.timeout = timeout
+        self.total = max(1, int(rate * duration))
+
+        self.socks = []
+        for _ in range(streams):
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.connect(self.addr)
+            s.setblocking(False)
+            self.socks.append(s)
+
+        self.received_flags = bytearray(self.total + 1)
+        self.expired_flags = bytearray(self.total + 1)
+        self.sent = 0
+        self.received = 0
+        self.expired = 0  # ping quá --timeout chưa có reply -> coi như mất, nhả chỗ trong window
+        self.late = 0     # reply về sau khi ping đã bị coi là mất
+        self.duplicates = 0
+        self.reordered = 0
+        self.max_seq = [0] * streams  # seq lớn nhất đã nhận, theo stream
+        self.jitter_ns = 0.0
+        self.last_transit = None
+        self.rtt = Histogram()  # micro giây
+        self.send_done_at = None
+
+    def _in_flight(self) -> int:
+        return self.sent - self.received - self.expired + self.late
+
+    def _expire(self, pending: deque, now: float):
+        """Bỏ khỏi đầu hàng chờ các ping đã có reply hoặc đã quá timeout."""
+        while pending:
+            seq, sent_at = pending[0]
+            if self.received_flags[seq]:
+                pending.popleft()
+            elif now - sent_at > self.timeout:
+                pending.popleft()
+                self.expired_flags[seq] = 1
+                self.expired += 1
+            else:
+                break
+
+    def _sender(self):
+        interval = 1.0 / self.rate
+        pad = b"\0" * (self.size - BIN_PING.size)
+        pending = deque()  # (seq, thời điểm gửi) theo thứ tự gửi
+        next_t = time.perf_counter()
+        for seq in range(1, self.total + 1):
+            # Giới hạn số ping đang bay; ping mất không được giữ chỗ mãi
+            self._expire(pending, time.perf_counter())
+            while self._in_flight() >= self.window:
+                time.sleep(0.0005)
+                self._expire(pending, time.perf_counter())
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pkt = BIN_PING.pack(PING_MAGIC, seq, time.perf_counter_ns()) + pad
+            try:
+                self.socks[seq % self.streams].send(pkt)
+            except (BlockingIOError, ConnectionRefusedError):
+                pass
+            pending.append((seq, time.perf_counter()))
+            self.sent = seq
+            next_t += interval
+        self.send_done_at = time.monotonic()
+
+    def _on_reply(self, data: bytes, now_ns: int):
+        if len(data) < BIN_PONG.size or data[:4] != PONG_MAGIC:
+            return
+        _magic, seq, client_ns, _server_ns = BIN_PONG.unpack_from(data)
+        if seq < 1 or seq > self.total:
+            return
+        if self.received_flags[seq]:
+            self.duplicates += 1
+            return
+        self.received_flags[seq] = 1
+        self.received += 1
+        if self.expired_flags[seq]:
+            self.late += 1
+
+        stream = seq % self.streams
+        if seq < self.max_seq[stream]:
+            self.reordered += 1
+        else:
+            self.max_seq[stream] = seq
+
+        rtt_ns = now_ns - client_ns
+        self.rtt.record(rtt_ns // 1000)
+
+        # RFC 3550: J += (|D| - J) / 16, D = chênh lệch transit của 2 gói liên tiếp
+        if self.last_transit is not None:
+            d = abs(rtt_ns - self.last_transit)
+            self.jitter_ns += (d - self.jitter_ns) / 16.0
+        self.last_transit = rtt_ns
+
+    def run(self):
+        sel = selectors.DefaultSelector()
+        for s in self.socks:
+            sel.register(s, selectors.EVENT_READ)
+
+        started = time.monotonic()
+        t = threading.Thread(target=self._sender, daemon=True)
+        t.start()
+
+        while True:
+            for key, _mask in sel.select(timeout=0.05):
+                while True:
+                    try:
+                        data = key.fileobj.recv(2048)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except ConnectionRefusedError:
+                        break
+                    self._on_reply(data, time.perf_counter_ns())
+            if self.send_done_at is not None:
+                if self.received >= self.total or time.monotonic() - self.send_done_at > self.timeout:
+                    break
+
+        self.elapsed = time.monotonic() - started
+        for s in self.socks:
+            s.close()
+
+    def loss_bursts(self) -> list:
+        """Độ dài các chuỗi gói mất liên tiếp (theo seq)."""
+        bursts = []
+        run = 0
+        for seq in range(1, self.sent + 1):
+            if self.received_flags[seq]:
+                if run:
+                    bursts.append(run)
+                run = 0
+            else:
+                run += 1
+        if run:
+            bursts.append(run)
+        return bursts
+
+    def report(self) -> dict:
+        bursts = self.loss_bursts()
+        lost = self.sent - self.received
+        burst_hist = {}
+        for b in bursts:
+            burst_hist[b] = burst_hist.get(b, 0) + 1
+        return {
+            "target": f"{self.addr[0]}:{self.addr[1]}",
+            "rate_pps": self.rate,
+            "streams": self.streams,
+            "size": self.size,
+            "elapsed_s": round(self.elapsed, 3),
+            "sent": self.sent,
+            "received": self.received,
+            "lost": lost,
+            "loss_pct": round(lost * 100.0 / self.sent, 3) if self.sent else 0.0,
+            "late": self.late,
+            "duplicates": self.duplicates,
+            "reordered": self.reordered,
+            "jitter_ms": round(self.jitter_ns / 1e6, 4),
+            "loss_bursts": {
+                "count": len(bursts),
+                "max": max(bursts) if bursts else 0,
+                "mean": round(sum(bursts) / len(bursts), 2) if bursts else 0.0,
+                "lengths": {str(k): v for k, v in sorted(burst_hist.items())},
+            },
+            "rtt_us": self.rtt.summary((50, 90, 99, 99.9, 99.99)),
+            "rtt_histogram_us": self.rtt.buckets(),
+        }
+
+
+def print_report(r: dict, out=sys.stdout):
+    rtt = r["rtt_us"]
+
+    def ms(us):
+        return f"{us / 1000:.3f}"
+
+    print("\n====== UDP PING MEASUREMENT ======", file=out)
+    print(f"Target   : {r['target']} | rate={r['rate_pps']}/s streams={r['streams']} size={r['size']}B", file=out)
+    print(f"Packets  : sent={r['sent']} received={r['received']} lost={r['lost']} ({r['loss_pct']:.3f}%)", file=out)
+    print(f"Anomalies: duplicates={r['duplicates']} reordered={r['reordered']} late={r['late']}", file=out)
+    lb = r["loss_bursts"]
+    print(f"Loss     : bursts={lb['count']} max={lb['max']} mean={lb['mean']}", file=out)
+    print(f"Jitter   : {r['jitter_ms']:.4f} ms (RFC 3550)", file=out)
+    print(f"RTT(ms)  : min={ms(rtt['min'])} p50={ms(rtt['p50'])} p90={ms(rtt['p90'])} "
+          f"p99={ms(rtt['p99'])} p99.9={ms(rtt['p99.9'])} max={ms(rtt['max'])}", file=out)
+
+    # Histogram gộp theo luỹ thừa 2 cho dễ đọc
+    rows = {}
+    for upper, n in r["rtt_histogram_us"]:
+        key = 1 << max(0, int(upper).bit_length())
+        rows[key] = rows.get(key, 0) + n
+    if rows:
+        peak = max(rows.values())
+        print("RTT histogram (<= us):", file=out)
+        for key in sorted(rows):
+            bar = "#" * max(1, rows[key] * 40 // peak)
+            print(f"  {key:>9} | {rows[key]:>8} {bar}", file=out)
+    print("==================================", file=out)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="UDP ping client")
+    p.add_argument("--host", default=SERVER_HOST)
+    p.add_argument("--port", type=int, default=SERVER_PORT)
+    p.add_argument("--measure", action="store_true",
+                   help="chế độ đo: nhiều ping đang bay, jitter, loss burst, histogram")
+    p.add_argument("--rate", type=float, default=1000.0, help="ping/giây (measure)")
+    p.add_argument("--duration", type=float, default=10.0, help="thời gian gửi, giây (measure)")
+    p.add_argument("--streams", type=int, default=1, help="số socket song song (measure)")
+    p.add_argument("--size", type=int, default=BIN_PING.size, help="kích thước gói, byte (measure)")
+    p.add_argument("--window", type=int, default=10000, help="số ping tối đa đang bay (measure)")
+    p.add_argument("--timeout", type=float, default=TIMEOUT_SEC, help="chờ reply cuối, giây (measure)")
+    p.add_argument("--json", metavar="PATH", help="ghi báo cáo JSON ('-' = stdout)")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.measure:
+        classic(args.host, args.port)
+        return
+
+    # --json -: stdout chỉ chứa JSON (để pipe vào jq), bản tóm tắt cho người đọc ra stderr
+    out = sys.stderr if args.json == "-" else sys.stdout
+    print("🧑‍💻 UDP Ping Client (measure)", file=out)
+    print(f"➡️ Server: {args.host}:{args.port} | {args.rate:g} pps x {args.duration:g}s", file=out)
+    m = Measurement(args.host, args.port, args.rate, args.duration,
+                    max(1, args.streams), args.size, max(1, args.window), args.timeout)
+    m.run()
+    report = m.report()
+    print_report(report, out)
+
+    if args.json:
+        body = json.dumps(report, indent=2)
+        if args.json == "-":
+            print(body)
+        else:
+            Path(args.json).write_text(body + "\n", encoding="utf-8")
+
 if __name__ == "__main__":
     main()
@@ -1,13 +1,260 @@
+import argparse
+import json
+import os
 import socket
+import struct
+import sys
+import threading
 import time
+from pathlib import Path
 
-HOST = "0.0.0.0"
-PORT = 9002
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import log, metrics, runtime
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "9002"))
+
+# fast = nhiều socket SO_REUSEPORT (mỗi socket 1 thread), đọc theo lô, log tắt
+# async = common.runtime (asyncio), WORKERS process chung port
+UDP_MODE = os.getenv("UDP_MODE", "simple").lower()
+WORKERS = int(os.getenv("WORKERS", "4"))
+LOG_PACKETS = os.getenv("LOG_PACKETS", "")  # "" = theo mode (simple: bật, fast: tắt)
+RCVBUF = int(os.getenv("RCVBUF", str(4 * 1024 * 1024)))
+MAX_CLIENTS = int(os.getenv("MAX_CLIENTS", "4096"))
+REPORT_INTERVAL = float(os.getenv("REPORT_INTERVAL", "10"))
+# Lệnh STATS (trả JSON lớn) chỉ cho các IP này: UDP giả mạo được IP nguồn, mở cho
+# mọi người thì server thành bộ khuếch đại phản xạ (5 byte vào, hàng chục KB ra)
+STATS_ALLOW = {ip.strip() for ip in os.getenv("STATS_ALLOW", "127.0.0.1,::1").split(",") if ip.strip()}
+MAX_STATS_REPLY = 60000  # vừa 1 datagram
+
+RECV_BUF = 65536
+MAX_BATCH = 256
+
+# Ping nhị phân: magic(4) seq(u32) client_time_ns(u64)
+# Pong nhị phân: b"NPON" seq client_time_ns server_time_ns(u64)
+BIN_PING = struct.Struct("!4sIQ")
+BIN_PONG = struct.Struct("!4sIQQ")
+PING_MAGIC = b"NPNG"
+PONG_MAGIC = b"NPON"
+
+PACKETS = metrics.counter("udp_ping_packets_total", "Gói đã nhận")
+BYTES_IN = metrics.counter("udp_ping_received_bytes_total", "Byte nhận")
+BYTES_OUT = metrics.counter("udp_ping_sent_bytes_total", "Byte gửi")
+SEND_ERRORS = metrics.counter("udp_ping_send_errors_total", "sendto lỗi")
+RECV_ERRORS = metrics.counter("udp_ping_recv_errors_total", "recvfrom lỗi (fast mode)")
+BAD_PACKETS = metrics.counter("udp_ping_bad_packets_total", "Gói không dựng được reply, bỏ qua")
+BATCH = metrics.histogram("udp_ping_batch_size", "Số gói rút được mỗi lần thức dậy (fast mode)",
+                          buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+# Log từng gói (--log on): qua queue của common.log, tối đa LOG_RATE record/giây
+MSG = log.sampled("udp-ping.msg")
+
+
+class ClientStats:
+    __slots__ = ("packets", "last_seq", "max_seq", "lost", "reordered", "duplicates")
+
+    def __init__(self):
+        self.packets = 0
+        self.last_seq = -1
+        self.max_seq = -1
+        self.lost = 0
+        self.reordered = 0
+        self.duplicates = 0
+
+    def observe(self, seq: int):
+        self.packets += 1
+        if seq < 0:
+            return
+        if self.max_seq < 0 or seq > self.max_seq:
+            if self.max_seq >= 0 and seq > self.max_seq + 1:
+                self.lost += seq - self.max_seq - 1
+            self.max_seq = seq
+        elif seq == self.last_seq or seq == self.max_seq:
+            self.duplicates += 1
+        else:
+            # Gói đến muộn: lúc trước đã tính là mất
+            self.reordered += 1
+            if self.lost:
+                self.lost -= 1
+        self.last_seq = seq
+
+    def to_dict(self) -> dict:
+        return {
+            "packets": self.packets,
+            "last_seq": self.last_seq,
+            "lost": self.lost,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+        }
+
+
+class ClientTable:
+    """Bảng thống kê theo client, tối đa MAX_CLIENTS dòng (đầy -> bỏ client cũ nhất)."""
+
+    def __init__(self, max_clients: int = MAX_CLIENTS):
+        self.max_clients = max_clients
+        self.rows = {}
+        self.evicted = 0
+
+    def get(self, addr) -> ClientStats:
+        row = self.rows.get(addr)
+        if row is None:
+            if len(self.rows) >= self.max_clients:
+                del self.rows[next(iter(self.rows))]
+                self.evicted += 1
+            row = self.rows[addr] = ClientStats()
+        return row
+
+
+def parse_text_seq(data) -> int:
+    """Lấy N trong '... seq=N ...', -1 nếu không có."""
+    i = data.find(b"seq=")
+    if i < 0:
+        return -1
+    i += 4
+    j = i
+    while j < len(data) and 48 <= data[j] <= 57:
+        j += 1
+    return int(data[i:j]) if j > i else -1
+
+
+def build_reply(data: bytes, recv_time: float) -> tuple:
+    """-> (reply bytes, seq). Không decode/encode chuỗi."""
+    if len(data) >= BIN_PING.size and data[:4] == PING_MAGIC:
+        _magic, seq, client_ns = BIN_PING.unpack_from(data)
+        return BIN_PONG.pack(PONG_MAGIC, seq, client_ns, time.time_ns()), seq
+
+    msg = data.strip()
+    ts = repr(recv_time).encode()
+    if msg[:4].lower() == b"ping":
+        return b"PONG " + msg + b" server_time=" + ts, parse_text_seq(msg)
+    return b"UNKNOWN '" + msg + b"' server_time=" + ts, -1
+
+
+def stats_snapshot(tables, totals, top: int = 50) -> dict:
+    rows = []
+    for t in tables:
+        rows.extend(t.rows.items())
+    rows.sort(key=lambda kv: kv[1].packets, reverse=True)
+    return {
+        "packets": sum(totals),
+        "clients": len(rows),
+        "evicted": sum(t.evicted for t in tables),
+        "top": [dict(addr=f"{a[0]}:{a[1]}", **s.to_dict()) for a, s in rows[:top]],
+    }
+
+
+def stats_reply(addr, tables, totals):
+    """JSON thống kê cho STATS, None nếu addr không được phép (trả lời như gói thường)."""
+    if addr[0] not in STATS_ALLOW:
+        return None
+    top = 50
+    while True:
+        # Bớt số dòng "top" cho tới khi vừa 1 datagram, không cắt ngang JSON
+        reply = json.dumps(stats_snapshot(tables, totals, top=top)).encode()
+        if len(reply) <= MAX_STATS_REPLY or top == 0:
+            return reply
+        top //= 2
+
+
+def fast_worker(sock: socket.socket, table: ClientTable, totals: list, idx: int,
+                tables, log: bool):
+    buf = bytearray(RECV_BUF)
+    mv = memoryview(buf)
+    recv_into = sock.recvfrom_into
+    sendto = sock.sendto
+    get_stats = table.get
+
+    while True:
+        # Chờ gói đầu tiên (blocking), sau đó rút hết gói đang chờ trong kernel
+        try:
+            n, addr = recv_into(buf)
+        except OSError:
+            # vd. ICMP port unreachable từ lần sendto trước: đếm rồi đọc tiếp, không giết worker
+            RECV_ERRORS.inc()
+            continue
+        batch = 0
+        nbytes = sent = 0
+        while True:
+            nbytes += n
+            recv_time = time.time()
+            data = bytes(mv[:n])
+            try:
+                reply = stats_reply(addr, tables, totals) if data[:5] == b"STATS" else None
+                if reply is None:
+                    reply, seq = build_reply(data, recv_time)
+                    get_stats(addr).observe(seq)
+            except (ValueError, struct.error):
+                # 1 gói hỏng chỉ mất gói đó, phần còn lại của lô vẫn được trả lời
+                BAD_PACKETS.inc()
+                reply = None
+            if reply is not None:
+                try:
+                    sent += sendto(reply, addr)
+                except OSError:
+                    SEND_ERRORS.inc()
+                if log:
+                    MSG.info("📩 [RECV] %s: %r -> %r", addr, data.strip(), reply[:80])
+
+            batch += 1
+            if batch >= MAX_BATCH:
+                break
+            try:
+                n, addr = recv_into(buf, 0, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                RECV_ERRORS.inc()
+                break
+        totals[idx] += batch
+        PACKETS.inc(batch)
+        BYTES_IN.inc(nbytes)
+        BYTES_OUT.inc(sent)
+        BATCH.observe(batch)
 
-def main():
-    print("🚀 Starting UDP Ping Server...")
-    print(f"📡 Listening on {HOST}:{PORT}")
 
+def make_socket(reuse_port: bool) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+    except OSError:
+        pass
+    sock.bind((HOST, PORT))
+    return sock
+
+
+def serve_fast(workers: int, log: bool):
+    print(f"⚡ Fast mode: {workers} SO_REUSEPORT socket(s), log={'on' if log else 'off'}")
+    tables = [ClientTable(max(1, MAX_CLIENTS // workers)) for _ in range(workers)]
+    totals = [0] * workers
+    socks = []
+    for i in range(workers):
+        sock = make_socket(reuse_port=workers > 1)
+        socks.append(sock)
+        threading.Thread(
+            target=fast_worker, args=(sock, tables[i], totals, i, tables, log), daemon=True
+        ).start()
+
+    try:
+        last_total, last_t = 0, time.monotonic()
+        while True:
+            time.sleep(REPORT_INTERVAL)
+            now = time.monotonic()
+            snap = stats_snapshot(tables, totals, top=5)
+            rate = (snap["packets"] - last_total) / max(now - last_t, 1e-9)
+            last_total, last_t = snap["packets"], now
+            print(f"📊 [STATS] packets={snap['packets']} rate={rate:.0f}/s clients={snap['clients']}")
+            for row in snap["top"]:
+                print(f"   {row['addr']}: pkts={row['packets']} last_seq={row['last_seq']} "
+                      f"lost={row['lost']} reordered={row['reordered']} dup={row['duplicates']}")
+    finally:
+        for sock in socks:
+            sock.close()
+
+
+def serve_simple(log: bool):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((HOST, PORT))
 
@@ -15,9 +262,17 @@ def main():
         while True:
             data, addr = sock.recvfrom(4096)
             recv_time = time.time()
+            PACKETS.inc()
+            BYTES_IN.inc(len(data))
+
+            if data[:4] == PING_MAGIC:
+                # ping nhị phân (client.py --measure)
+                BYTES_OUT.inc(sock.sendto(build_reply(data, recv_time)[0], addr))
+                continue
 
             msg = data.decode("utf-8", errors="ignore").strip()
-            print(f"📩 [RECV] {addr}: {msg}")
+            if log:
+                MSG.info("📩 [RECV] %s: %s", addr, msg)
 
             # client có thể gửi "quit" nhưng UDP server vẫn chạy (stateless)
             if msg.lower().startswith("ping"):
@@ -26,13 +281,82 @@ def main():
             else:
                 reply = f"UNKNOWN '{msg}' server_time={recv_time}"
 
-            sock.sendto(reply.encode("utf-8"), addr)
-            print(f"📤 [SEND] {addr}: {reply}")
+            BYTES_OUT.inc(sock.sendto(reply.encode("utf-8"), addr))
+            if log:
+                MSG.info("📤 [SEND] %s: %s", addr, reply)
+    finally:
+        sock.close()
+
+
+class PingHandler(runtime.DatagramHandler):
+    """Chế độ async: mỗi worker 1 event loop, bảng thống kê riêng."""
 
+    def __init__(self, log: bool):
+        self.log = log
+        self.table = ClientTable()
+        self.totals = [0]
+
+    def datagram_received(self, data: bytes, addr, transport):
+        recv_time = time.time()
+        PACKETS.inc()
+        BYTES_IN.inc(len(data))
+        self.totals[0] += 1
+        reply = stats_reply(addr, [self.table], self.totals) if data[:5] == b"STATS" else None
+        if reply is None:
+            reply, seq = build_reply(data, recv_time)
+            self.table.get(addr).observe(seq)
+        # sendto của transport không chặn: socket đầy thì asyncio tự xếp hàng
+        transport.sendto(reply, addr)
+        BYTES_OUT.inc(len(reply))
+        if self.log:
+            MSG.info("📩 [RECV] %s: %r -> %r", addr, data.strip(), reply[:80])
+
+    def error_received(self, exc: OSError):
+        SEND_ERRORS.inc()
+
+
+def serve_async(workers: int, log: bool):
+    print(f"⚡ Async mode: {workers} worker(s), log={'on' if log else 'off'}")
+    server = runtime.Server()
+    server.add_udp(PingHandler(log), PORT, HOST, name="udp-ping", rcvbuf=RCVBUF)
+    runtime.serve(server, workers=workers)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="UDP ping server")
+    p.add_argument("--mode", choices=("simple", "fast", "async"), default=UDP_MODE,
+                   help="simple = 1 socket, fast = SO_REUSEPORT + thread, async = common.runtime")
+    p.add_argument("--fast", dest="mode", action="store_const", const="fast",
+                   help="chế độ tải cao: SO_REUSEPORT + recvfrom_into theo lô + thống kê theo client")
+    p.add_argument("--workers", type=int, default=WORKERS,
+                   help="số socket/thread ở fast mode, số process ở async mode")
+    p.add_argument("--log", choices=("on", "off"), default=None, help="log từng gói")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.log:
+        log = args.log == "on"
+    elif LOG_PACKETS:
+        log = LOG_PACKETS == "1"
+    else:
+        log = args.mode == "simple"
+
+    print("🚀 Starting UDP Ping Server...")
+    print(f"📡 Listening on {HOST}:{PORT}")
+    if args.mode == "async":
+        serve_async(max(1, args.workers), log)  # runtime tự bật exporter /metrics
+        return
+    metrics.start_from_env()
+
+    try:
+        if args.mode == "fast":
+            serve_fast(max(1, args.workers), log)
+        else:
+            serve_simple(log)
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by Ctrl+C")
-    finally:
-        sock.close()
 
 if __name__ == "__main__":
     main()
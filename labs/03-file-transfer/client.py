@@ -1,85 +1,262 @@
+import argparse
+import hashlib
 import os
+import queue
 import socket
 import sys
+import threading
 import time
+import zlib
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.framing import SocketReader
+from protocol import missing_ranges, pack_v2_header, parse_ranges
+
 SERVER_HOST = "127.0.0.1"
 SERVER_PORT = 9003
 
 BUFFER_SIZE = 64 * 1024  
+SENDFILE_CHUNK = 8 * 1024 * 1024  # mỗi lần sendfile, đủ nhỏ để in progress
+CHUNK_SIZE = 4 * 1024 * 1024  # chunk của giao thức chunked
+CHUNK_RETRIES = 3
+
+def read_line(reader: SocketReader) -> str:
+    return reader.readline().decode("utf-8", errors="ignore").strip()
+
+class Progress:
+    def __init__(self, total: int):
+        self.total = total
+        self.start = time.time()
+        self.last_print = self.start
 
-def recv_line(sock: socket.socket) -> str:
-    data = b""
+    def __call__(self, sent: int):
+        now = time.time()
+        if now - self.last_print >= 0.5:
+            pct = sent * 100 / self.total if self.total else 100
+            speed = sent / max(now - self.start, 1e-6) / 1024  # KB/s
+            print(f"⏳ Upload: {sent}/{self.total} ({pct:.1f}%) | {speed:.1f} KB/s")
+            self.last_print = now
+
+def send_copy(sock: socket.socket, f, total: int, progress, sent: int = 0) -> int:
     while True:
-        ch = sock.recv(1)
-        if not ch:
-            raise ConnectionError("Server disconnected while reading line.")
-        if ch == b"\n":
+        chunk = f.read(BUFFER_SIZE)
+        if not chunk:
             break
-        data += ch
-        if len(data) > 10_000:
-            raise ValueError("Line too long")
-    return data.decode("utf-8", errors="ignore").strip()
+        sock.sendall(chunk)
+        sent += len(chunk)
+        progress(sent)
+    return sent
+
+def send_zero_copy(sock: socket.socket, f, total: int, progress, sent: int = 0) -> int:
+    """socket.sendfile -> os.sendfile: kernel đọc file và gửi thẳng, không qua Python."""
+    while sent < total:
+        n = sock.sendfile(f, offset=sent, count=min(SENDFILE_CHUNK, total - sent))
+        if not n:
+            raise ConnectionError("sendfile sent 0 bytes (file truncated?)")
+        sent += n
+        progress(sent)
+    return sent
+
+def open_session(host: str, port: int) -> tuple:
+    sock = socket.create_connection((host, port))
+    reader = SocketReader(sock)
+    ready = read_line(reader)
+    if ready != "READY":
+        sock.close()
+        raise ConnectionError(f"Server not ready: {ready}")
+    return sock, reader
+
+def command(sock: socket.socket, reader: SocketReader, line: str) -> str:
+    sock.sendall((line + "\n").encode("utf-8"))
+    return read_line(reader)
+
+class ChunkSender(threading.Thread):
+    """1 kết nối, lấy chunk từ hàng đợi chung và gửi cho tới khi hết."""
+
+    def __init__(self, args, upload_id: str, fd: int, jobs: queue.Queue, progress, state):
+        super().__init__(daemon=True)
+        self.args = args
+        self.upload_id = upload_id
+        self.fd = fd
+        self.jobs = jobs
+        self.progress = progress
+        self.state = state
+
+    def run(self):
+        job = None
+        try:
+            sock, reader = open_session(self.args.host, self.args.port)
+        except OSError as e:
+            print(f"⚠️ Connection failed: {e}")
+            return
+
+        try:
+            while True:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    return
+                offset, length, attempt = job
+                data = os.pread(self.fd, length, offset)
+                header = f"CHUNK {self.upload_id} {offset} {length} {zlib.crc32(data):08x}\n"
+                sock.sendall(header.encode("utf-8"))
+                sock.sendall(data)
+
+                reply = read_line(reader)
+                if reply.startswith("ACK"):
+                    self.state.add(length)
+                    self.progress(self.state.sent)
+                elif reply.startswith("BAD") and attempt < CHUNK_RETRIES:
+                    self.jobs.put((offset, length, attempt + 1))
+                else:
+                    raise ConnectionError(f"Chunk {offset} rejected: {reply}")
+                job = None
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Connection lost: {e}")
+            if job is not None:
+                self.jobs.put(job)  # kết nối khác (nếu còn) sẽ gửi lại
+        finally:
+            sock.close()
+
+class SentCounter:
+    def __init__(self, sent: int = 0):
+        self.lock = threading.Lock()
+        self.sent = sent
+
+    def add(self, n: int):
+        with self.lock:
+            self.sent += n
+
+def chunked_upload(args, file_path: Path, filename: str, total_size: int):
+    """Upload resume được: INIT -> RANGES -> N kết nối gửi CHUNK -> COMMIT."""
+    st = file_path.stat()
+    upload_id = hashlib.sha1(f"{filename}:{total_size}:{st.st_mtime_ns}".encode()).hexdigest()[:32]
+
+    sock, reader = open_session(args.host, args.port)
+    try:
+        reply = command(sock, reader, f"INIT {upload_id} {total_size} {filename}")
+        if not reply.startswith("UPLOAD"):
+            print("❌ Server refused:", reply)
+            return
+        reply = command(sock, reader, f"RANGES {upload_id}")
+        if not reply.startswith("RANGES"):
+            print("❌ Server refused:", reply)
+            return
+        have = parse_ranges(reply.split(" ", 3)[3])
+    finally:
+        sock.close()
+
+    missing = missing_ranges(have, total_size)
+    already = total_size - sum(b - a for a, b in missing)
+    if already:
+        print(f"↩️ Resuming upload {upload_id}: {already} bytes already on server")
+
+    jobs = queue.Queue()
+    for a, b in missing:
+        for off in range(a, b, args.chunk_size):
+            jobs.put((off, min(args.chunk_size, b - off), 0))
+
+    progress = Progress(total_size)
+    state = SentCounter(already)
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        workers = [ChunkSender(args, upload_id, fd, jobs, progress, state)
+                   for _ in range(max(1, min(args.parallel, jobs.qsize())))]
+        print(f"🚀 {jobs.qsize()} chunk(s) over {len(workers)} connection(s)")
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    finally:
+        os.close(fd)
+
+    sock, reader = open_session(args.host, args.port)
+    try:
+        done = command(sock, reader, f"COMMIT {upload_id}")
+    finally:
+        sock.close()
+    end = time.time()
+
+    sent = state.sent - already
+    if done.startswith("DONE"):
+        avg_speed = sent / max(end - progress.start, 1e-6) / 1024
+        print(f"\n✅ Upload finished! Sent {sent} bytes -> {done[5:]}")
+        print(f"⏱️ Time: {(end - progress.start):.2f}s | Avg: {avg_speed:.1f} KB/s")
+    else:
+        print(f"\n❌ Upload incomplete ({done}). Run again to resume.")
+
+def parse_args():
+    p = argparse.ArgumentParser(description="TCP file upload client")
+    p.add_argument("file", help="file cần upload")
+    p.add_argument("--host", default=SERVER_HOST)
+    p.add_argument("--port", type=int, default=SERVER_PORT)
+    p.add_argument("--proto", type=int, choices=(1, 2, 3), default=2,
+                   help="1 = header text READY/OK, 2 = header nhị phân gửi cùng dữ liệu (mặc định), "
+                        "3 = chunked, resume được")
+    p.add_argument("--parallel", type=int, default=1,
+                   help="số kết nối song song (>1 => dùng giao thức chunked)")
+    p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="kích thước chunk (chunked)")
+    p.add_argument("--no-sendfile", action="store_true",
+                   help="đọc file vào Python rồi sendall (cách cũ) thay vì sendfile")
+    return p.parse_args()
 
 def main():
     print("🧑‍💻 TCP File Upload Client")
+    args = parse_args()
 
-    if len(sys.argv) < 2:
-        print("Usage:")
-        print("  python client.py <path_to_file>")
-        sys.exit(1)
-
-    file_path = Path(sys.argv[1]).expanduser().resolve()
+    file_path = Path(args.file).expanduser().resolve()
     if not file_path.exists() or not file_path.is_file():
         print("❌ File not found:", file_path)
-        sys.exit(1)
+        raise SystemExit(1)
 
     filename = file_path.name
     total_size = file_path.stat().st_size
 
-    print(f"➡️ Server: {SERVER_HOST}:{SERVER_PORT}")
+    print(f"➡️ Server: {args.host}:{args.port}")
     print(f"📄 File: {filename}")
     print(f"📦 Size: {total_size} bytes\n")
 
+    if args.proto == 3 or args.parallel > 1:
+        chunked_upload(args, file_path, filename, total_size)
+        return
+
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((SERVER_HOST, SERVER_PORT))
+    sock.connect((args.host, args.port))
+
+    reader = SocketReader(sock)
+    send = send_copy if args.no_sendfile else send_zero_copy
 
     try:
-        # handshake
-        ready = recv_line(sock)
-        if ready != "READY":
-            print("❌ Server not ready:", ready)
-            return
+        if args.proto == 1:
+            # handshake
+            ready = read_line(reader)
+            if ready != "READY":
+                print("❌ Server not ready:", ready)
+                return
 
-        sock.sendall(f"FILENAME:{filename}\n".encode("utf-8"))
-        sock.sendall(f"SIZE:{total_size}\n".encode("utf-8"))
+            sock.sendall(f"FILENAME:{filename}\nSIZE:{total_size}\n".encode("utf-8"))
 
-        ok = recv_line(sock)
-        if ok != "OK":
-            print("❌ Server refused:", ok)
-            return
+            ok = read_line(reader)
+            if ok != "OK":
+                print("❌ Server refused:", ok)
+                return
 
-        sent = 0
-        start = time.time()
-        last_print = time.time()
+            progress = Progress(total_size)
+            with open(file_path, "rb") as f:
+                sent = send(sock, f, total_size, progress)
+        else:
+            # header + chunk đầu trong 1 lần ghi, không chờ READY/OK
+            progress = Progress(total_size)
+            with open(file_path, "rb") as f:
+                first = f.read(BUFFER_SIZE)
+                sock.sendall(pack_v2_header(filename, total_size) + first)
+                sent = send(sock, f, total_size, progress, len(first))
 
-        with open(file_path, "rb") as f:
-            while True:
-                chunk = f.read(BUFFER_SIZE)
-                if not chunk:
-                    break
-                sock.sendall(chunk)
-                sent += len(chunk)
-
-                now = time.time()
-                if now - last_print >= 0.5:
-                    pct = sent * 100 / total_size if total_size else 100
-                    speed = sent / max(now - start, 1e-6) / 1024  # KB/s
-                    print(f"⏳ Upload: {sent}/{total_size} ({pct:.1f}%) | {speed:.1f} KB/s")
-                    last_print = now
-
-        done = recv_line(sock)
+        start = progress.start
+        done = read_line(reader)
+        if done == "READY":
+            done = read_line(reader)
         end = time.time()
 
         if done == "DONE":
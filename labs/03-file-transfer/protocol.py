@@ -0,0 +1,92 @@
+"""Header upload dùng chung cho client.py và server.py.
+
+v1 (text, lockstep):
+    S: READY          C: FILENAME:<name> / SIZE:<bytes>
+    S: OK             C: <data>            S: DONE
+
+v2 (nhị phân, không chờ): client gửi ngay header + chunk dữ liệu đầu trong
+1 lần ghi, server trả DONE khi nhận đủ (READY server gửi lúc kết nối được
+client bỏ qua).
+    magic "FTv2" | name_len u16 | size u64 | name (utf-8) | <data>
+
+Chunked (resume được, nhiều kết nối song song cho cùng 1 upload): sau READY
+client gửi các lệnh dạng dòng, mỗi lệnh 1 dòng trả lời.
+    INIT <id> <size> <name>                 -> UPLOAD <id>
+    CHUNK <id> <offset> <len> <crc32 hex>   + <len> byte  -> ACK <offset> <len> | BAD <offset>
+    RANGES <id>                             -> RANGES <id> <size> <a-b,c-d | ->
+    COMMIT <id>                             -> DONE <file> | MISSING <a-b,...>
+Khoảng a-b là [a, b) tính theo byte.
+"""
+
+import struct
+
+V2_MAGIC = b"FTv2"
+V2_HEADER = struct.Struct("!4sHQ")
+MAX_NAME = 1024
+
+
+def pack_v2_header(name: str, size: int) -> bytes:
+    raw = name.encode("utf-8")[:MAX_NAME]
+    return V2_HEADER.pack(V2_MAGIC, len(raw), size) + raw
+
+
+def unpack_v2_header(raw: bytes) -> tuple:
+    """V2_HEADER.size byte đầu -> (name_len, size)."""
+    magic, name_len, size = V2_HEADER.unpack(raw)
+    if magic != V2_MAGIC:
+        raise ValueError("Invalid v2 header")
+    if name_len > MAX_NAME:
+        raise ValueError("File name too long")
+    return name_len, size
+
+
+def read_v2_header(reader) -> tuple:
+    """reader: common.framing.SocketReader -> (name, size)."""
+    name_len, size = unpack_v2_header(reader.readexactly(V2_HEADER.size))
+    name = reader.readexactly(name_len).decode("utf-8", errors="ignore")
+    return name, size
+
+
+CHUNKED_COMMANDS = ("INIT", "CHUNK", "RANGES", "COMMIT")
+MAX_CHUNK = 64 * 1024 * 1024
+
+
+def merge_range(ranges: list, start: int, end: int) -> list:
+    """Thêm [start, end) vào list khoảng đã sắp xếp, gộp các khoảng chồng/kề nhau."""
+    out = []
+    placed = False
+    for a, b in ranges:
+        if b < start:
+            out.append([a, b])
+        elif end < a:
+            if not placed:
+                out.append([start, end])
+                placed = True
+            out.append([a, b])
+        else:
+            start, end = min(a, start), max(b, end)
+    if not placed:
+        out.append([start, end])
+    return out
+
+
+def missing_ranges(ranges: list, size: int) -> list:
+    out = []
+    pos = 0
+    for a, b in ranges:
+        if a > pos:
+            out.append([pos, a])
+        pos = max(pos, b)
+    if pos < size:
+        out.append([pos, size])
+    return out
+
+
+def format_ranges(ranges: list) -> str:
+    return ",".join(f"{a}-{b}" for a, b in ranges) or "-"
+
+
+def parse_ranges(text: str) -> list:
+    if text in ("", "-"):
+        return []
+    return [[int(a), int(b)] for a, b in (part.split("-") for part in text.split(","))]
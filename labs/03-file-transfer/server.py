@@ -1,50 +1,481 @@
+import asyncio
+import json
 import os
+import re
+import select
 import socket
+import sys
 import threading
 import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import admission, log, metrics, runtime
+from common.framing import SocketReader
+from protocol import (
+    CHUNKED_COMMANDS, MAX_CHUNK, V2_HEADER, V2_MAGIC, format_ranges, merge_range,
+    missing_ranges, read_v2_header, unpack_v2_header,
+)
+
 HOST = "0.0.0.0"
 PORT = 9003
 
 BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = BASE_DIR / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+PARTIAL_DIR = UPLOAD_DIR / ".partial"
+PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
 
 BUFFER_SIZE = 64 * 1024  
+IDLE_TIMEOUT = 300
 
-def recv_line(conn: socket.socket) -> str:
-    """Read until '\n'."""
-    data = b""
-    while True:
-        ch = conn.recv(1)
-        if not ch:
-            raise ConnectionError("Client disconnected while reading line.")
-        if ch == b"\n":
-            break
-        data += ch
-        if len(data) > 10_000:
-            raise ValueError("Header line too long")
-    return data.decode("utf-8", errors="ignore").strip()
+# splice(): socket -> pipe -> file ngay trong kernel (Linux), không copy qua Python
+USE_SPLICE = hasattr(os, "splice") and os.getenv("FT_SPLICE", "1") == "1"
+SPLICE_CHUNK = 1024 * 1024
+
+MAX_HEADER_LINE = 10_000
+
+# thread = 1 thread / upload (mặc định), async = common.runtime + ghi đĩa qua thread pool
+FT_MODE = os.getenv("FT_MODE", "thread").lower()
+# async: số thread ghi đĩa, cỡ 1 buffer đọc socket / ghi file
+DISK_THREADS = int(os.getenv("FT_DISK_THREADS", "4"))
+WRITE_CHUNK = int(os.getenv("FT_WRITE_CHUNK", str(1024 * 1024)))
+# async: byte đã đọc nhưng chưa ghi xong, theo từng upload (= WRITE_CHUNK: double buffer,
+# 1 buffer đang ghi trong lúc đọc buffer kế) và tổng cả server; hết -> ngừng đọc socket.
+# FT_INFLIGHT_BYTES cũng giới hạn tổng thân CHUNK đang nằm trong RAM ở thread mode
+UPLOAD_INFLIGHT = int(os.getenv("FT_UPLOAD_INFLIGHT", str(WRITE_CHUNK)))
+INFLIGHT_BYTES = int(os.getenv("FT_INFLIGHT_BYTES", str(64 * 1024 * 1024)))
+# Giới hạn cho SIZE client khai báo (file được cấp phát trước đúng chừng đó byte)
+MAX_UPLOAD_SIZE = int(os.getenv("FT_MAX_UPLOAD_SIZE", str(16 * 1024 ** 3)))
+# Chunked: số upload giữ fd mở cùng lúc; upload không có CHUNK trong FT_UPLOAD_IDLE giây
+# thì đóng fd (file .part + .json vẫn giữ, lệnh kế tiếp mở lại -> resume được)
+MAX_OPEN_UPLOADS = int(os.getenv("FT_MAX_OPEN_UPLOADS", "256"))
+UPLOAD_IDLE = float(os.getenv("FT_UPLOAD_IDLE", "600"))
+# async: deadline cho mỗi buffer / thân CHUNK (client dừng giữa chừng); chỉ tính thời gian
+# chờ client gửi, không tính lúc đứng chờ FT_INFLIGHT_BYTES hay đĩa chậm
+READ_TIMEOUT = float(os.getenv("FT_READ_TIMEOUT", "60"))
+
+CONNECTIONS = metrics.counter("ft_connections_total", "Kết nối đã accept")
+ACTIVE = metrics.gauge("ft_connections_active", "Kết nối đang mở")
+UPLOADS = metrics.counter("ft_uploads_total", "Upload hoàn tất", protocol="stream")
+CHUNKED_UPLOADS = metrics.counter("ft_uploads_total", protocol="chunked")
+FAILURES = metrics.counter("ft_upload_failures_total", "Kết nối kết thúc bằng lỗi")
+BYTES_IN = metrics.counter("ft_received_bytes_total", "Byte dữ liệu file đã nhận")
+CHUNKS = metrics.counter("ft_chunks_total", "CHUNK đã ghi", result="ack")
+BAD_CHUNKS = metrics.counter("ft_chunks_total", result="bad")
+DURATION = metrics.histogram("ft_upload_duration_seconds", "Thời gian upload (stream)")
+INFLIGHT = metrics.gauge("ft_inflight_bytes", "Byte đã nhận, đang chờ ghi đĩa")
+BACKPRESSURE = metrics.counter("ft_backpressure_waits_total", "Lần phải chờ vì FT_INFLIGHT_BYTES")
+EXPIRED_UPLOADS = metrics.counter("ft_uploads_expired_total", "Upload chunked bị đóng fd vì FT_UPLOAD_IDLE")
+
+LOG = log.get("file-transfer")
+
+# MAX_CONNECTIONS / MAX_PER_IP / ACCEPT_RATE (env): vượt -> BUSY thay cho READY
+ADMISSION = admission.Admission("file-transfer")
+
+def read_line(reader: SocketReader) -> str:
+    return reader.readline().decode("utf-8", errors="ignore").strip()
 
 def safe_filename(name: str) -> str:
     name = name.replace("\\", "/").split("/")[-1]
     name = "".join(c for c in name if c.isalnum() or c in ("-", "_", ".", " "))
     return name.strip() or f"file_{int(time.time())}"
 
+def unique_path(filename: str) -> Path:
+    save_path = UPLOAD_DIR / filename
+    # Nếu trùng tên -> thêm timestamp
+    if save_path.exists():
+        stem = save_path.stem
+        suffix = save_path.suffix
+        save_path = UPLOAD_DIR / f"{stem}_{int(time.time())}{suffix}"
+    return save_path
+
+def check_upload_size(size: int):
+    if size < 0:
+        raise ValueError("Invalid SIZE")
+    if size > MAX_UPLOAD_SIZE:
+        raise ValueError(f"File larger than {MAX_UPLOAD_SIZE} bytes")
+
+def preallocate(fd: int, size: int):
+    if size <= 0:
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)
+
+UPLOAD_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class ChunkedUpload:
+    """1 upload chia chunk: file .part cấp phát trước + danh sách khoảng đã nhận.
+
+    Danh sách khoảng được lưu ra <id>.json sau mỗi chunk, nên server khởi động
+    lại (hoặc client mất kết nối) vẫn tiếp tục được từ chỗ đã dừng.
+    """
+
+    def __init__(self, upload_id: str, name: str, size: int):
+        self.upload_id = upload_id
+        self.name = name
+        self.size = size
+        self.part_path = PARTIAL_DIR / f"{upload_id}.part"
+        self.meta_path = PARTIAL_DIR / f"{upload_id}.json"
+        self.lock = threading.Lock()
+        self.ranges = []
+        self.committed = False
+        # Số write_chunk đang chạy + lần dùng cuối: giữ / đổi dưới UploadRegistry.lock
+        self.users = 0
+        self.last_used = time.monotonic()
+
+        if self.meta_path.exists() and self.part_path.exists():
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            if meta.get("size") == size:
+                self.ranges = meta.get("ranges") or []
+
+        self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not self.ranges:
+            # .part sót lại không có .json khớp: cắt đúng size, nếu không phần đuôi cũ
+            # (file cũ dài hơn) sẽ nằm luôn trong file sau COMMIT
+            os.ftruncate(self.fd, size)
+            preallocate(self.fd, size)
+
+    @property
+    def received(self) -> int:
+        return sum(b - a for a, b in self.ranges)
+
+    def _save_meta(self):
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"name": self.name, "size": self.size, "ranges": self.ranges}),
+                       encoding="utf-8")
+        os.replace(tmp, self.meta_path)
+
+    def write_chunk(self, offset: int, data: bytes):
+        view = memoryview(data)
+        pos = 0
+        while pos < len(data):
+            pos += os.pwrite(self.fd, view[pos:], offset + pos)
+        with self.lock:
+            self.ranges = merge_range(self.ranges, offset, offset + len(data))
+            if not self.committed:  # CHUNK trùng chạy sau COMMIT: không tạo lại .json
+                self._save_meta()
+
+    def missing(self) -> list:
+        with self.lock:
+            return missing_ranges(self.ranges, self.size)
+
+    def close(self):
+        os.close(self.fd)
+
+class UploadRegistry:
+    """Các upload chunked đang mở, dùng chung giữa mọi kết nối.
+
+    fd chỉ được đóng khi không còn write_chunk nào dùng (users == 0): COMMIT
+    chạy song song với 1 CHUNK trùng thì kết nối ghi sau cùng đóng fd.
+    """
+
+    def __init__(self, max_open: int = MAX_OPEN_UPLOADS, idle: float = UPLOAD_IDLE):
+        self.lock = threading.Lock()
+        self.uploads = {}
+        self.max_open = max_open
+        self.idle = idle
+
+    def _add(self, upload_id: str, name: str, size: int) -> ChunkedUpload:
+        if len(self.uploads) >= self.max_open:
+            self._expire(time.monotonic() - self.idle)
+            if len(self.uploads) >= self.max_open:
+                raise ValueError("Too many open uploads")
+        up = self.uploads[upload_id] = ChunkedUpload(upload_id, name, size)
+        return up
+
+    def _lookup(self, upload_id: str):
+        """Upload đang mở, hoặc mở lại từ .json nếu đã bị đóng vì idle / server khởi động lại."""
+        up = self.uploads.get(upload_id)
+        if up is not None or not UPLOAD_ID_RE.match(upload_id):
+            return up
+        meta_path = PARTIAL_DIR / f"{upload_id}.json"
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not (PARTIAL_DIR / f"{upload_id}.part").exists():
+            return None
+        return self._add(upload_id, meta.get("name") or upload_id, int(meta.get("size") or 0))
+
+    def open(self, upload_id: str, name: str, size: int) -> ChunkedUpload:
+        with self.lock:
+            up = self._lookup(upload_id)
+            if up is None:
+                up = self._add(upload_id, name, size)
+            elif up.size != size:
+                raise ValueError("Upload size mismatch")
+            up.last_used = time.monotonic()
+            return up
+
+    def get(self, upload_id: str):
+        with self.lock:
+            up = self._lookup(upload_id)
+            if up is not None:
+                up.last_used = time.monotonic()
+            return up
+
+    def acquire(self, upload_id: str):
+        """get() + giữ fd mở tới release() (bao quanh write_chunk)."""
+        with self.lock:
+            up = self._lookup(upload_id)
+            if up is not None:
+                up.users += 1
+            return up
+
+    def release(self, up: ChunkedUpload):
+        with self.lock:
+            up.users -= 1
+            up.last_used = time.monotonic()
+            # Đã COMMIT (hoặc hết hạn) trong lúc đang ghi -> người dùng cuối đóng fd
+            close = up.users == 0 and self.uploads.get(up.upload_id) is not up
+        if close:
+            up.close()
+
+    def commit(self, upload_id: str):
+        """-> (Path đã lưu, []) hoặc (None, các khoảng còn thiếu)."""
+        with self.lock:
+            up = self._lookup(upload_id)
+            if up is None:
+                raise ValueError("Unknown upload id")
+            missing = up.missing()
+            if missing:
+                return None, missing
+            with up.lock:
+                up.committed = True
+            del self.uploads[upload_id]
+            busy = up.users > 0
+            # Đổi tên khi còn giữ lock: lệnh khác không được mở lại .part/.json từ đĩa
+            save_path = unique_path(safe_filename(up.name))
+            os.replace(up.part_path, save_path)
+            up.meta_path.unlink(missing_ok=True)
+
+        if not busy:
+            up.close()
+        return save_path, []
+
+    def _expire(self, cutoff: float) -> int:
+        expired = [up for up in self.uploads.values() if up.users == 0 and up.last_used < cutoff]
+        for up in expired:
+            del self.uploads[up.upload_id]
+            up.close()
+        EXPIRED_UPLOADS.inc(len(expired))
+        return len(expired)
+
+    def sweep(self) -> int:
+        """Đóng fd các upload không được dùng trong `idle` giây (giữ .part + .json)."""
+        with self.lock:
+            return self._expire(time.monotonic() - self.idle)
+
+    def start_sweeper(self):
+        def loop():
+            while True:
+                time.sleep(max(1.0, self.idle / 4))
+                n = self.sweep()
+                if n:
+                    LOG.info("🧹 [CHUNKED] closed %s idle upload(s)", n)
+
+        threading.Thread(target=loop, name="ft-upload-sweeper", daemon=True).start()
+
+_uploads = UploadRegistry()
+
+class Progress:
+    """Log tiến độ upload ~0.5s/lần."""
+
+    def __init__(self, name: str, total: int):
+        self.name = name
+        self.total = total
+        self.last_print = time.time()
+
+    def __call__(self, received: int):
+        now = time.time()
+        if now - self.last_print >= 0.5:
+            pct = received * 100 / self.total if self.total else 100
+            LOG.info("⏳ [PROGRESS] %s: %s/%s (%.1f%%)", self.name, received, self.total, pct)
+            self.last_print = now
+
+def recv_to_file(conn: socket.socket, f, total: int, progress, received: int = 0) -> int:
+    """recv_into 1 buffer dùng lại, ghi thẳng từ memoryview (không tạo bytes mới)."""
+    buf = bytearray(BUFFER_SIZE)
+    mv = memoryview(buf)
+    while received < total:
+        n = conn.recv_into(mv, min(BUFFER_SIZE, total - received))
+        if not n:
+            raise ConnectionError("Client disconnected during file transfer.")
+        f.write(mv[:n])
+        received += n
+        BYTES_IN.inc(n)
+        progress(received)
+    return received
+
+def splice_to_file(conn: socket.socket, f, total: int, progress, received: int = 0) -> int:
+    """socket -> pipe -> file bằng os.splice, dữ liệu không đi qua user space."""
+    f.flush()
+    file_fd = f.fileno()
+    sock_fd = conn.fileno()
+    timeout_ms = int((conn.gettimeout() or IDLE_TIMEOUT) * 1000)
+    poller = select.poll()
+    poller.register(sock_fd, select.POLLIN)
+
+    pipe_r, pipe_w = os.pipe()
+    try:
+        while received < total:
+            try:
+                n = os.splice(sock_fd, pipe_w, min(SPLICE_CHUNK, total - received),
+                              flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+            except BlockingIOError:
+                if not poller.poll(timeout_ms):
+                    raise socket.timeout("timed out")
+                continue
+            if not n:
+                raise ConnectionError("Client disconnected during file transfer.")
+
+            left = n
+            while left:
+                left -= os.splice(pipe_r, file_fd, left, flags=os.SPLICE_F_MOVE)
+            received += n
+            BYTES_IN.inc(n)
+            progress(received)
+        return received
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+
+def parse_command(line: str) -> tuple:
+    """Dòng lệnh chunked -> (cmd, parts, số byte thân CHUNK theo sau dòng lệnh)."""
+    cmd = line.split(" ", 1)[0].upper()
+    # tên file trong INIT có thể chứa dấu cách
+    parts = line.split(" ", 3) if cmd == "INIT" else line.split()
+    if cmd == "CHUNK" and len(parts) == 5:
+        length = int(parts[3])
+        if length < 0 or length > MAX_CHUNK:
+            raise ValueError("Invalid chunk length")
+        return cmd, parts, length
+    return cmd, parts, 0
+
+def run_command(cmd: str, parts: list, addr, line: str, data: bytes = b"") -> bytes:
+    """Thực hiện 1 lệnh chunked -> dòng trả lời (có I/O đĩa: async mode gọi trong DISK_POOL)."""
+    if cmd == "INIT" and len(parts) == 4:
+        upload_id, size, name = parts[1], int(parts[2]), parts[3]
+        if not UPLOAD_ID_RE.match(upload_id):
+            raise ValueError("Invalid INIT")
+        check_upload_size(size)
+        up = _uploads.open(upload_id, name, size)
+        LOG.info("📥 [CHUNKED INIT] %s -> %s %s (%s/%s bytes)", addr, upload_id, name, up.received, size)
+        return f"UPLOAD {upload_id}\n".encode("utf-8")
+
+    if cmd == "CHUNK" and len(parts) == 5:
+        upload_id = parts[1]
+        offset, length, crc = int(parts[2]), int(parts[3]), int(parts[4], 16)
+        up = _uploads.acquire(upload_id)
+        if up is None:
+            return b"ERROR Unknown upload id\n"
+        try:
+            if offset < 0 or offset + length > up.size:
+                BAD_CHUNKS.inc()
+                return f"BAD {offset} range\n".encode("utf-8")
+            if zlib.crc32(data) != crc:
+                BAD_CHUNKS.inc()
+                return f"BAD {offset} checksum\n".encode("utf-8")
+            up.write_chunk(offset, data)
+        finally:
+            _uploads.release(up)
+        CHUNKS.inc()
+        BYTES_IN.inc(length)
+        return f"ACK {offset} {length}\n".encode("utf-8")
+
+    if cmd == "RANGES" and len(parts) == 2:
+        up = _uploads.get(parts[1])
+        if up is None:
+            return b"ERROR Unknown upload id\n"
+        with up.lock:
+            ranges = format_ranges(up.ranges)
+        return f"RANGES {up.upload_id} {up.size} {ranges}\n".encode("utf-8")
+
+    if cmd == "COMMIT" and len(parts) == 2:
+        save_path, missing = _uploads.commit(parts[1])
+        if save_path is None:
+            return f"MISSING {format_ranges(missing)}\n".encode("utf-8")
+        CHUNKED_UPLOADS.inc()
+        LOG.info("✅ [UPLOAD DONE] %s saved (chunked)", save_path.name)
+        return f"DONE {save_path.name}\n".encode("utf-8")
+
+    raise ValueError(f"Invalid command: {line[:40]}")
+
+class ThreadByteBudget:
+    """ByteBudget cho thread mode: thread kết nối chờ (không đọc socket) tới khi đủ chỗ."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, n: int) -> int:
+        n = min(n, self.limit)
+        with self.cond:
+            if self.used + n > self.limit:
+                BACKPRESSURE.inc()
+                self.cond.wait_for(lambda: self.used + n <= self.limit)
+            self.used += n
+        return n
+
+    def release(self, n: int):
+        with self.cond:
+            self.used -= n
+            self.cond.notify_all()
+
+# Thân CHUNK (tới MAX_CHUNK = 64 MB) được đọc hết vào RAM để kiểm crc trước khi ghi
+_chunk_budget = ThreadByteBudget(INFLIGHT_BYTES)
+
+def serve_chunked(conn: socket.socket, reader: SocketReader, addr, line: str):
+    """Vòng lệnh của giao thức chunked (xem protocol.py)."""
+    while True:
+        cmd, parts, body_len = parse_command(line)
+        if not body_len:
+            conn.sendall(run_command(cmd, parts, addr, line))
+        else:
+            reserved = _chunk_budget.acquire(body_len)
+            try:
+                # Không giữ thân chunk trong biến local: hết lệnh là trả lại RAM
+                reply = run_command(cmd, parts, addr, line, reader.readexactly(body_len))
+            finally:
+                _chunk_budget.release(reserved)
+            conn.sendall(reply)
+
+        try:
+            line = read_line(reader)
+        except ConnectionError:
+            return  # client đóng kết nối sau lệnh cuối
+
 def handle_client(conn: socket.socket, addr):
-    print(f"✅ [CONNECT] {addr}")
-    conn.settimeout(300)
+    LOG.info("✅ [CONNECT] %s", addr)
+    conn.settimeout(IDLE_TIMEOUT)
+    CONNECTIONS.inc()
+    ACTIVE.inc()
 
     try:
-        with conn:
-            conn.sendall(b"READY\n")
+        conn.sendall(b"READY\n")
+        reader = SocketReader(conn, BUFFER_SIZE, max_line=MAX_HEADER_LINE)
 
+        # v2: header nhị phân, client không chờ OK (xem protocol.py)
+        version = 2 if reader.peek(len(V2_MAGIC)) == V2_MAGIC else 1
+
+        if version == 2:
+            raw_name, total_size = read_v2_header(reader)
+        else:
             # Header format:
             # FILENAME:<name>\n
             # SIZE:<bytes>\n
-            filename_line = recv_line(conn)
-            size_line = recv_line(conn)
+            filename_line = read_line(reader)
+            if filename_line.split(" ", 1)[0].upper() in CHUNKED_COMMANDS:
+                serve_chunked(conn, reader, addr, filename_line)
+                return
+            size_line = read_line(reader)
 
             if not filename_line.startswith("FILENAME:"):
                 conn.sendall(b"ERROR Invalid header (FILENAME)\n")
@@ -56,66 +487,324 @@ def handle_client(conn: socket.socket, addr):
             raw_name = filename_line.split(":", 1)[1].strip()
             total_size = int(size_line.split(":", 1)[1].strip())
 
-            filename = safe_filename(raw_name)
-            save_path = UPLOAD_DIR / filename
-
-            # Nếu trùng tên -> thêm timestamp
-            if save_path.exists():
-                stem = save_path.stem
-                suffix = save_path.suffix
-                save_path = UPLOAD_DIR / f"{stem}_{int(time.time())}{suffix}"
+        check_upload_size(total_size)
+        save_path = unique_path(safe_filename(raw_name))
 
+        if version == 1:
             conn.sendall(b"OK\n")
-            print(f"📥 [UPLOAD START] {addr} -> {save_path.name} ({total_size} bytes)")
-
-            received = 0
-            with open(save_path, "wb") as f:
-                last_print = time.time()
-                while received < total_size:
-                    chunk = conn.recv(min(BUFFER_SIZE, total_size - received))
-                    if not chunk:
-                        raise ConnectionError("Client disconnected during file transfer.")
-                    f.write(chunk)
-                    received += len(chunk)
-
-                    # progress mỗi ~0.5s
-                    now = time.time()
-                    if now - last_print >= 0.5:
-                        pct = received * 100 / total_size if total_size else 100
-                        print(f"⏳ [PROGRESS] {save_path.name}: {received}/{total_size} ({pct:.1f}%)")
-                        last_print = now
-
-            conn.sendall(b"DONE\n")
-            print(f"✅ [UPLOAD DONE] {save_path.name} saved ({received} bytes)")
+        LOG.info("📥 [UPLOAD START] %s -> %s (%s bytes, v%s)", addr, save_path.name, total_size, version)
+
+        progress = Progress(save_path.name, total_size)
+        started = time.monotonic()
+        with open(save_path, "wb") as f:
+            # Byte dữ liệu đã đến cùng header
+            head = reader.take_buffered(total_size)
+            f.write(head)
+            BYTES_IN.inc(len(head))
+            if USE_SPLICE:
+                received = splice_to_file(conn, f, total_size, progress, len(head))
+            else:
+                received = recv_to_file(conn, f, total_size, progress, len(head))
+
+        conn.sendall(b"DONE\n")
+        UPLOADS.inc()
+        DURATION.observe(time.monotonic() - started)
+        LOG.info("✅ [UPLOAD DONE] %s saved (%s bytes)", save_path.name, received)
 
     except Exception as e:
-        print(f"❌ [ERROR] {addr}: {e}")
+        FAILURES.inc()
+        LOG.error("❌ [ERROR] %s: %s", addr, e)
         try:
             conn.sendall(f"ERROR {e}\n".encode("utf-8", errors="ignore"))
         except:
             pass
     finally:
+        ACTIVE.dec()
+        ADMISSION.release(addr)
         try:
             conn.close()
         except:
             pass
 
+# ---------- async mode ----------
+def pwrite_all(fd: int, data: bytes, offset: int):
+    view = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        pos += os.pwrite(fd, view[pos:], offset + pos)
+
+def open_upload(path: Path, size: int) -> int:
+    """Tạo file đích và cấp phát trước SIZE byte (1 extent liền, hết chỗ thì báo ngay)."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        preallocate(fd, size)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+def close_upload(fd: int, truncate: int = None):
+    try:
+        if truncate is not None:
+            os.ftruncate(fd, truncate)  # upload lỗi: bỏ phần đã cấp phát mà chưa ghi
+    finally:
+        os.close(fd)
+
+class ByteBudget:
+    """Tổng byte đang nằm trong RAM chờ ghi đĩa (mọi upload). Chỉ dùng trong event loop."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.waiters = deque()
+
+    async def acquire(self, n: int) -> int:
+        """Giữ chỗ n byte (tối đa = limit) trước khi đọc socket -> số byte đã giữ."""
+        n = min(n, self.limit)
+        if self.used + n > self.limit:
+            BACKPRESSURE.inc()
+            loop = asyncio.get_running_loop()
+            while self.used + n > self.limit:
+                fut = loop.create_future()
+                self.waiters.append(fut)
+                try:
+                    await fut
+                finally:
+                    if not fut.done():
+                        fut.cancel()
+        self.used += n
+        return n
+
+    def release(self, n: int):
+        self.used -= n
+        while self.waiters:
+            fut = self.waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+
+class DiskWriter:
+    """Ghi 1 file qua DISK_POOL, không chặn event loop.
+
+    Tối đa `limit` byte đang chờ ghi; đọc buffer kế tiếp trong lúc buffer trước
+    đang được ghi. Mỗi buffer trả lại phần giữ chỗ trong ByteBudget khi ghi xong.
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor, budget: ByteBudget, fd: int, limit: int = UPLOAD_INFLIGHT):
+        self.pool = pool
+        self.budget = budget
+        self.fd = fd
+        self.limit = limit
+        self.loop = asyncio.get_running_loop()
+        self.pending = deque()  # (future, nbytes) theo thứ tự gửi
+        self.inflight = 0
+
+    async def write(self, data: bytes, offset: int, reserved: int):
+        try:
+            while self.pending and self.inflight + len(data) > self.limit:
+                await self._wait_oldest()
+        except BaseException:
+            self.budget.release(reserved)  # lệnh ghi trước lỗi (ENOSPC...) / bị huỷ
+            raise
+        fut = self.loop.run_in_executor(self.pool, pwrite_all, self.fd, data, offset)
+        fut.add_done_callback(lambda _f: self.budget.release(reserved))
+        self.pending.append((fut, len(data)))
+        self.inflight += len(data)
+
+    async def _wait_oldest(self):
+        fut, n = self.pending[0]
+        # shield: task bị huỷ (timeout) không huỷ lệnh ghi đang chạy trên fd
+        await asyncio.shield(fut)
+        self.pending.popleft()
+        self.inflight -= n
+
+    async def flush(self):
+        while self.pending:
+            await self._wait_oldest()
+
+    def close(self, truncate: int = None):
+        """Đóng fd khi mọi lệnh ghi đã xong (kể cả lúc kết nối bị huỷ giữa chừng)."""
+        futures = [f for f, _n in self.pending]
+        self.pending.clear()
+
+        def _close(_f=None):
+            self.pool.submit(close_upload, self.fd, truncate)
+
+        if futures:
+            asyncio.gather(*futures, return_exceptions=True).add_done_callback(_close)
+        else:
+            _close()
+
+class AsyncFileTransfer(runtime.StreamHandler):
+    """Cùng giao thức v1 / v2 / chunked; socket trên event loop, đĩa trên DISK_POOL."""
+
+    def __init__(self, disk_threads: int = DISK_THREADS, inflight: int = INFLIGHT_BYTES):
+        self.pool = ThreadPoolExecutor(disk_threads, thread_name_prefix="ft-disk")
+        self.budget = ByteBudget(inflight)
+        INFLIGHT.fn = lambda: self.budget.used
+
+    async def handle(self, conn: runtime.Connection):
+        LOG.info("✅ [CONNECT] %s", conn.addr)
+        CONNECTIONS.inc()
+        ACTIVE.inc()
+        try:
+            await self._serve(conn)
+        except Exception as e:
+            FAILURES.inc()
+            LOG.error("❌ [ERROR] %s: %s", conn.addr, e)
+            conn.write(f"ERROR {e}\n".encode("utf-8", errors="ignore"))
+
+    def closed(self, conn: runtime.Connection, reason: str, exc: BaseException = None):
+        ACTIVE.dec()
+        if reason == "timeout":
+            FAILURES.inc()
+            LOG.warning("⏳ [TIMEOUT] %s (%s)", conn.addr, conn.timed_out)
+        elif reason == "reset":
+            FAILURES.inc()
+            LOG.warning("⚠️ [RESET] %s", conn.addr)
+
+    def rejected(self, addr, reason: str):
+        LOG.warning("🚫 [BUSY] %s rejected (%s).", addr, reason)
+
+    async def _readline(self, conn: runtime.Connection, prefix: bytes = b"") -> str:
+        line = prefix + await conn.readline()
+        if len(line) > MAX_HEADER_LINE:
+            raise ValueError("Header line too long")
+        return line.decode("utf-8", errors="ignore").strip()
+
+    async def _serve(self, conn: runtime.Connection):
+        conn.write(b"READY\n")
+        try:
+            # v2: 4 byte magic; v1 / chunked: dòng lệnh luôn dài >= 4 ký tự
+            first = await conn.readexactly(len(V2_MAGIC))
+        except asyncio.IncompleteReadError:
+            return
+
+        if first == V2_MAGIC:
+            version = 2
+            name_len, total_size = unpack_v2_header(first + await conn.readexactly(V2_HEADER.size - len(V2_MAGIC)))
+            raw_name = (await conn.readexactly(name_len)).decode("utf-8", errors="ignore")
+        else:
+            version = 1
+            filename_line = await self._readline(conn, first)
+            if filename_line.split(" ", 1)[0].upper() in CHUNKED_COMMANDS:
+                await self._serve_chunked(conn, filename_line)
+                return
+            size_line = await self._readline(conn)
+
+            if not filename_line.startswith("FILENAME:"):
+                conn.write(b"ERROR Invalid header (FILENAME)\n")
+                return
+            if not size_line.startswith("SIZE:"):
+                conn.write(b"ERROR Invalid header (SIZE)\n")
+                return
+
+            raw_name = filename_line.split(":", 1)[1].strip()
+            total_size = int(size_line.split(":", 1)[1].strip())
+
+        check_upload_size(total_size)
+        save_path = unique_path(safe_filename(raw_name))
+        loop = asyncio.get_running_loop()
+        fd = await loop.run_in_executor(self.pool, open_upload, save_path, total_size)
+
+        if version == 1:
+            conn.write(b"OK\n")
+        LOG.info("📥 [UPLOAD START] %s -> %s (%s bytes, v%s, async)", conn.addr, save_path.name, total_size, version)
+
+        progress = Progress(save_path.name, total_size)
+        started = time.monotonic()
+        writer = DiskWriter(self.pool, self.budget, fd)
+        received = 0
+        try:
+            while received < total_size:
+                reserved = await self.budget.acquire(min(WRITE_CHUNK, total_size - received))
+                try:
+                    data = await conn.readexactly(reserved, timeout=READ_TIMEOUT)
+                except asyncio.IncompleteReadError:
+                    self.budget.release(reserved)
+                    raise ConnectionError("Client disconnected during file transfer.") from None
+                except BaseException:
+                    self.budget.release(reserved)
+                    raise
+                # Deadline đã gỡ sau readexactly: chờ đĩa ở đây không bị tính là client chậm
+                await writer.write(data, received, reserved)
+                received += reserved
+                BYTES_IN.inc(reserved)
+                progress(received)
+            await writer.flush()
+        finally:
+            writer.close(None if received >= total_size and not writer.pending else received)
+
+        conn.write(b"DONE\n")
+        UPLOADS.inc()
+        DURATION.observe(time.monotonic() - started)
+        LOG.info("✅ [UPLOAD DONE] %s saved (%s bytes)", save_path.name, received)
+
+    async def _serve_chunked(self, conn: runtime.Connection, line: str):
+        """Lệnh chunked tuần tự trên 1 kết nối; client mở nhiều kết nối song song."""
+        loop = asyncio.get_running_loop()
+        while True:
+            cmd, parts, body_len = parse_command(line)
+            data = b""
+            reserved = 0
+            if body_len:
+                reserved = await self.budget.acquire(body_len)
+            try:
+                if body_len:
+                    data = await conn.readexactly(body_len, timeout=READ_TIMEOUT)
+                # crc32 + pwrite + lưu .json đều chạy trong pool
+                reply = await loop.run_in_executor(self.pool, run_command, cmd, parts, conn.addr, line, data)
+            finally:
+                if reserved:
+                    self.budget.release(reserved)
+            conn.write(reply)
+            await conn.flush()
+
+            line = await self._readline(conn)
+            if not line:
+                return  # client đóng kết nối sau lệnh cuối
+
+def serve_async():
+    server = runtime.Server()
+    server.add_tcp(
+        AsyncFileTransfer(), PORT, HOST, name="file-transfer", idle_timeout=IDLE_TIMEOUT,
+        limit=WRITE_CHUNK, admission=ADMISSION,
+    )
+    print(f"⚡ Async mode: {DISK_THREADS} disk thread(s), buffer {WRITE_CHUNK}, "
+          f"in-flight {UPLOAD_INFLIGHT}/upload, {INFLIGHT_BYTES} total")
+    # 1 process: _uploads (fd + refcount của upload chunked) nằm trong RAM, các kết nối
+    # song song của 1 upload phải tới cùng process; thread dọn upload idle không sống qua fork
+    runtime.serve(server, workers=1)
+
 def main():
     print("🚀 Starting TCP File Transfer Server...")
-    print(f"📡 Listening on {HOST}:{PORT}")
+    print(f"📡 Listening on {HOST}:{PORT} (mode={FT_MODE})")
     print(f"📁 Upload dir: {UPLOAD_DIR}")
+    print(f"🚦 Admission: {ADMISSION.describe()}")
+    _uploads.start_sweeper()
+    if FT_MODE == "async":
+        serve_async()  # runtime tự bật exporter /metrics
+        return
+    print(f"🚚 Receive path: {'splice (zero-copy)' if USE_SPLICE else 'recv_into'}")
+    INFLIGHT.fn = lambda: _chunk_budget.used
 
     server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_sock.bind((HOST, PORT))
-    server_sock.listen(50)
+    server_sock.listen(admission.LISTEN_BACKLOG)
+    metrics.start_from_env()
 
     try:
         while True:
             conn, addr = server_sock.accept()
+            reason = ADMISSION.check(addr)
+            if reason is not None:
+                # Client đọc dòng đầu: BUSY thay vì READY -> báo "Server not ready"
+                admission.reject(conn)
+                LOG.warning("🚫 [BUSY] %s rejected (%s).", addr, reason)
+                continue
             t = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
             t.start()
-            print(f"🧵 [THREAD] Active threads: {threading.active_count() - 1}")
+            LOG.info("🧵 [THREAD] Active threads: %s", threading.active_count() - 1)
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by Ctrl+C")
     finally:
@@ -1,74 +1,127 @@
-import asyncio
+import argparse
 import os
-import signal
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import framing, log, metrics, runtime
+from common.framing import LineReader
 
 HOST = os.getenv('HOST', '0.0.0.0')
 PORT = int(os.getenv('PORT', '9005'))
 
+# Số process worker (mỗi worker 1 event loop, chung port nhờ SO_REUSEPORT)
+WORKERS = int(os.getenv('WORKERS', '1'))
+
+# Fast path: đọc theo lô, không log từng dòng, chỉ drain khi vượt high-water
+FAST_PATH = os.getenv('FAST_PATH', '0') == '1'
+READ_CHUNK = 64 * 1024
+
 WELCOME = (
     "Welcome to ASYNC TCP Echo Server (asyncio)!\n"
     "- Send a line and server replies: ASYNC-ECHO: <line>\n"
     "- Type 'quit' to close.\n"
-)
-
-async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-    addr = writer.get_extra_info('peername')
-    print(f"✅ [CONNECT] {addr}")
-    try:
-        writer.write(WELCOME.encode('utf-8'))
-        await writer.drain()
+).encode('utf-8')
+
+CONNECTIONS = metrics.counter('async_echo_connections_total', 'Kết nối đã accept')
+ACTIVE = metrics.gauge('async_echo_connections_active', 'Kết nối đang mở')
+MESSAGES = metrics.counter('async_echo_messages_total', 'Số dòng đã echo')
+BYTES_IN = metrics.counter('async_echo_received_bytes_total', 'Byte nhận từ client')
+BYTES_OUT = metrics.counter('async_echo_sent_bytes_total', 'Byte gửi cho client')
+ERRORS = metrics.counter('async_echo_errors_total', 'Kết nối đóng do lỗi')
+
+LOG = log.get('async-echo')
+MSG = log.sampled('async-echo.msg')  # mỗi dòng echo: tối đa LOG_RATE record/giây
+
+
+class AsyncEcho(runtime.StreamHandler):
+    """Echo theo dòng; accept, timeout, drain, worker do common.runtime lo."""
+
+    def __init__(self, fast: bool = FAST_PATH):
+        self.fast = fast
+
+    async def handle(self, conn: runtime.Connection):
+        CONNECTIONS.inc()
+        ACTIVE.inc()
+        LOG.info("✅ [CONNECT] %s", conn.addr)
+        if self.fast:
+            await self._serve_fast(conn)
+        else:
+            await self._serve_lines(conn)
+
+    def closed(self, conn: runtime.Connection, reason: str, exc: BaseException = None):
+        ACTIVE.dec()
+        if reason == 'error':
+            ERRORS.inc()
+            LOG.error("❌ [ERROR] %s: %s", conn.addr, exc)
+        elif reason == 'timeout':
+            LOG.warning("⏳ [TIMEOUT] %s", conn.addr)
+        LOG.info("✅ [CLOSE] %s", conn.addr)
+
+    async def _serve_lines(self, conn: runtime.Connection):
+        conn.write(WELCOME)
+        await conn.drain()
 
         while True:
-            data = await reader.readline()
+            data = await conn.readline()
             if not data:
-                print(f"🔌 [DISCONNECT] {addr}")
+                LOG.info("🔌 [DISCONNECT] %s", conn.addr)
                 break
 
+            BYTES_IN.inc(len(data))
+            MESSAGES.inc()
             msg = data.decode('utf-8', errors='ignore').strip()
-            print(f"📩 [RECV] {addr}: {msg}")
+            MSG.info("📩 [RECV] %s: %s", conn.addr, msg)
 
             if msg.lower() in ('quit', 'exit', 'q'):
-                writer.write(b"Bye!\n")
-                await writer.drain()
+                conn.write(b"Bye!\n")
+                await conn.drain()
                 break
 
-            reply = f"ASYNC-ECHO: {msg}\n"
-            writer.write(reply.encode('utf-8'))
-            await writer.drain()
-
-    except Exception as e:
-        print(f"❌ [ERROR] {addr}: {e}")
-    finally:
-        try:
-            writer.close()
-            await writer.wait_closed()
-        except Exception:
-            pass
-        print(f"✅ [CLOSE] {addr}")
+            reply = f"ASYNC-ECHO: {msg}\n".encode('utf-8')
+            conn.write(reply)
+            BYTES_OUT.inc(len(reply))
+            await conn.drain()
 
-async def main():
-    server = await asyncio.start_server(handle_client, host=HOST, port=PORT)
+    async def _serve_fast(self, conn: runtime.Connection):
+        lines = LineReader()
+        conn.write(WELCOME)
 
-    addrs = ', '.join(str(sock.getsockname()) for sock in server.sockets or [])
-    print("🚀 Starting ASYNC TCP Echo Server...")
-    print(f"📡 Listening on {addrs}")
+        while True:
+            # read() trả về toàn bộ những gì StreamReader đang giữ (tối đa READ_CHUNK)
+            data = await conn.read(READ_CHUNK)
+            if not data:
+                break
+            BYTES_IN.inc(len(data))
+
+            batch = lines.feed(data)
+            MESSAGES.inc(len(batch))
+            out, quit_ = framing.reply_lines(batch, b'ASYNC-ECHO: ')
+            if out:
+                conn.write(out)
+                BYTES_OUT.inc(len(out))
+            if quit_:
+                await conn.drain()
+                break
+            await conn.flush()
 
-    stop_event = asyncio.Event()
 
-    def _stop(*_args):
-        stop_event.set()
+def parse_args():
+    p = argparse.ArgumentParser(description='asyncio TCP echo server')
+    p.add_argument('--workers', type=int, default=WORKERS,
+                   help='số process worker chung port (SO_REUSEPORT), mặc định 1')
+    p.add_argument('--fast', action='store_true', default=FAST_PATH,
+                   help='fast path: uvloop (nếu có), đọc/ghi theo lô, không log từng dòng')
+    return p.parse_args()
 
-    loop = asyncio.get_running_loop()
-    for sig in (signal.SIGINT, signal.SIGTERM):
-        try:
-            loop.add_signal_handler(sig, _stop)
-        except NotImplementedError:
-            pass
 
-    async with server:
-        await stop_event.wait()
+def main():
+    args = parse_args()
+    print(f"🚀 Starting ASYNC TCP Echo Server... (fast={args.fast})")
+    server = runtime.Server()
+    server.add_tcp(AsyncEcho(args.fast), PORT, HOST, name='async-echo')
+    runtime.serve(server, workers=args.workers, use_uvloop=args.fast)
 
-    print("🛑 Server stopping...")
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    main()
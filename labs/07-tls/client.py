@@ -1,19 +1,23 @@
+import argparse
 import socket
 import ssl
+import time
 
 SERVER_HOST = "127.0.0.1"
 SERVER_PORT = 9443
 
 CA_CERT = "cert/server.crt"
 
-def main():
-    print("🧑‍💻 TLS Echo Client")
-    print(f"➡️ Server: {SERVER_HOST}:{SERVER_PORT}")
-
+def make_context() -> ssl.SSLContext:
     context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
     context.load_verify_locations(CA_CERT)
+    return context
 
-    with socket.create_connection((SERVER_HOST, SERVER_PORT)) as sock:
+def interactive(context: ssl.SSLContext, host: str, port: int):
+    print("🧑‍💻 TLS Echo Client")
+    print(f"➡️ Server: {host}:{port}")
+
+    with socket.create_connection((host, port)) as sock:
         with context.wrap_socket(sock, server_hostname="localhost") as ssock:
             print("🔐 TLS established:", ssock.version())
 
@@ -34,5 +38,61 @@ def main():
 
     print("🔌 Disconnected.")
 
+def reconnect(context: ssl.SSLContext, host: str, port: int, count: int, resume: bool):
+    """Kết nối lặp lại `count` lần, dùng lại session cũ để server bắt tay rút gọn."""
+    print("🧑‍💻 TLS Echo Client (reconnect)")
+    print(f"➡️ Server: {host}:{port} | {count} connections | resume={'on' if resume else 'off'}")
+
+    session = None
+    full = resumed = 0
+    full_ms = resumed_ms = 0.0
+
+    for i in range(1, count + 1):
+        with socket.create_connection((host, port)) as sock:
+            t0 = time.perf_counter()
+            with context.wrap_socket(sock, server_hostname="localhost",
+                                     session=session if resume else None) as ssock:
+                ms = (time.perf_counter() - t0) * 1000
+                if ssock.session_reused:
+                    resumed += 1
+                    resumed_ms += ms
+                else:
+                    full += 1
+                    full_ms += ms
+
+                # Đọc welcome trước: với TLS 1.3, ticket đến sau handshake cùng dữ liệu đầu tiên
+                f = ssock.makefile("rb")
+                f.readline()
+                ssock.sendall(f"ping {i}\n".encode("utf-8"))
+                f.readline()
+                ssock.sendall(b"quit\n")
+                f.readline()
+                session = ssock.session
+
+    print("\n====== TLS RECONNECT SUMMARY ======")
+    print(f"Handshakes: full={full} resumed={resumed}")
+    if full:
+        print(f"Full handshake   : avg={full_ms / full:.2f} ms")
+    if resumed:
+        print(f"Resumed handshake: avg={resumed_ms / resumed:.2f} ms")
+    print("===================================")
+
+def parse_args():
+    p = argparse.ArgumentParser(description="TLS echo client")
+    p.add_argument("--host", default=SERVER_HOST)
+    p.add_argument("--port", type=int, default=SERVER_PORT)
+    p.add_argument("--reconnect", type=int, metavar="N",
+                   help="kết nối lại N lần (không tương tác), đếm handshake đầy đủ / resumed")
+    p.add_argument("--no-resume", action="store_true", help="không dùng lại session khi --reconnect")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    context = make_context()
+    if args.reconnect:
+        reconnect(context, args.host, args.port, args.reconnect, not args.no_resume)
+    else:
+        interactive(context, args.host, args.port)
+
 if __name__ == "__main__":
     main()
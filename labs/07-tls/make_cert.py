@@ -1,3 +1,4 @@
+import argparse
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -7,7 +8,7 @@ from datetime import datetime, timedelta
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
 
 BASE = Path(__file__).resolve().parent
 CERT_DIR = BASE / "cert"
@@ -16,9 +17,23 @@ CERT_DIR.mkdir(parents=True, exist_ok=True)
 CRT_PATH = CERT_DIR / "server.crt"
 KEY_PATH = CERT_DIR / "server.key"
 
+def generate_key(key_type: str):
+    if key_type == "ecdsa":
+        # ECDSA P-256: ký nhanh hơn RSA-2048 nhiều -> handshake phía server rẻ hơn
+        return ec.generate_private_key(ec.SECP256R1())
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Tạo cert tự ký cho TLS lab")
+    p.add_argument("--key-type", choices=("rsa", "ecdsa"), default="rsa",
+                   help="rsa = RSA-2048 (mặc định), ecdsa = ECDSA P-256")
+    return p.parse_args()
+
 def main():
+    args = parse_args()
+
     # Generate private key
-    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    key = generate_key(args.key_type)
 
     subject = issuer = x509.Name([
         x509.NameAttribute(NameOID.COUNTRY_NAME, "VN"),
@@ -57,7 +72,7 @@ def main():
         cert.public_bytes(serialization.Encoding.PEM)
     )
 
-    print("✅ Generated:")
+    print(f"✅ Generated ({args.key_type}):")
     print(" -", CRT_PATH)
     print(" -", KEY_PATH)
 
@@ -1,6 +1,17 @@
+import argparse
+import os
+import selectors
 import socket
 import ssl
+import sys
 import threading
+import time
+from collections import deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import admission, framing, log, metrics, runtime
+from common.framing import LineReader, LineTooLong
 
 HOST = "0.0.0.0"
 PORT = 9443
@@ -8,63 +19,418 @@ PORT = 9443
 CERT_FILE = "cert/server.crt"
 KEY_FILE = "cert/server.key"
 
+RECV_SIZE = 16 * 1024  # = 1 TLS record
+
+# Handshake chạy trên vài thread reactor riêng (non-blocking), không chặn vòng accept()
+HANDSHAKE_WORKERS = int(os.getenv("HANDSHAKE_WORKERS", str(os.cpu_count() or 2)))
+MAX_PENDING_HANDSHAKES = int(os.getenv("MAX_PENDING_HANDSHAKES", "512"))
+HANDSHAKE_TIMEOUT = float(os.getenv("HANDSHAKE_TIMEOUT", "5"))
+IDLE_TIMEOUT = float(os.getenv("IDLE_TIMEOUT", "300"))
+REPORT_INTERVAL = float(os.getenv("REPORT_INTERVAL", "10"))
+
+# Session resumption: TLS 1.2 dùng session cache phía server, TLS 1.3 dùng session ticket.
+# Module ssl không cho đặt khoá ticket -> xoay khoá bằng cách tạo SSLContext mới
+# sau mỗi TICKET_KEY_ROTATION giây (0 = không xoay). Mỗi lần xoay, mọi ticket và session
+# cache cũ mất hiệu lực ngay: context phải chọn lúc wrap, trước khi đọc ClientHello, nên
+# giữ lại context cũ cũng không biết client nào cần nó -> mọi client bắt tay đầy đủ 1 lần.
+# Vì vậy chu kỳ xoay để dài hơn hẳn thời hạn ticket (OpenSSL: 7200s), mặc định 1 ngày.
+# TICKET_LIFETIME: tên cũ của TICKET_KEY_ROTATION, vẫn đọc nếu chưa đặt tên mới.
+TLS_TICKETS = os.getenv("TLS_TICKETS", "1") == "1"
+TLS_NUM_TICKETS = int(os.getenv("TLS_NUM_TICKETS", "2"))
+TICKET_KEY_ROTATION = float(os.getenv("TICKET_KEY_ROTATION", os.getenv("TICKET_LIFETIME", "86400")))
+
+# thread = mỗi client 1 thread (mặc định); async = 1 event loop cho mọi phiên TLS
+TLS_MODE = os.getenv("TLS_MODE", "thread").lower()
+# async: dừng đọc khi buffer ghi vượt high-water, đọc tiếp khi xuống dưới low-water
+WRITE_HIGH_WATER = int(os.getenv("WRITE_HIGH_WATER", str(256 * 1024)))
+WRITE_LOW_WATER = int(os.getenv("WRITE_LOW_WATER", str(64 * 1024)))
+# async: giới hạn buffer đọc của StreamReader và độ dài 1 dòng, theo từng kết nối
+READ_LIMIT = int(os.getenv("READ_LIMIT", str(64 * 1024)))
+
+HANDSHAKES = {
+    result: metrics.counter("tls_handshakes_total", "Kết quả bắt tay TLS", result=result)
+    for result in ("full", "resumed", "failed", "timeouts", "rejected")
+}
+HANDSHAKE_SECONDS = {
+    kind: metrics.histogram("tls_handshake_duration_seconds", "Thời gian bắt tay TLS", kind=kind)
+    for kind in ("full", "resumed")
+}
+ACTIVE = metrics.gauge("tls_sessions_active", "Phiên TLS đang mở")
+MESSAGES = metrics.counter("tls_messages_total", "Số dòng đã echo")
+BYTES_IN = metrics.counter("tls_received_bytes_total", "Byte (đã giải mã) nhận từ client")
+BYTES_OUT = metrics.counter("tls_sent_bytes_total", "Byte (chưa mã hoá) gửi cho client")
+LOG = log.get("tls-echo")
+MSG = log.sampled("tls-echo.msg")  # mỗi dòng echo: tối đa LOG_RATE record/giây
+
+# MAX_CONNECTIONS / MAX_PER_IP / ACCEPT_RATE: kiểm tra trước cả handshake, vượt -> đóng luôn
+# (client chưa bắt tay không đọc được BUSY)
+ADMISSION = admission.Admission("tls-echo")
+
+class HandshakeStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ok = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.resumed = 0
+        self.total_ms = 0.0
+        self.resumed_ms = 0.0
+
+    def add(self, field: str, ms: float = 0.0):
+        HANDSHAKES[field].inc()
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+            self.total_ms += ms
+
+    def handshake_done(self, resumed: bool, ms: float):
+        kind = "resumed" if resumed else "full"
+        HANDSHAKES[kind].inc()
+        HANDSHAKE_SECONDS[kind].observe(ms / 1000)
+        with self.lock:
+            self.ok += 1
+            self.total_ms += ms
+            if resumed:
+                self.resumed += 1
+                self.resumed_ms += ms
+
+    def snapshot(self) -> tuple:
+        with self.lock:
+            return (self.ok, self.failed, self.timeouts, self.rejected,
+                    self.resumed, self.total_ms, self.resumed_ms)
+
+_hs_stats = HandshakeStats()
+_hs_pending = threading.BoundedSemaphore(MAX_PENDING_HANDSHAKES)
+
+def report_loop():
+    last_ok, last_t = 0, time.monotonic()
+    while True:
+        time.sleep(REPORT_INTERVAL)
+        ok, failed, timeouts, rejected, resumed, total_ms, resumed_ms = _hs_stats.snapshot()
+        now = time.monotonic()
+        rate = (ok - last_ok) / max(now - last_t, 1e-9)
+        full = ok - resumed
+        full_avg = (total_ms - resumed_ms) / full if full else 0.0
+        resumed_avg = resumed_ms / resumed if resumed else 0.0
+        LOG.info("🤝 [HANDSHAKE] %.1f/s ok=%s full=%s resumed=%s failed=%s timeout=%s rejected=%s "
+                 "avg_full=%.2fms avg_resumed=%.2fms",
+                 rate, ok, full, resumed, failed, timeouts, rejected, full_avg, resumed_avg)
+        last_ok, last_t = ok, now
+
+def make_context() -> ssl.SSLContext:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile=CERT_FILE, keyfile=KEY_FILE)
+    if TLS_TICKETS:
+        context.num_tickets = TLS_NUM_TICKETS
+    else:
+        # Tắt ticket -> TLS 1.3 luôn bắt tay đầy đủ (dùng để so sánh chi phí)
+        context.options |= ssl.OP_NO_TICKET
+        context.num_tickets = 0
+    return context
+
+class ContextRotator:
+    """Giữ SSLContext hiện tại, tạo mới (= khoá ticket mới) sau mỗi TICKET_KEY_ROTATION giây."""
+
+    def __init__(self, period: float = TICKET_KEY_ROTATION):
+        self.period = period
+        self.lock = threading.Lock()
+        self.context = make_context()
+        self.created = time.monotonic()
+        self.rotations = 0
+
+    def get(self) -> ssl.SSLContext:
+        if self.period > 0 and time.monotonic() - self.created >= self.period:
+            with self.lock:
+                if time.monotonic() - self.created >= self.period:
+                    self.context = make_context()
+                    self.created = time.monotonic()
+                    self.rotations += 1
+                    LOG.info("🔄 [TICKET] rotated session ticket keys (#%s)", self.rotations)
+        return self.context
+
+def reply_lines(addr, lines) -> tuple:
+    """Trả lời từng dòng theo thứ tự -> (bytes gửi 1 lần, client đã quit?)."""
+    MESSAGES.inc(len(lines))
+    return framing.reply_lines(lines, b"TLS-ECHO: ", b"Bye TLS!\n",
+                               lambda msg: MSG.info("📩 [RECV] %s: %s", addr, msg))
+
 def handle_client(conn: ssl.SSLSocket, addr):
-    print(f"✅ [TLS CONNECT] {addr}")
+    LOG.info("✅ [TLS CONNECT] %s", addr)
+    reader = LineReader()
+    ACTIVE.inc()
     try:
         conn.sendall(b"Welcome TLS Server! Type 'quit' to exit.\n")
 
         while True:
-            data = conn.recv(4096)
+            data = conn.recv(RECV_SIZE)
             if not data:
-                print(f"🔌 [DISCONNECT] {addr}")
+                LOG.info("🔌 [DISCONNECT] %s", addr)
                 break
+            BYTES_IN.inc(len(data))
 
-            msg = data.decode("utf-8", errors="ignore").strip()
-            print(f"📩 [RECV] {addr}: {msg}")
-
-            if msg.lower() in ("quit", "exit", "q"):
-                conn.sendall(b"Bye TLS!\n")
+            out, quit_ = reply_lines(addr, reader.feed(data))
+            if out:
+                conn.sendall(out)
+                BYTES_OUT.inc(len(out))
+            if quit_:
                 break
-
-            conn.sendall(f"TLS-ECHO: {msg}\n".encode("utf-8"))
     except Exception as e:
-        print(f"❌ [ERROR] {addr}: {e}")
+        LOG.error("❌ [ERROR] %s: %s", addr, e)
     finally:
+        ACTIVE.dec()
+        ADMISSION.release(addr)
         try:
             conn.shutdown(socket.SHUT_RDWR)
         except:
             pass
         conn.close()
 
-def main():
-    print("🚀 Starting TLS Echo Server...")
-    print(f"📡 Listening on {HOST}:{PORT}")
-    print(f"🔐 Cert: {CERT_FILE}")
-    print(f"🔑 Key : {KEY_FILE}")
+class PendingHandshake:
+    __slots__ = ("tls", "addr", "deadline", "t0", "registered", "done")
+
+    def __init__(self, tls: ssl.SSLSocket, addr, deadline: float):
+        self.tls = tls
+        self.addr = addr
+        self.deadline = deadline
+        self.t0 = time.perf_counter()
+        self.registered = False
+        self.done = False
 
+class HandshakeReactor(threading.Thread):
+    """Làm handshake non-blocking cho nhiều client cùng lúc trong 1 thread.
+
+    Client chậm / không bao giờ gửi ClientHello chỉ chiếm 1 mục trong selector
+    tới khi hết HANDSHAKE_TIMEOUT, không giữ thread nào.
+    """
+
+    def __init__(self, contexts: ContextRotator, idx: int):
+        super().__init__(name=f"tls-handshake-{idx}", daemon=True)
+        self.contexts = contexts
+        self.sel = selectors.DefaultSelector()
+        self.inbox = deque()
+        self.deadlines = deque()  # cùng 1 timeout -> thứ tự FIFO cũng là thứ tự deadline
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.sel.register(self.wake_r, selectors.EVENT_READ, None)
+
+    def submit(self, client_sock: socket.socket, addr):
+        self.inbox.append((client_sock, addr))
+        try:
+            self.wake_w.send(b"\0")
+        except BlockingIOError:
+            pass  # đã có tín hiệu đánh thức đang chờ
+
+    def _finish(self, hs: PendingHandshake):
+        hs.done = True
+        if hs.registered:
+            self.sel.unregister(hs.tls)
+        _hs_pending.release()
+
+    def _start(self, client_sock: socket.socket, addr):
+        try:
+            client_sock.setblocking(False)
+            tls = self.contexts.get().wrap_socket(client_sock, server_side=True, do_handshake_on_connect=False)
+        except OSError as e:
+            _hs_stats.add("failed")
+            LOG.warning("❌ [TLS HANDSHAKE FAIL] %s: %s", addr, e)
+            client_sock.close()
+            _hs_pending.release()
+            ADMISSION.release(addr)
+            return
+        hs = PendingHandshake(tls, addr, time.monotonic() + HANDSHAKE_TIMEOUT)
+        self.deadlines.append(hs)
+        self._step(hs)
+
+    def _step(self, hs: PendingHandshake):
+        try:
+            hs.tls.do_handshake()
+        except ssl.SSLWantReadError:
+            self._watch(hs, selectors.EVENT_READ)
+            return
+        except ssl.SSLWantWriteError:
+            self._watch(hs, selectors.EVENT_WRITE)
+            return
+        except (ssl.SSLError, OSError) as e:
+            self._finish(hs)
+            _hs_stats.add("failed")
+            LOG.warning("❌ [TLS HANDSHAKE FAIL] %s: %s", hs.addr, e)
+            hs.tls.close()
+            ADMISSION.release(hs.addr)
+            return
+
+        self._finish(hs)
+        _hs_stats.handshake_done(hs.tls.session_reused, (time.perf_counter() - hs.t0) * 1000)
+        hs.tls.settimeout(IDLE_TIMEOUT)
+        threading.Thread(target=handle_client, args=(hs.tls, hs.addr), daemon=True).start()
+
+    def _watch(self, hs: PendingHandshake, events: int):
+        if hs.registered:
+            self.sel.modify(hs.tls, events, hs)
+        else:
+            self.sel.register(hs.tls, events, hs)
+            hs.registered = True
+
+    def _expire(self, now: float):
+        while self.deadlines and (self.deadlines[0].done or self.deadlines[0].deadline <= now):
+            hs = self.deadlines.popleft()
+            if hs.done:
+                continue
+            self._finish(hs)
+            _hs_stats.add("timeouts")
+            LOG.warning("⏳ [TLS HANDSHAKE TIMEOUT] %s", hs.addr)
+            hs.tls.close()
+            ADMISSION.release(hs.addr)
+
+    def run(self):
+        while True:
+            timeout = None
+            if self.deadlines:
+                timeout = max(0.0, self.deadlines[0].deadline - time.monotonic())
+            for key, _mask in self.sel.select(timeout):
+                if key.data is None:
+                    try:
+                        while self.wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    while self.inbox:
+                        self._start(*self.inbox.popleft())
+                elif not key.data.done:
+                    self._step(key.data)
+            self._expire(time.monotonic())
+
+class TLSEcho(runtime.StreamHandler):
+    """Chế độ async: bắt tay, deadline, giới hạn handshake đang chờ do common.runtime lo."""
+
+    def handshake_done(self, conn: runtime.Connection, seconds: float):
+        _hs_stats.handshake_done(conn.tls.session_reused, seconds * 1000)
+
+    def handshake_failed(self, addr, exc: BaseException):
+        if isinstance(exc, TimeoutError):
+            _hs_stats.add("timeouts")
+            LOG.warning("⏳ [TLS HANDSHAKE TIMEOUT] %s", addr)
+        else:
+            _hs_stats.add("failed")
+            LOG.warning("❌ [TLS HANDSHAKE FAIL] %s: %s", addr, exc)
+
+    def rejected(self, addr, reason: str):
+        if reason == "handshakes":
+            _hs_stats.add("rejected")
+        else:
+            LOG.warning("🚫 [BUSY] %s rejected (%s).", addr, reason)
+
+    async def handle(self, conn: runtime.Connection):
+        LOG.info("✅ [TLS CONNECT] %s", conn.addr)
+        ACTIVE.inc()
+        lines = LineReader(max_line=READ_LIMIT)
+        conn.write(b"Welcome TLS Server! Type 'quit' to exit.\n")
+
+        while True:
+            data = await conn.read(RECV_SIZE)
+            if not data:
+                LOG.info("🔌 [DISCONNECT] %s", conn.addr)
+                break
+            BYTES_IN.inc(len(data))
+
+            out, quit_ = reply_lines(conn.addr, lines.feed(data))
+            if out:
+                conn.write(out)
+                BYTES_OUT.inc(len(out))
+            if quit_:
+                await conn.drain()
+                break
+            # Client không đọc reply -> ngừng đọc request cho đến khi buffer ghi xả bớt
+            await conn.flush()
+
+    def closed(self, conn: runtime.Connection, reason: str, exc: BaseException = None):
+        ACTIVE.dec()
+        if isinstance(exc, LineTooLong):
+            LOG.warning("❌ [ERROR] %s: line longer than %s bytes", conn.addr, READ_LIMIT)
+        elif reason == "error":
+            LOG.error("❌ [ERROR] %s: %s", conn.addr, exc)
+        elif reason == "timeout":
+            LOG.warning("⏳ [TIMEOUT] %s", conn.addr)
+
+def serve_async(contexts: ContextRotator):
+    server = runtime.Server()
+    # ssl= hàm: mỗi kết nối lấy SSLContext hiện tại (xoay khoá ticket)
+    server.add_tcp(
+        TLSEcho(), PORT, HOST, ssl=contexts.get, name="tls-echo",
+        idle_timeout=IDLE_TIMEOUT, handshake_timeout=HANDSHAKE_TIMEOUT,
+        max_handshakes=MAX_PENDING_HANDSHAKES, limit=READ_LIMIT,
+        write_high_water=WRITE_HIGH_WATER, write_low_water=WRITE_LOW_WATER,
+        admission=ADMISSION,
+    )
+    print(f"⚡ Async mode: max pending handshakes {MAX_PENDING_HANDSHAKES}, "
+          f"write buffer {WRITE_LOW_WATER}/{WRITE_HIGH_WATER}, read limit {READ_LIMIT}")
+    print(f"🚦 Admission: {ADMISSION.describe()}")
+    # 1 process: report_loop chạy ở thread nền (không sống qua fork) và khoá ticket
+    # phải chung, nếu không resume sang worker khác luôn bắt tay lại từ đầu
+    runtime.serve(server, workers=1)
+
+def serve_threads(contexts: ContextRotator):
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     sock.bind((HOST, PORT))
-    sock.listen(50)
+    sock.listen(admission.LISTEN_BACKLOG)
 
-    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    context.load_cert_chain(certfile=CERT_FILE, keyfile=KEY_FILE)
+    reactors = [HandshakeReactor(contexts, i) for i in range(max(1, HANDSHAKE_WORKERS))]
+    for r in reactors:
+        r.start()
+    print(f"🤝 Handshake workers: {len(reactors)}, max pending {MAX_PENDING_HANDSHAKES}, "
+          f"deadline {HANDSHAKE_TIMEOUT:g}s")
+    print(f"🚦 Admission: {ADMISSION.describe()}")
 
     try:
+        n = 0
         while True:
             client_sock, addr = sock.accept()
-            try:
-                tls_conn = context.wrap_socket(client_sock, server_side=True)
-            except ssl.SSLError as e:
-                print(f"❌ [TLS HANDSHAKE FAIL] {addr}: {e}")
+            reason = ADMISSION.check(addr)
+            if reason is not None:
+                admission.reject(client_sock, b"")
+                LOG.warning("🚫 [BUSY] %s rejected (%s).", addr, reason)
+                continue
+            # Quá nhiều handshake đang chờ -> từ chối ngay thay vì xếp hàng vô hạn
+            if not _hs_pending.acquire(blocking=False):
+                _hs_stats.add("rejected")
+                ADMISSION.release(addr)
                 client_sock.close()
                 continue
+            reactors[n % len(reactors)].submit(client_sock, addr)
+            n += 1
+    finally:
+        sock.close()
 
-            threading.Thread(target=handle_client, args=(tls_conn, addr), daemon=True).start()
+def parse_args():
+    p = argparse.ArgumentParser(description="TLS echo server")
+    p.add_argument("--mode", choices=("thread", "async"), default=TLS_MODE,
+                   help="thread = 1 thread/client, async = asyncio cho mọi phiên TLS")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    print("🚀 Starting TLS Echo Server...")
+    print(f"📡 Listening on {HOST}:{PORT} (mode={args.mode})")
+    print(f"🔐 Cert: {CERT_FILE}")
+    print(f"🔑 Key : {KEY_FILE}")
+
+    contexts = ContextRotator()
+    if TLS_TICKETS:
+        rotation = f"every {TICKET_KEY_ROTATION:g}s" if TICKET_KEY_ROTATION > 0 else "off"
+        print(f"🎫 Session tickets: {TLS_NUM_TICKETS}/handshake, key rotation {rotation}")
+    else:
+        print("🎫 Session tickets: off")
+    threading.Thread(target=report_loop, daemon=True).start()
+
+    try:
+        if args.mode == "async":
+            serve_async(contexts)  # runtime tự bật exporter /metrics
+        else:
+            metrics.start_from_env()
+            serve_threads(contexts)
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by Ctrl+C")
-    finally:
-        sock.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,269 @@
+"""Log sự kiện append-only trên đĩa cho mcast bus, ghi qua mmap theo segment.
+
+Mỗi segment gồm 2 file trong thư mục log:
+  <first_seq:020d>.log  kích thước cố định (cấp trước), map vào bộ nhớ
+  <first_seq:020d>.idx  cặp <QQ (seq, offset) cho mỗi `index_every` record
+
+Record trong .log: header <IIQ (độ dài body, crc32 body, seq) + body utf-8
+"type\\tt\\tsender\\tmessage". Header độ dài 0 = hết dữ liệu (phần sau toàn byte 0).
+
+Ghi chỉ là memcpy vào mmap; flush() (msync) gọi định kỳ, không fsync từng event.
+Segment cũ bị xoá nguyên file khi tổng dung lượng / tuổi vượt giới hạn.
+
+Server gọi submit() (đưa vào queue, không chặn) khi đang giữ lock của feed; 1
+thread riêng mới encode + ghi, nên tạo segment mới (ftruncate + mmap 16 MB) hay
+xoá segment cũ không làm chậm việc nhận gói / đọc feed.
+"""
+
+import bisect
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+HEADER = struct.Struct('<IIQ')
+INDEX = struct.Struct('<QQ')
+
+
+def encode(kind: str, t: str, sender, message: str) -> bytes:
+    return f"{kind}\t{t}\t{sender or ''}\t{message}".encode('utf-8')
+
+
+def decode(seq: int, body: bytes) -> tuple:
+    """-> (seq, kind, t, sender, message)."""
+    kind, t, sender, message = body.decode('utf-8', errors='ignore').split('\t', 3)
+    return seq, kind, t, sender or None, message
+
+
+class Segment:
+    def __init__(self, directory: str, first_seq: int, size: int = 0, index_every: int = 64):
+        base = os.path.join(directory, f"{first_seq:020d}")
+        self.path = base + '.log'
+        self.idx_path = base + '.idx'
+        self.first_seq = first_seq
+        self.index_every = index_every
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # File rỗng = crash giữa O_CREAT và ftruncate: tạo lại như segment mới
+            create = os.fstat(fd).st_size == 0
+            if create:
+                os.ftruncate(fd, size)
+            self.size = os.fstat(fd).st_size
+            self.mm = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+        self.index = []  # [(seq, offset)], tăng dần
+        if not create and os.path.exists(self.idx_path):
+            with open(self.idx_path, 'rb') as f:
+                raw = f.read()
+            raw = raw[:len(raw) - len(raw) % INDEX.size]
+            self.index = [e for e in INDEX.iter_unpack(raw) if e[1] < self.size]
+        self.idx_file = open(self.idx_path, 'wb' if create else 'ab')
+
+        self.pos = 0
+        self.last_seq = first_seq - 1
+        if not create:
+            self._recover()
+
+    def _recover(self):
+        """Tìm cuối dữ liệu hợp lệ: bắt đầu từ mục index cuối, không quét cả file."""
+        seq, pos = self.index[-1] if self.index else (self.first_seq, 0)
+        last = seq - 1
+        mm, size = self.mm, self.size
+        while pos + HEADER.size <= size:
+            n, crc, s = HEADER.unpack_from(mm, pos)
+            end = pos + HEADER.size + n
+            if n == 0 or end > size or zlib.crc32(mm[pos + HEADER.size:end]) != crc:
+                break
+            last = s
+            pos = end
+        self.pos = pos
+        self.last_seq = last
+        # Record ghi dở lúc crash: xoá để lần ghi sau không đọc nhầm
+        if pos < size and mm[pos:pos + HEADER.size] != bytes(min(HEADER.size, size - pos)):
+            mm[pos:] = bytes(size - pos)
+        if self.index and self.index[-1][1] >= pos:
+            self.index = [e for e in self.index if e[1] < pos]
+            with open(self.idx_path, 'wb') as f:
+                f.write(b''.join(INDEX.pack(*e) for e in self.index))
+
+    def append(self, seq: int, body: bytes) -> bool:
+        end = self.pos + HEADER.size + len(body)
+        if end > self.size:
+            return False
+        HEADER.pack_into(self.mm, self.pos, len(body), zlib.crc32(body), seq)
+        self.mm[self.pos + HEADER.size:end] = body
+        if (seq - self.first_seq) % self.index_every == 0 or not self.index:
+            self.index.append((seq, self.pos))
+            self.idx_file.write(INDEX.pack(seq, self.pos))
+        self.pos = end
+        self.last_seq = seq
+        return True
+
+    def read(self, start_seq: int, stop_seq: int) -> list:
+        """Các record có start_seq <= seq < stop_seq."""
+        i = bisect.bisect_right(self.index, (start_seq, float('inf'))) - 1
+        pos = self.index[i][1] if i >= 0 else 0
+        out = []
+        mm, end = self.mm, self.pos
+        while pos < end:
+            n, _crc, seq = HEADER.unpack_from(mm, pos)
+            if seq >= stop_seq:
+                break
+            body_at = pos + HEADER.size
+            if seq >= start_seq:
+                out.append(decode(seq, mm[body_at:body_at + n]))
+            pos = body_at + n
+        return out
+
+    def flush(self):
+        self.mm.flush()
+        self.idx_file.flush()
+
+    def close(self):
+        self.flush()
+        self.mm.close()
+        self.idx_file.close()
+
+    def remove(self):
+        self.mm.close()
+        self.idx_file.close()
+        for path in (self.path, self.idx_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+class EventLog:
+    def __init__(self, directory: str, segment_size: int = 16 * 1024 * 1024,
+                 max_bytes: int = 1024 * 1024 * 1024, max_age: float = 0.0, index_every: int = 64,
+                 queue_size: int = 65536):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_every = index_every
+        self.lock = threading.Lock()
+
+        firsts = sorted(
+            int(name[:-4]) for name in os.listdir(directory)
+            if name.endswith('.log') and name[:-4].isdigit()
+        )
+        self.segments = [Segment(directory, s, segment_size, index_every) for s in firsts]
+        # Segment đã đóng: last_seq = first_seq của segment kế tiếp - 1
+        for seg, nxt in zip(self.segments, self.segments[1:]):
+            seg.last_seq = nxt.first_seq - 1
+        if self.segments and self.segments[-1].last_seq < self.segments[-1].first_seq:
+            # Segment cuối rỗng: lấy seq tiếp theo từ tên file
+            self.segments[-1].last_seq = self.segments[-1].first_seq - 1
+
+        # Lô record (seq, kind, t, sender, message) chờ thread ghi; đầy -> bỏ và đếm
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.writer = threading.Thread(target=self._write_loop, name='event-log', daemon=True)
+        self.writer.start()
+
+    @property
+    def first_seq(self) -> int:
+        return self.segments[0].first_seq if self.segments else 1
+
+    @property
+    def last_seq(self) -> int:
+        return self.segments[-1].last_seq if self.segments else 0
+
+    def append(self, seq: int, kind: str, t: str, sender, message: str):
+        body = encode(kind, t, sender, message)
+        if HEADER.size + len(body) > self.segment_size:
+            return  # không vừa 1 segment -> bỏ qua
+        with self.lock:
+            if not self.segments or not self.segments[-1].append(seq, body):
+                self._roll(seq)
+                self.segments[-1].append(seq, body)
+
+    def submit(self, records: list) -> bool:
+        """Đưa 1 lô record cho thread ghi, không chặn. Gọi theo thứ tự seq."""
+        try:
+            self.queue.put_nowait(records)
+            return True
+        except queue.Full:
+            self.dropped += len(records)
+            return False
+
+    def _write_loop(self):
+        while True:
+            records = self.queue.get()
+            if records is None:
+                return
+            for rec in records:
+                self.append(*rec)
+
+    def _roll(self, seq: int):
+        if self.segments:
+            self.segments[-1].flush()
+        self.segments.append(Segment(self.directory, seq, self.segment_size, self.index_every))
+        self._compact()
+
+    def _compact(self):
+        total = sum(seg.size for seg in self.segments)
+        now = time.time()
+        while len(self.segments) > 1:
+            oldest = self.segments[0]
+            too_big = self.max_bytes and total > self.max_bytes
+            too_old = self.max_age and now - os.path.getmtime(oldest.path) > self.max_age
+            if not (too_big or too_old):
+                break
+            total -= oldest.size
+            oldest.remove()
+            self.segments.pop(0)
+
+    def flush(self):
+        """msync segment đang ghi + xoá segment quá tuổi (gọi định kỳ)."""
+        with self.lock:
+            if self.segments:
+                self.segments[-1].flush()
+            self._compact()
+
+    def read(self, start_seq: int, stop_seq: int) -> list:
+        out = []
+        with self.lock:
+            for seg in self.segments:
+                if seg.last_seq < start_seq or seg.first_seq >= stop_seq:
+                    continue
+                out.extend(seg.read(start_seq, stop_seq))
+        return out
+
+    def tail(self, n: int) -> list:
+        """n record mới nhất (dùng để nạp lại ring khi khởi động)."""
+        last = self.last_seq
+        return self.read(max(self.first_seq, last - n + 1), last + 1)
+
+    def before(self, before: int, limit: int, kind: str = None) -> list:
+        """`limit` record mới nhất có seq < before (lọc theo kind nếu có), cũ -> mới."""
+        window = max(limit, 256)
+        out = []
+        hi = min(before, self.last_seq + 1)
+        first = self.first_seq
+        while hi > first and len(out) < limit:
+            lo = max(first, hi - window)
+            chunk = self.read(lo, hi)
+            if kind:
+                chunk = [r for r in chunk if r[1] == kind]
+            out = chunk + out
+            hi = lo
+        return out[-limit:]
+
+    def close(self):
+        """Ghi nốt các lô còn trong queue rồi đóng mọi segment."""
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        with self.lock:
+            for seg in self.segments:
+                seg.close()
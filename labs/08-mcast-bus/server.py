@@ -1,11 +1,19 @@
+import asyncio
 import json
+import math
 import os
+import selectors
 import socket
 import struct
+import sys
 import threading
 import time
-from collections import deque
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import log, metrics, runtime
+from eventlog import EventLog
 
 HOST = os.getenv('HOST', '0.0.0.0')
 HTTP_PORT = int(os.getenv('HTTP_PORT', '9011'))
@@ -18,34 +26,280 @@ MCAST_TTL = int(os.getenv('MCAST_TTL', '1'))
 # Broadcast
 BCAST_PORT = int(os.getenv('BCAST_PORT', '9012'))
 
-MAX_FEED = int(os.getenv('MAX_FEED', '200'))
+# Số event giữ trong RAM: MAX_FEED cho view gộp, FEED_PER_TYPE cho mỗi loại
+MAX_FEED = int(os.getenv('MAX_FEED', '10000'))
+FEED_PER_TYPE = int(os.getenv('FEED_PER_TYPE', str(MAX_FEED)))
+EVENT_TYPES = ('multicast', 'broadcast')
+
+# Receiver: 1 thread cho cả 2 socket, rút hết gói đang chờ mỗi lần thức dậy
+RCVBUF = int(os.getenv('RCVBUF', str(4 * 1024 * 1024)))
+RECV_BATCH = int(os.getenv('RECV_BATCH', '1024'))
+BUS_LOG = os.getenv('BUS_LOG', '1') == '1'  # log từng gói nhận được
+RECV_BUF = 8192
+
+# Gửi: giới hạn kích thước 1 message và số message trong 1 lần POST /send/batch
+MAX_MESSAGE = int(os.getenv('MAX_MESSAGE', str(RECV_BUF)))
+MAX_SEND_BATCH = int(os.getenv('MAX_SEND_BATCH', '10000'))
+SEND_RATE = float(os.getenv('SEND_RATE', '0'))  # msg/giây tối đa cho batch, 0 = không giới hạn
+# rate do client gửi: thấp hơn MIN_SEND_RATE hoặc làm batch kéo dài quá MAX_BATCH_SECONDS
+# thì từ chối (mỗi batch giữ 1 thread của executor / ThreadingHTTPServer tới khi xong)
+MIN_SEND_RATE = float(os.getenv('MIN_SEND_RATE', '1'))
+MAX_BATCH_SECONDS = float(os.getenv('MAX_BATCH_SECONDS', '60'))
+
+# Log sự kiện trên đĩa (tắt nếu EVENT_LOG_DIR rỗng): nạp lại khi khởi động, /feed?before= đọc lịch sử cũ
+EVENT_LOG_DIR = os.getenv('EVENT_LOG_DIR', '')
+LOG_SEGMENT_SIZE = int(os.getenv('LOG_SEGMENT_SIZE', str(16 * 1024 * 1024)))
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(1024 * 1024 * 1024)))
+LOG_MAX_AGE = float(os.getenv('LOG_MAX_AGE', str(7 * 24 * 3600)))  # giây, 0 = không giới hạn
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '1'))
+LOG_REPLAY = int(os.getenv('LOG_REPLAY', str(MAX_FEED)))
+EVENT_LOG_QUEUE = int(os.getenv('EVENT_LOG_QUEUE', '65536'))  # số lô chờ thread ghi log
+
+# Long-poll / SSE
+MAX_WAIT = float(os.getenv('MAX_WAIT', '30'))
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+
+# HTTP: thread = ThreadingHTTPServer (HTTP/1.1 keep-alive), async = 1 event loop cho mọi request
+HTTP_MODE = os.getenv('HTTP_MODE', 'thread').lower()
+KEEPALIVE_TIMEOUT = float(os.getenv('KEEPALIVE_TIMEOUT', '60'))
+MAX_HEADER = 16 * 1024
+MAX_BODY = int(os.getenv('MAX_BODY', str(16 * 1024 * 1024)))
+
+
+_ts_cache = (0, '')
+
 
-_feed = deque(maxlen=MAX_FEED)
+def _now_iso():
+    # strftime mỗi giây 1 lần; tuple được thay nguyên khối nên an toàn giữa các thread
+    global _ts_cache
+    now = int(time.time())
+    sec, text = _ts_cache
+    if now != sec:
+        text = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now))
+        _ts_cache = (now, text)
+    return text
+
+
+class Event:
+    __slots__ = ('seq', 't', 'type', 'message', 'sender')
+
+    def __init__(self, seq: int, t: str, kind: str, message: str, sender):
+        self.seq = seq
+        self.t = t
+        self.type = kind
+        self.message = message
+        self.sender = sender
+
+    def to_dict(self) -> dict:
+        return {
+            'seq': self.seq,
+            't': self.t,
+            'type': self.type,
+            'message': self.message,
+            'from': self.sender,
+        }
+
+
+class Ring:
+    """Mảng vòng dung lượng cố định; vị trí logic i (0 = event đầu tiên từng push)."""
+
+    __slots__ = ('items', 'cap', 'count')
+
+    def __init__(self, cap: int):
+        self.cap = max(1, cap)
+        self.items = [None] * self.cap
+        self.count = 0  # tổng số đã push (kể cả đã bị ghi đè)
+
+    def push(self, ev: Event):
+        self.items[self.count % self.cap] = ev
+        self.count += 1
+
+    def first(self) -> int:
+        """Vị trí logic cũ nhất còn giữ."""
+        return max(0, self.count - self.cap)
+
+    def after(self, seq: int) -> int:
+        """Vị trí logic đầu tiên có seq > `seq` (seq tăng dần -> tìm nhị phân)."""
+        lo, hi = self.first(), self.count
+        items, cap = self.items, self.cap
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if items[mid % cap].seq <= seq:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def slice(self, start: int, stop: int) -> list:
+        items, cap = self.items, self.cap
+        return [items[i % cap] for i in range(max(start, self.first()), stop)]
+
+
+class EventStore:
+    """Ring gộp (mọi loại, theo seq) + 1 ring cho mỗi loại event.
+
+    Lấy `limit` event mới nhất / sau 1 seq chỉ tốn O(limit) (+ O(log n) tìm vị trí),
+    không phụ thuộc dung lượng.
+    """
+
+    def __init__(self, capacity: int = MAX_FEED, per_type: int = FEED_PER_TYPE):
+        self.all = Ring(capacity)
+        self.by_type = {kind: Ring(per_type) for kind in EVENT_TYPES}
+        self.seq = 0
+
+    def append(self, kind: str, message: str, sender, t: str, seq: int = 0) -> Event:
+        # seq != 0: nạp lại từ log với seq gốc
+        self.seq = seq or self.seq + 1
+        ev = Event(self.seq, t, kind, message, sender)
+        self.all.push(ev)
+        ring = self.by_type.get(kind)
+        if ring is not None:
+            ring.push(ev)
+        return ev
+
+    def query(self, kind: str = 'all', limit: int = 100, since: int = -1) -> list:
+        """since < 0: `limit` event mới nhất; since >= 0: `limit` event cũ nhất có seq > since.
+
+        Luôn cũ -> mới; đọc tiếp từ cursor() để không bỏ sót event nào.
+        """
+        ring = self.by_type.get(kind, self.all)
+        if since < 0:
+            return ring.slice(ring.count - limit, ring.count)
+        start = ring.after(since)
+        return ring.slice(start, min(start + limit, ring.count))
+
+    def cursor(self, events: list, limit: int, since: int) -> int:
+        """Seq để lần sau gửi lại làm since: tới seq cuối đã trả nếu trang đầy
+        (có thể còn event), hết rồi thì seq hiện tại."""
+        if since >= 0 and len(events) >= limit:
+            return events[-1].seq
+        return self.seq
+
+    def before(self, kind: str, limit: int, before: int) -> list:
+        """`limit` event mới nhất có seq < before, cũ -> mới."""
+        ring = self.by_type.get(kind, self.all)
+        stop = ring.after(before - 1)
+        return ring.slice(stop - limit, stop)
+
+    def oldest(self, kind: str) -> int:
+        """seq cũ nhất còn trong RAM (seq + 1 nếu rỗng)."""
+        ring = self.by_type.get(kind, self.all)
+        if ring.count == 0:
+            return self.seq + 1
+        return ring.items[ring.first() % ring.cap].seq
+
+
+_store = EventStore()
+_log = None  # EventLog khi bật EVENT_LOG_DIR
+# Hàm gọi sau mỗi lần thêm event (ngoài lock), vd. đánh thức event loop của HTTP async
+_feed_listeners = []
 _feed_lock = threading.Lock()
+# Báo cho các request /feed/wait, /feed/stream khi có event mới
+_feed_cond = threading.Condition(_feed_lock)
 
 
-def _now_iso():
-    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime())
+RECEIVED = {k: metrics.counter('mcast_bus_received_total', 'Gói UDP nhận được', type=k) for k in EVENT_TYPES}
+RECEIVED_BYTES = metrics.counter('mcast_bus_received_bytes_total', 'Byte UDP nhận được')
+MSG = log.sampled('mcast-bus.msg')  # log từng gói (BUS_LOG=1), tối đa LOG_RATE record/giây
+RECV_BATCH_SIZE = metrics.histogram('mcast_bus_recv_batch_size', 'Số gói mỗi lần ghi vào store',
+                                    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+SENT = {k: metrics.counter('mcast_bus_sent_total', 'Message đã gửi', type=k) for k in EVENT_TYPES}
+SEND_ERRORS = metrics.counter('mcast_bus_send_errors_total', 'Message gửi lỗi')
+HTTP_REQUESTS = metrics.counter('mcast_bus_http_requests_total', 'Request HTTP đã xử lý')
+metrics.gauge('mcast_bus_event_seq', 'Seq của event mới nhất', fn=lambda: _store.seq)
 
 
 def add_event(kind: str, message: str, addr=None):
-    item = {
-        't': _now_iso(),
-        'type': kind,
-        'message': str(message or ''),
-        'from': None,
-    }
+    sender = None
     if addr:
         try:
-            item['from'] = f"{addr[0]}:{addr[1]}"
+            sender = f"{addr[0]}:{addr[1]}"
         except Exception:
-            item['from'] = str(addr)
+            sender = str(addr)
+    t = _now_iso()
+
+    with _feed_cond:
+        ev = _store.append(kind, str(message or ''), sender, t)
+        if _log is not None:
+            # put_nowait trong lock: giữ thứ tự seq, ghi đĩa ở thread của EventLog
+            _log.submit([(ev.seq, kind, t, sender, ev.message)])
+        _feed_cond.notify_all()
+    for fn in _feed_listeners:
+        fn()
+
+
+def add_events(batch: list):
+    """Thêm cả lô (kind, message, sender) trong 1 lần giữ lock."""
+    t = _now_iso()
+    records = []
+    with _feed_cond:
+        for kind, message, sender in batch:
+            ev = _store.append(kind, message, sender, t)
+            records.append((ev.seq, kind, t, sender, message))
+        if _log is not None:
+            _log.submit(records)
+        _feed_cond.notify_all()
+    for fn in _feed_listeners:
+        fn()
+
+
+def query_feed(kind: str, limit: int, since: int = -1) -> tuple:
+    """-> (list dict event, cursor cho lần đọc tiếp)."""
+    with _feed_lock:
+        events = _store.query(kind, limit, since)
+        seq = _store.cursor(events, limit, since)
+    return [ev.to_dict() for ev in events], seq
+
 
+def query_history(kind: str, limit: int, before: int) -> tuple:
+    """Trang lịch sử: `limit` event có seq < before; hết RAM thì đọc tiếp từ log."""
     with _feed_lock:
-        _feed.append(item)
+        events = _store.before(kind, limit, before)
+        oldest = _store.oldest(kind)
+        seq = _store.seq
+    items = [ev.to_dict() for ev in events]
+    if len(items) < limit and _log is not None:
+        older_than = items[0]['seq'] if items else min(before, oldest)
+        older = _log.before(older_than, limit - len(items), kind if kind in EVENT_TYPES else None)
+        items = [
+            {'seq': r[0], 't': r[2], 'type': r[1], 'message': r[4], 'from': r[3]} for r in older
+        ] + items
+    return items, seq
+
+
+def open_event_log():
+    """Mở log, nạp LOG_REPLAY event mới nhất vào ring (tìm qua index, không quét cả log)."""
+    global _log
+    _log = EventLog(EVENT_LOG_DIR, LOG_SEGMENT_SIZE, LOG_MAX_BYTES, LOG_MAX_AGE,
+                    queue_size=EVENT_LOG_QUEUE)
+    metrics.gauge('mcast_bus_event_log_queue', 'Lô event chờ ghi log', fn=_log.queue.qsize)
+    metrics.gauge('mcast_bus_event_log_dropped', 'Event bỏ vì queue log đầy', fn=lambda: _log.dropped)
+    records = _log.tail(LOG_REPLAY) if LOG_REPLAY > 0 else []
+    with _feed_lock:
+        for seq, kind, t, sender, message in records:
+            _store.append(kind, message, sender, t, seq)
+        _store.seq = max(_store.seq, _log.last_seq)
+    print(f"💾 [LOG] {EVENT_LOG_DIR}: {len(_log.segments)} segment(s), "
+          f"replayed {len(records)} event(s), last seq={_log.last_seq}")
+
+    def flush_loop():
+        while True:
+            time.sleep(LOG_FLUSH_INTERVAL)
+            _log.flush()
 
+    threading.Thread(target=flush_loop, daemon=True).start()
 
-def listen_multicast():
+
+def wait_events(kind: str, limit: int, since: int, timeout: float) -> tuple:
+    """Chờ tới khi có event seq > since hoặc hết timeout -> (events, cursor)."""
+    with _feed_cond:
+        _feed_cond.wait_for(lambda: _store.seq > since, timeout=timeout)
+        events = _store.query(kind, limit, since)
+        seq = _store.cursor(events, limit, since)
+    return [ev.to_dict() for ev in events], seq
+
+
+def open_multicast_socket() -> socket.socket:
     # Reference
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -60,15 +314,10 @@ def listen_multicast():
     sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
     print(f"📡 [MCAST] Listening {MCAST_GROUP}:{MCAST_PORT}")
-
-    while True:
-        data, addr = sock.recvfrom(8192)
-        msg = data.decode('utf-8', errors='ignore').strip()
-        print(f"📩 [MCAST RECV] {addr}: {msg}")
-        add_event('multicast', msg, addr)
+    return sock
 
 
-def listen_broadcast():
+def open_broadcast_socket() -> socket.socket:
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
@@ -78,80 +327,379 @@ def listen_broadcast():
         sock.bind(('', BCAST_PORT))
 
     print(f"📡 [BCAST] Listening 0.0.0.0:{BCAST_PORT}")
+    return sock
+
+
+def receive_loop(socks: dict, log: bool = BUS_LOG):
+    """1 thread, selectors cho mọi socket: {socket: kind}."""
+    sel = selectors.DefaultSelector()
+    for sock, kind in socks.items():
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+        except OSError:
+            pass
+        sock.setblocking(False)
+        sel.register(sock, selectors.EVENT_READ, kind)
+
+    buf = bytearray(RECV_BUF)
+    mv = memoryview(buf)
+    tag = {'multicast': 'MCAST', 'broadcast': 'BCAST'}
 
     while True:
-        data, addr = sock.recvfrom(8192)
-        msg = data.decode('utf-8', errors='ignore').strip()
-        print(f"📩 [BCAST RECV] {addr}: {msg}")
-        add_event('broadcast', msg, addr)
+        batch = []
+        for key, _mask in sel.select():
+            recv_into = key.fileobj.recvfrom_into
+            kind = key.data
+            # Rút hết gói đang chờ (tối đa RECV_BATCH) rồi mới sang socket khác
+            for _ in range(RECV_BATCH):
+                try:
+                    n, addr = recv_into(buf)
+                except (BlockingIOError, InterruptedError):
+                    break
+                msg = str(mv[:n], 'utf-8', 'ignore').strip()
+                if log:
+                    MSG.info("📩 [%s RECV] %s: %s", tag[kind], addr, msg)
+                batch.append((kind, msg, f"{addr[0]}:{addr[1]}"))
+                RECEIVED[kind].inc()
+                RECEIVED_BYTES.inc(n)
+        if batch:
+            RECV_BATCH_SIZE.observe(len(batch))
+            add_events(batch)
+
+
+class Sender:
+    """Socket UDP gửi, tạo 1 lần lúc khởi động, dùng chung giữa các thread HTTP."""
+
+    def __init__(self, sock: socket.socket, dest: tuple):
+        self.sock = sock
+        self.dest = dest
+        self.lock = threading.Lock()
+
+    def send(self, payload: bytes):
+        with self.lock:
+            self.sock.sendto(payload, self.dest)
+
+    def send_many(self, payloads: list, rate: float = 0.0) -> list:
+        """Gửi lần lượt, rate > 0 thì giãn đều (msg/giây). -> index các message gửi lỗi.
+
+        Lock giữ theo từng message, không cả lô: /send/multicast chen vào giữa
+        1 batch lớn chỉ phải chờ 1 sendto.
+        """
+        failed = []
+        sendto, dest, lock = self.sock.sendto, self.dest, self.lock
+        if rate <= 0:
+            for i, payload in enumerate(payloads):
+                try:
+                    with lock:
+                        sendto(payload, dest)
+                except OSError:
+                    failed.append(i)
+            return failed
+
+        interval = 1.0 / rate
+        next_t = time.monotonic()
+        for i, payload in enumerate(payloads):
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_t += interval
+            try:
+                with lock:
+                    sendto(payload, dest)
+            except OSError:
+                failed.append(i)
+        return failed
+
+
+_senders = {}
+
+
+def open_senders():
+    msock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    msock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MCAST_TTL)
+    _senders['multicast'] = Sender(msock, (MCAST_GROUP, MCAST_PORT))
+
+    bsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    bsock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    _senders['broadcast'] = Sender(bsock, ('255.255.255.255', BCAST_PORT))
 
 
 def send_multicast(message: str):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MCAST_TTL)
-    sock.sendto(str(message).encode('utf-8'), (MCAST_GROUP, MCAST_PORT))
-    sock.close()
+    _senders['multicast'].send(str(message).encode('utf-8'))
+    SENT['multicast'].inc()
 
 
 def send_broadcast(message: str):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    sock.sendto(str(message).encode('utf-8'), ('255.255.255.255', BCAST_PORT))
-    sock.close()
+    _senders['broadcast'].send(str(message).encode('utf-8'))
+    SENT['broadcast'].inc()
+
+
+def send_batch(kind: str, messages: list, rate: float = 0.0) -> tuple:
+    """Kiểm tra rồi gửi cả lô -> (số đã gửi, số lỗi, list lỗi kiểm tra)."""
+    errors = []
+    clean = []
+    payloads = []
+    for i, m in enumerate(messages):
+        msg = str(m if m is not None else '').strip()
+        payload = msg.encode('utf-8')
+        if not msg:
+            errors.append({'index': i, 'error': 'Empty message'})
+        elif len(payload) > MAX_MESSAGE:
+            errors.append({'index': i, 'error': f'Message longer than {MAX_MESSAGE} bytes'})
+        else:
+            clean.append(msg)
+            payloads.append(payload)
+    if errors:
+        return 0, 0, errors
+
+    failed = set(_senders[kind].send_many(payloads, batch_rate(rate)))
+    SENT[kind].inc(len(payloads) - len(failed))
+    SEND_ERRORS.inc(len(failed))
+    # Feed chỉ ghi message đã thực sự ra khỏi socket
+    add_events([(kind, msg, 'self:0') for i, msg in enumerate(clean) if i not in failed])
+    return len(payloads) - len(failed), len(failed), []
+
+
+def batch_rate(rate: float) -> float:
+    """rate client yêu cầu (0 = không giới hạn) sau khi áp trần SEND_RATE của server."""
+    if SEND_RATE > 0:
+        return min(rate, SEND_RATE) if rate > 0 else SEND_RATE
+    return rate
+
+
+def parse_query(qs: str) -> dict:
+    q = {}
+    for part in qs.split('&'):
+        if '=' in part:
+            k, v = part.split('=', 1)
+            q[k] = v
+    return q
+
+
+def feed_params(q: dict, last_event_id=None) -> tuple:
+    kind = (q.get('type') or 'all').lower()
+    try:
+        limit = int(q.get('limit') or '100')
+    except Exception:
+        limit = 100
+    limit = max(1, min(limit, MAX_FEED))
+    try:
+        since = int(q.get('since') or last_event_id or '-1')
+    except Exception:
+        since = -1
+    return kind, limit, since
+
+
+def before_param(q: dict) -> int:
+    try:
+        return int(q.get('before') or '0')
+    except Exception:
+        return 0
+
+
+def wait_params(q: dict) -> float:
+    try:
+        return max(0.0, min(float(q.get('timeout') or MAX_WAIT), MAX_WAIT))
+    except Exception:
+        return MAX_WAIT
+
+
+def current_seq() -> int:
+    with _feed_lock:
+        return _store.seq
+
+
+def json_body(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+_HEALTH_BODY = json_body({
+    'ok': True,
+    'http': HTTP_PORT,
+    'multicast': {'group': MCAST_GROUP, 'port': MCAST_PORT},
+    'broadcast': {'port': BCAST_PORT},
+})
+
+# (kind, limit) -> (seq của store lúc encode, body) cho /feed không có since: mọi client
+# đọc "mới nhất" dùng chung bytes đã encode. Request có since (cursor riêng của từng
+# client) không cache, tránh đẩy các entry dùng chung ra ngoài.
+_feed_cache = {}
+_feed_cache_lock = threading.Lock()
+FEED_CACHE_SIZE = 256
+
+
+def feed_body(kind: str, limit: int, since: int) -> bytes:
+    if since >= 0:
+        items, seq = query_feed(kind, limit, since)
+        return json_body({'ok': True, 'seq': seq, 'items': items})
+
+    key = (kind, limit)
+    with _feed_cache_lock:
+        hit = _feed_cache.get(key)
+    if hit is not None and hit[0] == _store.seq:
+        return hit[1]
+    # Đọc seq trước khi query: có event chen giữa thì entry chỉ bị coi là cũ, không sai
+    current = _store.seq
+    items, seq = query_feed(kind, limit, since)
+    body = json_body({'ok': True, 'seq': seq, 'items': items})
+    with _feed_cache_lock:
+        if len(_feed_cache) >= FEED_CACHE_SIZE:
+            _feed_cache.clear()
+        _feed_cache[key] = (current, body)
+    return body
+
+
+def sse_chunk(items: list) -> bytes:
+    out = []
+    for x in items:
+        data = json.dumps(x, ensure_ascii=False)
+        out.append(f"id: {x['seq']}\nevent: {x['type']}\ndata: {data}\n\n")
+    return ''.join(out).encode('utf-8')
+
+
+def read_json(raw: bytes) -> dict:
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw.decode('utf-8', errors='ignore'))
+    except Exception:
+        return {}
+
+
+def handle_send(path: str, data: dict) -> tuple:
+    """POST /send/* -> (status, dict). None nếu không phải route gửi."""
+    if not isinstance(data, dict):
+        data = {}
+
+    if path in ('/send/multicast', '/send/broadcast'):
+        kind = path.rsplit('/', 1)[1]
+        msg = str(data.get('message') or '').strip()
+        if not msg:
+            return 400, {'ok': False, 'error': 'Missing message'}
+        if len(msg.encode('utf-8')) > MAX_MESSAGE:
+            return 413, {'ok': False, 'error': f'Message longer than {MAX_MESSAGE} bytes'}
+        if kind == 'multicast':
+            send_multicast(msg)
+        else:
+            send_broadcast(msg)
+        add_event(kind, msg, ('self', 0))
+        return 200, {'ok': True}
+
+    if path == '/send/batch':
+        # {"type": "multicast"|"broadcast", "messages": ["..", ..], "rate": msg/giây (tuỳ chọn)}
+        kind = str(data.get('type') or 'multicast').lower()
+        messages = data.get('messages')
+        if kind not in EVENT_TYPES:
+            return 400, {'ok': False, 'error': 'Invalid type'}
+        if not isinstance(messages, list) or not messages:
+            return 400, {'ok': False, 'error': 'Missing messages'}
+        if len(messages) > MAX_SEND_BATCH:
+            return 413, {'ok': False, 'error': f'At most {MAX_SEND_BATCH} messages per batch'}
+        try:
+            rate = float(data.get('rate') or 0)
+        except Exception:
+            return 400, {'ok': False, 'error': 'Invalid rate'}
+        if not math.isfinite(rate) or rate < 0 or 0 < rate < MIN_SEND_RATE:
+            return 400, {'ok': False, 'error': f'rate must be 0 (unlimited) or >= {MIN_SEND_RATE:g} msg/s'}
+        effective = batch_rate(rate)
+        if effective > 0 and len(messages) / effective > MAX_BATCH_SECONDS:
+            return 413, {'ok': False, 'error': f'Batch would take longer than {MAX_BATCH_SECONDS:g}s at {effective:g} msg/s'}
+
+        sent, failed, errors = send_batch(kind, messages, rate)
+        if errors:
+            return 400, {'ok': False, 'error': 'Invalid messages', 'errors': errors[:100]}
+        return 200, {'ok': True, 'sent': sent, 'failed': failed}
+
+    return None
 
 
 class Handler(BaseHTTPRequestHandler):
-    def _json(self, code: int, data):
-        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    # HTTP/1.1: giữ kết nối giữa các request (client gửi 'Connection: close' thì đóng)
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT  # kết nối keep-alive rảnh quá lâu -> đóng, trả thread
+    # header và body ghi 2 lần: không tắt Nagle thì mỗi response trên kết nối giữ lại chờ ~40ms (delayed ACK)
+    disable_nagle_algorithm = True
+
+    def _send(self, code: int, body: bytes, content_type: str = 'application/json; charset=utf-8'):
+        HTTP_REQUESTS.inc()
         self.send_response(code)
-        self.send_header('content-type', 'application/json; charset=utf-8')
+        self.send_header('content-type', content_type)
         self.send_header('content-length', str(len(body)))
+        if self.close_connection:
+            # client gửi 'Connection: close' (hoặc HTTP/1.0 không keep-alive)
+            self.send_header('connection', 'close')
         self.end_headers()
         self.wfile.write(body)
 
+    def _json(self, code: int, data):
+        self._send(code, json_body(data))
+
     def _read_json(self):
         n = int(self.headers.get('content-length') or 0)
         raw = self.rfile.read(n) if n > 0 else b''
-        if not raw:
-            return {}
+        return read_json(raw)
+
+    def _query(self) -> dict:
+        return parse_query(self.path.split('?', 1)[1]) if '?' in self.path else {}
+
+    def _stream(self, kind: str, since: int):
+        """Server-Sent Events: đẩy event mới ngay khi tới, heartbeat khi rảnh."""
+        # Stream không có content-length -> phải đóng kết nối khi kết thúc
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('content-type', 'text/event-stream; charset=utf-8')
+        self.send_header('cache-control', 'no-cache')
+        self.send_header('connection', 'close')
+        self.end_headers()
+        if since < 0:
+            since = current_seq()
+
         try:
-            return json.loads(raw.decode('utf-8', errors='ignore'))
-        except Exception:
-            return {}
+            while True:
+                items, cur = wait_events(kind, MAX_FEED, since, SSE_HEARTBEAT)
+                if cur == since:
+                    self.wfile.write(b': ping\n\n')
+                    self.wfile.flush()
+                    continue
+                since = cur
+                if items:
+                    self.wfile.write(sse_chunk(items))
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
 
     def do_GET(self):
         path = self.path.split('?', 1)[0]
         if path == '/health':
-            return self._json(200, {
-                'ok': True,
-                'http': HTTP_PORT,
-                'multicast': {'group': MCAST_GROUP, 'port': MCAST_PORT},
-                'broadcast': {'port': BCAST_PORT},
-            })
+            return self._send(200, _HEALTH_BODY)
 
-        if path == '/feed':
-            # /feed?type=multicast|broadcast|all&limit=50
-            q = {}
-            if '?' in self.path:
-                qs = self.path.split('?', 1)[1]
-                for part in qs.split('&'):
-                    if '=' in part:
-                        k, v = part.split('=', 1)
-                        q[k] = v
-            kind = (q.get('type') or 'all').lower()
-            try:
-                limit = int(q.get('limit') or '100')
-            except Exception:
-                limit = 100
-            limit = max(1, min(limit, MAX_FEED))
-
-            with _feed_lock:
-                arr = list(_feed)
-
-            if kind in ('multicast', 'broadcast'):
-                arr = [x for x in arr if x.get('type') == kind]
+        if path == '/metrics':
+            return self._send(200, metrics.render().encode('utf-8'), metrics.CONTENT_TYPE)
 
-            return self._json(200, {'ok': True, 'items': arr[-limit:]})
+        if path == '/feed':
+            # /feed?type=multicast|broadcast|all&limit=50&since=<seq>
+            # /feed?before=<seq>&limit=50 -> trang lịch sử cũ hơn (đọc cả log trên đĩa)
+            q = self._query()
+            kind, limit, since = feed_params(q, self.headers.get('last-event-id'))
+            before = before_param(q)
+            if before > 0:
+                items, seq = query_history(kind, limit, before)
+                return self._json(200, {'ok': True, 'seq': seq, 'items': items})
+            return self._send(200, feed_body(kind, limit, since))
+
+        if path == '/feed/wait':
+            # Long-poll: /feed/wait?since=<seq>&timeout=25 -> trả ngay khi có event mới
+            q = self._query()
+            kind, limit, since = feed_params(q, self.headers.get('last-event-id'))
+            if since < 0:
+                since = current_seq()
+            items, seq = wait_events(kind, limit, since, wait_params(q))
+            return self._json(200, {'ok': True, 'seq': seq, 'items': items})
+
+        if path == '/feed/stream':
+            # SSE: /feed/stream?type=...&since=<seq> (hoặc header Last-Event-ID)
+            kind, _limit, since = feed_params(self._query(), self.headers.get('last-event-id'))
+            return self._stream(kind, since)
 
         return self._json(404, {'ok': False, 'error': 'Not found'})
 
@@ -159,37 +707,221 @@ class Handler(BaseHTTPRequestHandler):
         path = self.path.split('?', 1)[0]
         data = self._read_json()
 
-        if path == '/send/multicast':
-            msg = str(data.get('message') or '').strip()
-            if not msg:
-                return self._json(400, {'ok': False, 'error': 'Missing message'})
-            send_multicast(msg)
-            add_event('multicast', msg, ('self', 0))
-            return self._json(200, {'ok': True})
+        res = handle_send(path, data)
+        if res is None:
+            return self._json(404, {'ok': False, 'error': 'Not found'})
+        return self._json(*res)
 
-        if path == '/send/broadcast':
-            msg = str(data.get('message') or '').strip()
-            if not msg:
-                return self._json(400, {'ok': False, 'error': 'Missing message'})
-            send_broadcast(msg)
-            add_event('broadcast', msg, ('self', 0))
-            return self._json(200, {'ok': True})
 
-        return self._json(404, {'ok': False, 'error': 'Not found'})
+class FeedNotifier:
+    """Đánh thức các coroutine đang chờ event mới (gọi được từ thread receiver)."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.waiters = 0
+
+    def wake_threadsafe(self):
+        if self.waiters:
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self.event.set()
+        self.event = asyncio.Event()
+
+    async def wait_events(self, kind: str, limit: int, since: int, timeout: float) -> tuple:
+        """Giống wait_events() nhưng không chặn event loop."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # Tăng waiters trước khi kiểm tra để không lỡ lần đánh thức chen giữa
+        self.waiters += 1
+        try:
+            while True:
+                ev = self.event
+                items, seq = await loop.run_in_executor(None, query_feed, kind, limit, since)
+                remaining = deadline - loop.time()
+                if seq > since or remaining <= 0:
+                    return items, seq
+                try:
+                    async with asyncio.timeout(remaining):
+                        await ev.wait()
+                except TimeoutError:
+                    pass
+        finally:
+            self.waiters -= 1
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+            431: 'Request Header Fields Too Large'}
+
+
+class AsyncHTTP(runtime.StreamHandler):
+    """HTTP/1.1 tối giản trên common.runtime: cùng route với Handler, keep-alive mặc định."""
+
+    def __init__(self):
+        self.notifier = None
+
+    async def started(self):
+        self.notifier = FeedNotifier(asyncio.get_running_loop())
+        _feed_listeners.append(self.notifier.wake_threadsafe)
+
+    @staticmethod
+    def _response(code: int, body: bytes, keep: bool,
+                  content_type: str = 'application/json; charset=utf-8') -> bytes:
+        HTTP_REQUESTS.inc()
+        head = (
+            f"HTTP/1.1 {code} {_REASONS.get(code, 'OK')}\r\n"
+            f"content-type: {content_type}\r\n"
+            f"content-length: {len(body)}\r\n"
+            f"connection: {'keep-alive' if keep else 'close'}\r\n\r\n"
+        )
+        return head.encode('latin-1') + body
+
+    async def _stream(self, writer: asyncio.StreamWriter, kind: str, since: int):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"content-type: text/event-stream; charset=utf-8\r\n"
+            b"cache-control: no-cache\r\n"
+            b"connection: close\r\n\r\n"
+        )
+        if since < 0:
+            since = await asyncio.get_running_loop().run_in_executor(None, current_seq)
+        while True:
+            items, cur = await self.notifier.wait_events(kind, MAX_FEED, since, SSE_HEARTBEAT)
+            if cur == since:
+                writer.write(b': ping\n\n')
+            else:
+                since = cur
+                if items:
+                    writer.write(sse_chunk(items))
+            await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, q: dict, headers: dict, raw: bytes) -> tuple:
+        # Mọi truy vấn feed lấy _feed_lock (receiver / add_event cũng giữ) -> chạy ở thread
+        loop = asyncio.get_running_loop()
+        if method == 'GET':
+            if path == '/health':
+                return 200, _HEALTH_BODY
+            if path == '/feed':
+                kind, limit, since = feed_params(q, headers.get('last-event-id'))
+                before = before_param(q)
+                if before > 0:
+                    items, seq = await loop.run_in_executor(None, query_history, kind, limit, before)
+                    return 200, json_body({'ok': True, 'seq': seq, 'items': items})
+                return 200, await loop.run_in_executor(None, feed_body, kind, limit, since)
+            if path == '/feed/wait':
+                kind, limit, since = feed_params(q, headers.get('last-event-id'))
+                if since < 0:
+                    since = await loop.run_in_executor(None, current_seq)
+                items, seq = await self.notifier.wait_events(kind, limit, since, wait_params(q))
+                return 200, json_body({'ok': True, 'seq': seq, 'items': items})
+        elif method == 'POST' and path.startswith('/send/'):
+            data = read_json(raw)
+            # Mọi route gửi chạy ở thread riêng: batch có thể giãn theo rate (sleep),
+            # sendto có thể chặn và add_event lấy _feed_lock mà thread receiver đang giữ
+            res = await loop.run_in_executor(None, handle_send, path, data)
+            if res is not None:
+                return res[0], json_body(res[1])
+        return 404, json_body({'ok': False, 'error': 'Not found'})
+
+    async def handle(self, conn: runtime.Connection):
+        writer = conn.writer
+        try:
+            while True:
+                try:
+                    # idle timeout của listener = KEEPALIVE_TIMEOUT
+                    head = await conn.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    # Header dài quá MAX_HEADER: báo lỗi rồi đóng, phần còn lại không đọc nữa
+                    writer.write(self._response(431, json_body({'ok': False, 'error': 'Header too large'}), False))
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    writer.write(self._response(400, json_body({'ok': False, 'error': 'Bad request'}), False))
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        k, v = line.split(':', 1)
+                        headers[k.strip().lower()] = v.strip()
+
+                try:
+                    n = int(headers.get('content-length') or 0)
+                except ValueError:
+                    n = -1
+                if n < 0 or n > MAX_BODY:
+                    writer.write(self._response(413, json_body({'ok': False, 'error': 'Bad body size'}), False))
+                    break
+                # Thân cũng tính idle timeout: client gửi dở content-length không giữ được kết nối
+                raw = await conn.readexactly(n) if n else b''
+
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.1':
+                    keep = connection != 'close'
+                else:
+                    keep = connection == 'keep-alive'
+
+                path, _, qs = target.partition('?')
+                q = parse_query(qs)
+                if method == 'GET' and path == '/feed/stream':
+                    kind, _limit, since = feed_params(q, headers.get('last-event-id'))
+                    await self._stream(writer, kind, since)
+                    break
+
+                if method == 'GET' and path == '/metrics':
+                    writer.write(self._response(200, metrics.render().encode('utf-8'), keep, metrics.CONTENT_TYPE))
+                else:
+                    code, body = await self._dispatch(method, path, q, headers, raw)
+                    writer.write(self._response(code, body, keep))
+                if writer.transport.get_write_buffer_size() > 64 * 1024:
+                    await writer.drain()
+                if not keep:
+                    break
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+
+def serve_http_async():
+    server = runtime.Server()
+    server.add_tcp(AsyncHTTP(), HTTP_PORT, HOST, name='mcast-bus-http',
+                   idle_timeout=KEEPALIVE_TIMEOUT, limit=MAX_HEADER)
+    print('⚡ HTTP async mode (1 event loop, keep-alive)')
+    # 1 process: receiver / flush log là thread nền (không sống qua fork) và
+    # EventStore nằm trong RAM của process, worker khác sẽ thấy feed rỗng
+    runtime.serve(server, workers=1)
 
 
 def main():
     print('🚀 Starting Broadcast & Multicast Bus...')
     print(f"🌐 HTTP: http://{HOST}:{HTTP_PORT}")
 
-    threading.Thread(target=listen_multicast, daemon=True).start()
-    threading.Thread(target=listen_broadcast, daemon=True).start()
+    if EVENT_LOG_DIR:
+        open_event_log()
+
+    socks = {
+        open_multicast_socket(): 'multicast',
+        open_broadcast_socket(): 'broadcast',
+    }
+    threading.Thread(target=receive_loop, args=(socks,), daemon=True).start()
+    open_senders()
 
-    httpd = ThreadingHTTPServer((HOST, HTTP_PORT), Handler)
     try:
-        httpd.serve_forever()
+        if HTTP_MODE == 'async':
+            serve_http_async()
+        else:
+            httpd = ThreadingHTTPServer((HOST, HTTP_PORT), Handler)
+            httpd.serve_forever()
     except KeyboardInterrupt:
         print('🛑 Stopping...')
+    finally:
+        if _log is not None:
+            _log.close()
 
 
 if __name__ == '__main__':
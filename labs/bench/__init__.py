@@ -0,0 +1,12 @@
+"""Load generator / benchmark cho các lab server.
+
+Chạy từ thư mục labs/ (mặc định nhắm vào 127.0.0.1):
+
+    python -m bench tcp   --connections 2000 --duration 10 --size 64 --pipeline 8
+    python -m bench tls   --connections 500
+    python -m bench async --connections 5000 --json out.json
+    python -m bench udp   --connections 64 --pipeline 16
+    python -m bench file  --connections 16 --size 8388608
+
+Kết quả: throughput + latency p50/p95/p99/p99.9 (text, và JSON nếu có --json).
+"""
@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+
+from bench import echo, filexfer, udp
+from bench.report import format_text, write_json
+from common.limits import raise_fd_limit
+
+
+def parse_args():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--host", default="127.0.0.1")
+    common.add_argument("--port", type=int, default=None, help="mặc định theo target")
+    common.add_argument("-c", "--connections", type=int, default=100,
+                        help="số kết nối / socket / upload đồng thời")
+    common.add_argument("-d", "--duration", type=float, default=10.0, help="thời gian đo (giây)")
+    common.add_argument("--timeout", type=float, default=5.0, help="timeout mỗi request (giây)")
+    common.add_argument("--json", metavar="PATH", help="ghi kết quả JSON ('-' = stdout)")
+
+    p = argparse.ArgumentParser(prog="python -m bench", description="Load generator cho các lab server")
+    sub = p.add_subparsers(dest="target", required=True)
+
+    for name in ("tcp", "tls", "async"):
+        sp = sub.add_parser(name, parents=[common], help=f"{name} echo server")
+        sp.add_argument("-s", "--size", type=int, default=64, help="kích thước message (byte)")
+        sp.add_argument("-p", "--pipeline", type=int, default=1, help="số dòng gửi liền trước khi chờ reply")
+        sp.add_argument("--connect-concurrency", type=int, default=200,
+                        help="số connect/handshake chạy song song khi mở kết nối")
+        if name == "tls":
+            sp.add_argument("--ca", help="CA cert (mặc định 07-tls/cert/server.crt)")
+            sp.add_argument("--insecure", action="store_true", help="không verify cert")
+        else:
+            sp.set_defaults(ca=None, insecure=False)
+
+    sp = sub.add_parser("udp", parents=[common], help="UDP ping server")
+    sp.add_argument("-s", "--size", type=int, default=64, help="kích thước datagram (byte)")
+    sp.add_argument("-p", "--pipeline", type=int, default=8, help="số ping đang bay mỗi socket")
+
+    sp = sub.add_parser("file", parents=[common], help="file-transfer server")
+    sp.add_argument("-s", "--size", type=int, default=1024 * 1024, help="kích thước mỗi file upload (byte)")
+    sp.set_defaults(connections=8)
+
+    return p.parse_args()
+
+
+async def run(args):
+    if args.target == "udp":
+        return await udp.run(args)
+    if args.target == "file":
+        return await filexfer.run(args)
+    return await echo.run(args.target, args)
+
+
+def main():
+    args = parse_args()
+    raise_fd_limit()
+    res = asyncio.run(run(args))
+    d = res.to_dict()
+    print(format_text(d))
+    if args.json:
+        write_json(d, args.json)
+
+
+if __name__ == "__main__":
+    main()
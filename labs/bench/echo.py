@@ -0,0 +1,109 @@
+"""Benchmark các echo server theo dòng: TCP (01), asyncio (05), TLS (07)."""
+
+import asyncio
+import ssl
+import time
+from pathlib import Path
+
+from bench.report import Result
+
+LABS_DIR = Path(__file__).resolve().parent.parent
+
+# welcome_lines: số dòng chào server gửi ngay khi kết nối
+TARGETS = {
+    "tcp": {"port": 9001, "welcome_lines": 1, "tls": False},
+    "tls": {"port": 9443, "welcome_lines": 1, "tls": True},
+    "async": {"port": 9005, "welcome_lines": 3, "tls": False},
+}
+
+DEFAULT_CA = LABS_DIR / "07-tls" / "cert" / "server.crt"
+
+
+def make_ssl_context(cafile=None, insecure: bool = False) -> ssl.SSLContext:
+    ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+    if insecure:
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    else:
+        ctx.load_verify_locations(str(cafile or DEFAULT_CA))
+    return ctx
+
+
+async def _connect(args, spec, ssl_ctx, res: Result, sem: asyncio.Semaphore):
+    async with sem:
+        try:
+            async with asyncio.timeout(args.timeout):
+                reader, writer = await asyncio.open_connection(
+                    args.host, args.port,
+                    ssl=ssl_ctx,
+                    server_hostname="localhost" if ssl_ctx else None,
+                    limit=max(64 * 1024, args.size * 2),
+                )
+                for _ in range(spec["welcome_lines"]):
+                    await reader.readline()
+        except (OSError, asyncio.TimeoutError):
+            res.connect_errors += 1
+            return None
+    res.connections += 1
+    return reader, writer
+
+
+async def _run_conn(conn, args, res: Result, deadline: float):
+    reader, writer = conn
+    payload = b"x" * args.size + b"\n"
+    batch = payload * args.pipeline
+    min_reply = args.size + 1
+
+    try:
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter_ns()
+            writer.write(batch)
+            res.bytes_out += len(batch)
+            async with asyncio.timeout(args.timeout):
+                for _ in range(args.pipeline):
+                    line = await reader.readline()
+                    if not line:
+                        raise ConnectionError("server closed connection")
+                    res.bytes_in += len(line)
+                    if len(line) < min_reply:
+                        res.errors += 1
+                        continue
+                    res.latency.record((time.perf_counter_ns() - t0) // 1000)
+                    res.requests += 1
+    except asyncio.TimeoutError:
+        res.timeouts += 1
+    except OSError:
+        res.errors += 1
+    finally:
+        try:
+            writer.write(b"quit\n")
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+
+async def run(target: str, args) -> Result:
+    spec = TARGETS[target]
+    if args.port is None:
+        args.port = spec["port"]
+    ssl_ctx = make_ssl_context(args.ca, args.insecure) if spec["tls"] else None
+
+    res = Result(target, {
+        "host": args.host, "port": args.port, "connections": args.connections,
+        "duration": args.duration, "size": args.size, "pipeline": args.pipeline,
+    })
+
+    # Pha 1: mở kết nối (giới hạn số connect đồng thời để không ngập SYN backlog)
+    sem = asyncio.Semaphore(args.connect_concurrency)
+    conns = await asyncio.gather(*(
+        _connect(args, spec, ssl_ctx, res, sem) for _ in range(args.connections)
+    ))
+    conns = [c for c in conns if c]
+
+    # Pha 2: đo trong đúng `duration` giây
+    res.started = time.monotonic()
+    deadline = res.started + args.duration
+    await asyncio.gather(*(_run_conn(c, args, res, deadline) for c in conns))
+    res.finish()
+    return res
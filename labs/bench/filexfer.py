@@ -0,0 +1,89 @@
+"""Benchmark file-transfer server (03): nhiều upload đồng thời, lặp đến hết giờ.
+
+Lưu ý: server lưu mọi file vào uploads/ (bench_*.bin) - nhớ xoá sau khi đo.
+"""
+
+import asyncio
+import time
+
+from bench.report import Result
+
+DEFAULT_PORT = 9003
+CHUNK = 256 * 1024
+
+
+class UploadFailed(Exception):
+    pass
+
+
+async def _upload(worker: int, n: int, args, res: Result, chunk: bytes):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    try:
+        async with asyncio.timeout(args.timeout):
+            ready = (await reader.readline()).strip()
+            if ready != b"READY":
+                raise UploadFailed(f"server not ready: {ready!r}")
+            writer.write(f"FILENAME:bench_{worker}_{n}.bin\nSIZE:{args.size}\n".encode())
+            ok = (await reader.readline()).strip()
+            if ok != b"OK":
+                raise UploadFailed(f"server refused: {ok!r}")
+
+        left = args.size
+        while left > 0:
+            part = chunk if left >= len(chunk) else chunk[:left]
+            writer.write(part)
+            await writer.drain()
+            left -= len(part)
+            res.bytes_out += len(part)
+
+        async with asyncio.timeout(args.timeout):
+            done = (await reader.readline()).strip()
+        if done != b"DONE":
+            raise UploadFailed(f"upload failed: {done!r}")
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+
+async def _worker(worker: int, args, res: Result, deadline: float):
+    chunk = b"\0" * CHUNK
+    n = 0
+    connected = False
+    while time.monotonic() < deadline:
+        t0 = time.perf_counter_ns()
+        try:
+            await _upload(worker, n, args, res, chunk)
+        except asyncio.TimeoutError:
+            res.timeouts += 1
+            continue
+        except UploadFailed:
+            res.errors += 1
+            continue
+        except OSError:
+            if not connected:
+                res.connect_errors += 1
+                return
+            res.errors += 1
+            continue
+        if not connected:
+            connected = True
+            res.connections += 1
+        res.latency.record((time.perf_counter_ns() - t0) // 1000)
+        res.requests += 1
+        n += 1
+
+
+async def run(args) -> Result:
+    if args.port is None:
+        args.port = DEFAULT_PORT
+    res = Result("file", {
+        "host": args.host, "port": args.port, "uploads": args.connections,
+        "duration": args.duration, "size": args.size,
+    })
+    deadline = res.started + args.duration
+    await asyncio.gather(*(_worker(i, args, res, deadline) for i in range(args.connections)))
+    res.finish()
+    return res
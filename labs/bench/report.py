@@ -0,0 +1,78 @@
+"""Gom số liệu của 1 lần chạy benchmark và in ra text / JSON."""
+
+import json
+import time
+
+from common.histogram import Histogram
+
+
+class Result:
+    """Số liệu dùng chung cho mọi loại target."""
+
+    def __init__(self, target: str, params: dict):
+        self.target = target
+        self.params = params
+        self.latency = Histogram()  # micro giây
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.connect_errors = 0
+        self.connections = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = max(time.monotonic() - self.started, 1e-9)
+
+    def to_dict(self) -> dict:
+        el = self.elapsed or 1e-9
+        return {
+            "target": self.target,
+            "params": self.params,
+            "elapsed_s": round(self.elapsed, 3),
+            "connections": self.connections,
+            "connect_errors": self.connect_errors,
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "throughput": {
+                "req_per_s": round(self.requests / el, 1),
+                "mb_out_per_s": round(self.bytes_out / el / 1e6, 3),
+                "mb_in_per_s": round(self.bytes_in / el / 1e6, 3),
+            },
+            "latency_us": self.latency.summary(),
+        }
+
+
+def format_text(d: dict) -> str:
+    lat = d["latency_us"]
+    tp = d["throughput"]
+    params = " ".join(f"{k}={v}" for k, v in d["params"].items())
+
+    def ms(us):
+        return f"{us / 1000:.3f}"
+
+    lines = [
+        f"====== BENCH {d['target'].upper()} ======",
+        f"Params      : {params}",
+        f"Elapsed     : {d['elapsed_s']:.2f}s",
+        f"Connections : ok={d['connections']} failed={d['connect_errors']}",
+        f"Requests    : {d['requests']} (errors={d['errors']}, timeouts={d['timeouts']})",
+        f"Throughput  : {tp['req_per_s']:.1f} req/s | out {tp['mb_out_per_s']:.3f} MB/s | in {tp['mb_in_per_s']:.3f} MB/s",
+        f"Latency(ms) : min={ms(lat['min'])} mean={ms(lat['mean'])} max={ms(lat['max'])}",
+        f"              p50={ms(lat['p50'])} p95={ms(lat['p95'])} p99={ms(lat['p99'])} p99.9={ms(lat['p99.9'])}",
+        "=" * 28,
+    ]
+    return "\n".join(lines)
+
+
+def write_json(d: dict, path: str):
+    """path='-' -> in ra stdout."""
+    body = json.dumps(d, ensure_ascii=False, indent=2)
+    if path == "-":
+        print(body)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(body + "\n")
@@ -0,0 +1,75 @@
+"""Benchmark UDP ping server (02): nhiều socket, mỗi socket `pipeline` ping đang bay."""
+
+import asyncio
+import re
+import time
+
+from bench.report import Result
+
+DEFAULT_PORT = 9002
+
+SEQ_RE = re.compile(rb"seq=(\d+)")
+
+
+class _PingProtocol(asyncio.DatagramProtocol):
+    def __init__(self, res: Result):
+        self.res = res
+        self.waiters = {}  # seq -> Future
+
+    def datagram_received(self, data, addr):
+        self.res.bytes_in += len(data)
+        m = SEQ_RE.search(data)
+        fut = self.waiters.pop(int(m.group(1)), None) if m else None
+        if fut is not None and not fut.done():
+            fut.set_result(time.perf_counter_ns())
+
+    def error_received(self, exc):
+        self.res.errors += 1
+
+
+async def _sender(idx: int, args, res: Result, deadline: float):
+    loop = asyncio.get_running_loop()
+    transport, proto = await loop.create_datagram_endpoint(
+        lambda: _PingProtocol(res), remote_addr=(args.host, args.port)
+    )
+    res.connections += 1
+    seq = idx * 1_000_000_000
+
+    try:
+        while time.monotonic() < deadline:
+            sent = []
+            for _ in range(args.pipeline):
+                seq += 1
+                msg = b"PING seq=%d " % seq
+                msg = msg.ljust(args.size, b"x")
+                fut = loop.create_future()
+                proto.waiters[seq] = fut
+                t0 = time.perf_counter_ns()
+                transport.sendto(msg)
+                res.bytes_out += len(msg)
+                sent.append((seq, t0, fut))
+
+            done, _pending = await asyncio.wait([f for _s, _t, f in sent], timeout=args.timeout)
+            for s, t0, fut in sent:
+                if fut in done:
+                    res.latency.record((fut.result() - t0) // 1000)
+                    res.requests += 1
+                else:
+                    proto.waiters.pop(s, None)
+                    fut.cancel()
+                    res.timeouts += 1
+    finally:
+        transport.close()
+
+
+async def run(args) -> Result:
+    if args.port is None:
+        args.port = DEFAULT_PORT
+    res = Result("udp", {
+        "host": args.host, "port": args.port, "sockets": args.connections,
+        "duration": args.duration, "size": args.size, "pipeline": args.pipeline,
+    })
+    deadline = res.started + args.duration
+    await asyncio.gather(*(_sender(i, args, res, deadline) for i in range(args.connections)))
+    res.finish()
+    return res
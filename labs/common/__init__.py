@@ -0,0 +1,6 @@
+"""Code dùng chung cho các lab server (framing, ...).
+
+Các script trong labs/<lab>/ thêm thư mục labs/ vào sys.path rồi
+`from common.<module> import ...`; trong Docker, thư mục common/ được copy
+cạnh server.py nên import trực tiếp được.
+"""
@@ -0,0 +1,118 @@
+"""Kiểm soát nhận kết nối (admission) ngay sau accept().
+
+Server nhận kết nối mới chỉ khi cả 3 điều kiện còn thỏa:
+  - tổng số kết nối đang mở < MAX_CONNECTIONS
+  - số kết nối của cùng IP < MAX_PER_IP            (0 = không giới hạn)
+  - token bucket ACCEPT_RATE kết nối/giây, burst ACCEPT_BURST (0 = không giới hạn)
+
+Không đạt -> trả lời ngắn (vd. b"BUSY\\n") rồi đóng ngay trong thread accept,
+không tạo thread / task cho client đó. Mỗi lần từ chối được đếm theo lý do
+(admission_rejected_total{server,reason}).
+
+    admission = Admission("tcp-echo")
+    conn, addr = sock.accept()
+    if admission.admit(addr):
+        threading.Thread(target=handle, args=(conn, addr)).start()  # handle gọi release(addr)
+    else:
+        reject(conn, BUSY)
+"""
+
+import os
+import socket
+import threading
+import time
+
+from . import metrics
+
+MAX_CONNECTIONS = int(os.getenv("MAX_CONNECTIONS", "20000"))
+MAX_PER_IP = int(os.getenv("MAX_PER_IP", "0"))
+ACCEPT_RATE = float(os.getenv("ACCEPT_RATE", "0"))
+ACCEPT_BURST = int(os.getenv("ACCEPT_BURST", "0"))  # 0 = bằng ACCEPT_RATE
+LISTEN_BACKLOG = int(os.getenv("LISTEN_BACKLOG", "1024"))
+
+BUSY = b"BUSY\n"
+REASONS = ("total", "per_ip", "rate")
+
+
+class TokenBucket:
+    """rate token/giây, tối đa burst token. Gọi từ 1 thread (hoặc dưới lock)."""
+
+    def __init__(self, rate: float, burst: float = 0):
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class Admission:
+    def __init__(self, name: str, max_total: int = MAX_CONNECTIONS, max_per_ip: int = MAX_PER_IP,
+                 rate: float = ACCEPT_RATE, burst: int = ACCEPT_BURST):
+        self.name = name
+        self.max_total = max_total
+        self.max_per_ip = max_per_ip
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.lock = threading.Lock()
+        self.total = 0
+        self.per_ip = {}
+        self.rejected = {
+            reason: metrics.counter("admission_rejected_total", "Kết nối bị từ chối ngay sau accept",
+                                    server=name, reason=reason)
+            for reason in REASONS
+        }
+        metrics.gauge("admission_connections", "Kết nối đang được nhận", fn=lambda: self.total, server=name)
+
+    def check(self, addr):
+        """-> None nếu nhận (đã tính vào tổng, nhớ gọi release), ngược lại là lý do từ chối."""
+        ip = addr[0] if isinstance(addr, tuple) else addr
+        with self.lock:
+            if self.max_total and self.total >= self.max_total:
+                reason = "total"
+            elif self.max_per_ip and self.per_ip.get(ip, 0) >= self.max_per_ip:
+                reason = "per_ip"
+            elif self.bucket is not None and not self.bucket.take():
+                reason = "rate"
+            else:
+                self.total += 1
+                self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+                return None
+        self.rejected[reason].inc()
+        return reason
+
+    def admit(self, addr) -> bool:
+        return self.check(addr) is None
+
+    def release(self, addr):
+        ip = addr[0] if isinstance(addr, tuple) else addr
+        with self.lock:
+            self.total -= 1
+            n = self.per_ip.get(ip, 0) - 1
+            if n > 0:
+                self.per_ip[ip] = n
+            else:
+                self.per_ip.pop(ip, None)
+
+    def describe(self) -> str:
+        rate = f"{self.bucket.rate:g}/s burst {self.bucket.burst:g}" if self.bucket else "off"
+        return f"max {self.max_total or '∞'}, per IP {self.max_per_ip or '∞'}, rate {rate}"
+
+
+def reject(sock: socket.socket, reply: bytes = BUSY):
+    """Trả lời (nếu có) mà không chặn rồi đóng. reply rỗng -> đóng luôn (vd. TLS)."""
+    try:
+        if reply:
+            sock.setblocking(False)
+            sock.send(reply)
+    except OSError:
+        pass
+    finally:
+        sock.close()
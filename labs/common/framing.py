@@ -0,0 +1,121 @@
+"""Tách luồng byte TCP thành các dòng / khung hoàn chỉnh.
+
+TCP là stream: 1 lần recv() có thể chứa nhiều dòng (client pipeline) hoặc
+chỉ một phần của dòng. LineReader giữ lại phần dư giữa các lần recv để mỗi
+dòng được xử lý đúng 1 lần, đúng thứ tự. SocketReader làm điều tương tự cho
+socket blocking: đọc header theo dòng / theo số byte mà không recv(1), phần
+byte thừa sau header được giữ lại cho pha đọc dữ liệu. reply_lines() là giao
+thức echo theo dòng dùng chung cho lab 01 / 05 / 07.
+"""
+
+import socket
+
+MAX_LINE = 64 * 1024
+QUIT_WORDS = ("quit", "exit", "q")
+
+
+class LineTooLong(ValueError):
+    pass
+
+
+def reply_lines(lines: list, prefix: bytes = b"ECHO: ", bye: bytes = b"Bye!\n", on_message=None) -> tuple:
+    """Giao thức echo theo dòng của các lab: mỗi dòng -> prefix + dòng, quit/exit/q -> bye.
+
+    Trả lời cả lô theo thứ tự -> (bytes gửi 1 lần, client đã quit?); các dòng sau
+    lệnh quit bị bỏ. on_message(msg) được gọi với từng dòng đã giải mã (vd. để log).
+    """
+    out = []
+    for line in lines:
+        msg = line.decode("utf-8", errors="ignore").strip()
+        if on_message is not None:
+            on_message(msg)
+        if msg.lower() in QUIT_WORDS:
+            out.append(bye)
+            return b"".join(out), True
+        out.append(prefix + msg.encode("utf-8") + b"\n")
+    return b"".join(out), False
+
+
+class LineReader:
+    """Buffer dòng: feed(bytes) -> list các dòng đã đủ '\\n' (không kèm '\\n')."""
+
+    __slots__ = ("_buf", "max_line")
+
+    def __init__(self, max_line: int = MAX_LINE):
+        self._buf = bytearray()
+        self.max_line = max_line
+
+    def feed(self, data: bytes) -> list:
+        if b"\n" not in data:
+            self._buf += data
+            if len(self._buf) > self.max_line:
+                raise LineTooLong(f"Line longer than {self.max_line} bytes")
+            return []
+
+        if self._buf:
+            self._buf += data
+            data = bytes(self._buf)
+        lines = data.split(b"\n")
+        rest = lines.pop()
+        self._buf = bytearray(rest)
+        if len(rest) > self.max_line:
+            raise LineTooLong(f"Line longer than {self.max_line} bytes")
+        return lines
+
+    @property
+    def pending(self) -> int:
+        """Số byte của dòng dở dang đang chờ '\\n'."""
+        return len(self._buf)
+
+
+class SocketReader:
+    """Đọc có buffer trên 1 socket blocking: readline(), readexactly(), peek()."""
+
+    def __init__(self, sock: socket.socket, bufsize: int = 64 * 1024, max_line: int = MAX_LINE):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.max_line = max_line
+        self._buf = bytearray()
+
+    def _fill(self, what: str):
+        data = self.sock.recv(self.bufsize)
+        if not data:
+            raise ConnectionError(f"Peer disconnected while reading {what}.")
+        self._buf += data
+
+    def readline(self) -> bytes:
+        """1 dòng, không kèm '\\n'."""
+        start = 0
+        while True:
+            nl = self._buf.find(b"\n", start)
+            if nl >= 0:
+                line = bytes(self._buf[:nl])
+                del self._buf[:nl + 1]
+                return line
+            start = len(self._buf)
+            if start > self.max_line:
+                raise LineTooLong(f"Line longer than {self.max_line} bytes")
+            self._fill("line")
+
+    def readexactly(self, n: int) -> bytes:
+        while len(self._buf) < n:
+            self._fill(f"{n} bytes")
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+    def peek(self, n: int) -> bytes:
+        """Xem trước n byte đầu mà không lấy ra."""
+        while len(self._buf) < n:
+            self._fill(f"{n} bytes")
+        return bytes(self._buf[:n])
+
+    def take_buffered(self, max_n: int) -> bytes:
+        """Lấy ra tối đa max_n byte đang có sẵn trong buffer (không recv thêm)."""
+        data = bytes(self._buf[:max_n])
+        del self._buf[:max_n]
+        return data
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buf)
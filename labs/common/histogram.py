@@ -0,0 +1,89 @@
+"""Histogram độ trễ kiểu HDR (log-linear).
+
+Giá trị (số nguyên, thường là micro giây) được gom vào bucket có độ rộng tăng
+theo luỹ thừa 2, mỗi nhóm chia thành 2^(bits-1) bucket con. Sai số tương đối
+của percentile luôn <= 1 / 2^(bits-1) (bits=7 -> ~1.6%), bộ nhớ cố định theo
+số bucket thay vì theo số mẫu nên ghi được hàng triệu mẫu.
+"""
+
+
+class Histogram:
+    __slots__ = ("bits", "_half", "_linear", "counts", "count", "total", "min", "max")
+
+    def __init__(self, bits: int = 7):
+        self.bits = bits
+        self._half = 1 << (bits - 1)
+        self._linear = 1 << bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value: int) -> int:
+        if value < self._linear:
+            return value
+        shift = value.bit_length() - self.bits
+        return self._linear + (shift - 1) * self._half + ((value >> shift) - self._half)
+
+    def _upper(self, idx: int) -> int:
+        """Giá trị lớn nhất thuộc bucket idx."""
+        if idx < self._linear:
+            return idx
+        shift, sub = divmod(idx - self._linear, self._half)
+        shift += 1
+        return ((self._half + sub + 1) << shift) - 1
+
+    def record(self, value: int, n: int = 1):
+        value = max(0, int(value))
+        idx = self._index(value)
+        self.counts[idx] = self.counts.get(idx, 0) + n
+        self.count += n
+        self.total += value * n
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        if other.bits != self.bits:
+            raise ValueError("Cannot merge histograms with different precision")
+        for idx, n in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + n
+        self.count += other.count
+        self.total += other.total
+        for v in (other.min, other.max):
+            if v is not None:
+                self.min = v if self.min is None else min(self.min, v)
+                self.max = v if self.max is None else max(self.max, v)
+
+    def percentile(self, p: float) -> int:
+        """Giá trị tại percentile p (0..100), 0 nếu chưa có mẫu."""
+        if not self.count:
+            return 0
+        rank = max(1, int(round(p / 100.0 * self.count)))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                return min(self._upper(idx), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def buckets(self):
+        """[(giá trị trên của bucket, số mẫu)] theo thứ tự tăng dần."""
+        return [(self._upper(idx), self.counts[idx]) for idx in sorted(self.counts)]
+
+    def summary(self, percentiles=(50, 95, 99, 99.9)) -> dict:
+        out = {
+            "count": self.count,
+            "min": self.min or 0,
+            "mean": round(self.mean, 1),
+            "max": self.max or 0,
+        }
+        for p in percentiles:
+            out[f"p{p:g}"] = self.percentile(p)
+        return out
@@ -0,0 +1,15 @@
+"""Giới hạn tài nguyên của process."""
+
+
+def raise_fd_limit():
+    """Nâng soft limit RLIMIT_NOFILE lên hard limit (cần cho 10k+ kết nối)."""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
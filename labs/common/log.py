@@ -0,0 +1,246 @@
+"""Log không chặn cho các lab server (dựa trên module logging chuẩn).
+
+Thread gọi log chỉ tạo record rồi put_nowait() vào 1 queue giới hạn; 1 thread
+nền lấy cả lô, format và ghi stdout 1 lần. stdout / log driver của docker
+chậm thì queue đầy -> record bị bỏ và đếm vào log_dropped_total, không bao
+giờ chặn vòng echo.
+
+    from common import log
+    LOG = log.get("tcp-echo")                 # sự kiện theo kết nối
+    MSG = log.sampled("tcp-echo.msg")         # mỗi dòng / datagram: tối đa LOG_RATE/giây
+    LOG.info("✅ [CONNECT] %s", addr)          # %-format, chỉ chạy ở thread ghi log
+    MSG.info("📩 [RECV] %s: %s", addr, msg)   # vượt rate -> không tạo record, chỉ đếm
+
+Args truyền cho log phải là giá trị không đổi (str, số, tuple): record được
+format sau, ở thread khác.
+
+Env: LOG_LEVEL (INFO), LOG_FORMAT (text | json), LOG_QUEUE (số record tối đa
+đang chờ), LOG_RATE / LOG_BURST (record/giây cho logger sampled, 0 = không giới hạn),
+LOG_FAST=1 (record không ghi thread / process, xem setup()).
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+
+from . import metrics
+from .admission import TokenBucket
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_QUEUE = int(os.getenv("LOG_QUEUE", "10000"))
+LOG_RATE = float(os.getenv("LOG_RATE", "100"))
+LOG_BURST = int(os.getenv("LOG_BURST", "0"))
+LOG_FAST = os.getenv("LOG_FAST", "0") == "1"
+BATCH = 512  # số record tối đa ghi trong 1 lần write()
+
+DROPPED = metrics.counter("log_dropped_total", "Record bị bỏ vì queue log đầy")
+
+# Thuộc tính có sẵn của LogRecord; phần còn lại (extra=...) là field riêng
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class TextFormatter(logging.Formatter):
+    """Giữ nguyên dạng cũ của print(): chỉ message (có emoji), thêm số record bị lược."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" (+{suppressed} suppressed)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """1 dòng JSON / record: ts, level, logger, msg + các field truyền qua extra=."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                doc[key] = value
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class QueueHandler(logging.Handler):
+    """emit() = put_nowait(); không format, không lấy lock của handler."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__()
+        self.queue = q
+
+    def handle(self, record: logging.LogRecord):
+        # Bỏ qua self.lock của logging.Handler: queue.Queue đã thread-safe
+        if self.filter(record):
+            self.emit(record)
+            return True
+        return False
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+
+class Writer(threading.Thread):
+    """Lấy record theo lô từ queue, format rồi ghi stream 1 lần cho cả lô."""
+
+    def __init__(self, q: queue.Queue, stream, formatter: logging.Formatter):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = q
+        self.stream = stream
+        self.formatter = formatter
+
+    def run(self):
+        q = self.queue
+        while True:
+            batch = [q.get()]
+            while len(batch) < BATCH:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            stop = False
+            for record in batch:
+                if record is None:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.formatter.format(record))
+                except Exception as e:
+                    lines.append(f"⚠️ [LOG] cannot format {record.msg!r}: {e}")
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                except (OSError, ValueError):
+                    pass  # stdout đã đóng / pipe gãy: không để thread log chết kéo theo server
+            if stop:
+                return
+
+
+class Sampled:
+    """Bọc logger cho sự kiện theo từng message: vượt rate thì không tạo record.
+
+    Kiểm tra level trước, rồi mới lấy token; record đầu tiên được ghi sau 1
+    khoảng bị lược mang theo số record đã bỏ (record.suppressed).
+    """
+
+    def __init__(self, logger: logging.Logger, rate: float = LOG_RATE, burst: int = LOG_BURST):
+        self.logger = logger
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.lock = threading.Lock()
+        self.skipped = 0
+        self.suppressed = metrics.counter("log_suppressed_total", "Record bị lược do vượt LOG_RATE",
+                                          logger=logger.name)
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level: int, msg: str, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        if self.bucket is None:
+            self.logger.log(level, msg, *args)
+            return
+        with self.lock:
+            if not self.bucket.take():
+                self.skipped += 1
+                skipped = -1
+            else:
+                skipped, self.skipped = self.skipped, 0
+        if skipped < 0:
+            self.suppressed.inc()
+        elif skipped:
+            self.logger.log(level, msg, *args, extra={"suppressed": skipped})
+        else:
+            self.logger.log(level, msg, *args)
+
+    def debug(self, msg: str, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg: str, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def warning(self, msg: str, *args):
+        self.log(logging.WARNING, msg, *args)
+
+
+_state = {"handler": None, "writer": None}
+_setup_lock = threading.Lock()
+
+
+def _start_writer(handler: QueueHandler):
+    handler.queue = queue.Queue(LOG_QUEUE)
+    writer = Writer(handler.queue, sys.stdout, handler.formatter)
+    writer.start()
+    _state["writer"] = writer
+
+
+def _after_fork():
+    # Thread ghi log không sống qua fork(): worker con cần queue + thread riêng
+    if _state["handler"] is not None:
+        _start_writer(_state["handler"])
+
+
+def setup(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, fast: bool = LOG_FAST) -> QueueHandler:
+    """Gắn QueueHandler vào root logger (1 lần / process), gọi tự động bởi get().
+
+    fast=True: record không lấy thread / process id (mục "Optimization" trong
+    Logging HOWTO). Các cờ này là của cả process, mọi logger khác cũng mất
+    %(thread)s / %(process)s, nên chỉ bật khi process chỉ log qua module này.
+    """
+    with _setup_lock:
+        if _state["handler"] is not None:
+            return _state["handler"]
+        if fast:
+            logging.logThreads = False
+            logging.logProcesses = False
+            logging.logMultiprocessing = False
+
+        handler = QueueHandler(None)
+        handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter("%(message)s"))
+        _start_writer(handler)
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(level)
+        _state["handler"] = handler
+        metrics.gauge("log_queue_depth", "Record đang chờ ghi", fn=lambda: handler.queue.qsize())
+        os.register_at_fork(after_in_child=_after_fork)
+        atexit.register(shutdown)
+        return handler
+
+
+def shutdown(timeout: float = 2.0):
+    """Ghi nốt record còn trong queue (gọi trước os._exit / khi thoát)."""
+    handler, writer = _state["handler"], _state["writer"]
+    if handler is None or writer is None or not writer.is_alive():
+        return
+    try:
+        handler.queue.put(None, timeout=timeout)
+    except queue.Full:
+        return
+    writer.join(timeout)
+
+
+def get(name: str) -> logging.Logger:
+    setup()
+    return logging.getLogger(name)
+
+
+def sampled(name: str, rate: float = LOG_RATE, burst: int = LOG_BURST) -> Sampled:
+    return Sampled(get(name), rate, burst)
@@ -0,0 +1,259 @@
+"""Counter / gauge / histogram nhẹ cho các lab server, xuất dạng text (Prometheus).
+
+Đường nóng không lấy lock: mỗi thread ghi vào ô (cell) riêng của nó, chỉ lúc
+render() mới cộng các ô lại. Ô của thread đã kết thúc được gộp vào giá trị nền
+rồi bỏ đi, nên server 1 thread/client không bị phình bộ nhớ.
+
+    from common import metrics
+    CONNS = metrics.counter("echo_connections_total", "Số kết nối đã nhận")
+    CONNS.inc()
+    metrics.start_from_env()  # METRICS_PORT=9101 -> http://host:9101/metrics
+"""
+
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Giây; đủ cho RTT LAN tới upload file lớn
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+PRUNE_MIN = 64
+
+
+class _Sharded:
+    """Cơ sở: mỗi thread 1 cell, cell của thread chết gộp vào _base."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cells = []  # [(thread, cell)]
+        self._prune_at = PRUNE_MIN  # số cell mà _cell() phải dọn thread chết trước khi thêm
+
+    def _new_cell(self):
+        raise NotImplementedError
+
+    def _merge(self, cell):
+        raise NotImplementedError
+
+    def _cell(self):
+        cell = self._new_cell()
+        self._local.cell = cell
+        with self._lock:
+            # Không ai gọi render() thì list vẫn phải được dọn: mỗi lần nó dài gấp
+            # đôi số cell còn sống -> chi phí dọn chia đều cho các thread mới
+            if len(self._cells) >= self._prune_at:
+                self._prune()
+            self._cells.append((threading.current_thread(), cell))
+        return cell
+
+    def _prune(self):
+        """Gộp cell của thread đã chết vào _base (gọi khi đang giữ _lock)."""
+        alive = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                self._merge(cell)
+        self._cells = alive
+        self._prune_at = max(PRUNE_MIN, 2 * len(alive))
+
+    def _live_cells(self) -> list:
+        with self._lock:
+            self._prune()
+            return [cell for _thread, cell in self._cells]
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def __init__(self):
+        super().__init__()
+        self._base = 0
+
+    def _new_cell(self):
+        return [0]
+
+    def _merge(self, cell):
+        self._base += cell[0]
+
+    def inc(self, n=1):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cell()
+        cell[0] += n
+
+    def value(self):
+        cells = self._live_cells()
+        return self._base + sum(c[0] for c in cells)
+
+    def samples(self, name: str, labels: str) -> list:
+        return [f"{name}{labels} {self.value()}"]
+
+
+class Gauge(Counter):
+    """inc()/dec() từ nhiều thread, set() khi chỉ 1 thread ghi, hoặc fn() tính lúc render."""
+
+    kind = "gauge"
+
+    def __init__(self, fn=None):
+        super().__init__()
+        self.fn = fn
+
+    def dec(self, n=1):
+        self.inc(-n)
+
+    def set(self, v):
+        # _base là giá trị nền (cộng với các shard inc/dec nếu có); _prune() của thread
+        # khác cộng cell chết vào _base dưới _lock -> ghi không lock sẽ mất 1 trong 2
+        with self._lock:
+            self._base = v
+
+    def value(self):
+        if self.fn is not None:
+            return self.fn()
+        return super().value()
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        super().__init__()
+        self.buckets = tuple(sorted(buckets))
+        self._base = self._new_cell()
+
+    def _new_cell(self):
+        # [count theo bucket (+Inf ở cuối)..., tổng, số mẫu]
+        return [0] * (len(self.buckets) + 1) + [0.0, 0]
+
+    def _merge(self, cell):
+        base = self._base
+        for i, v in enumerate(cell):
+            base[i] += v
+
+    def observe(self, v):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cell()
+        cell[bisect.bisect_left(self.buckets, v)] += 1
+        cell[-2] += v
+        cell[-1] += 1
+
+    def snapshot(self) -> list:
+        cells = self._live_cells()
+        total = list(self._base)
+        for cell in cells:
+            for i, v in enumerate(cell):
+                total[i] += v
+        return total
+
+    def samples(self, name: str, labels: str) -> list:
+        snap = self.snapshot()
+        n = len(self.buckets)
+        inner = labels[1:-1] + "," if labels else ""
+        out = []
+        acc = 0
+        for i, le in enumerate(self.buckets):
+            acc += snap[i]
+            out.append(f'{name}_bucket{{{inner}le="{le:g}"}} {acc}')
+        acc += snap[n]
+        out.append(f'{name}_bucket{{{inner}le="+Inf"}} {acc}')
+        out.append(f"{name}_sum{labels} {snap[-2]:.6f}")
+        out.append(f"{name}_count{labels} {snap[-1]}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}  # name -> [kind, help, {labels_text: metric}]
+
+    def _get(self, cls, name: str, help: str, labels: dict, **kwargs):
+        text = ""
+        if labels:
+            text = "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = [cls.kind, help, {}]
+            elif family[0] != cls.kind:
+                raise ValueError(f"metric {name} already registered as {family[0]}")
+            metric = family[2].get(text)
+            if metric is None:
+                metric = family[2][text] = cls(**kwargs)
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            families = [(name, f[0], f[1], list(f[2].items())) for name, f in self._families.items()]
+        lines = []
+        for name, kind, help, series in families:
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series:
+                lines.extend(metric.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str = "", **labels) -> Counter:
+    return REGISTRY._get(Counter, name, help, labels)
+
+
+def gauge(name: str, help: str = "", fn=None, **labels) -> Gauge:
+    g = REGISTRY._get(Gauge, name, help, labels)
+    if fn is not None:
+        g.fn = fn
+    return g
+
+
+def histogram(name: str, help: str = "", buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+    return REGISTRY._get(Histogram, name, help, labels, buckets=buckets)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("content-type", CONTENT_TYPE)
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Prometheus scrape định kỳ, không cần log
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    return httpd
+
+
+def start_from_env(offset: int = 0):
+    """Bật exporter nếu có METRICS_PORT (offset: worker thứ i dùng port + i)."""
+    port = int(os.getenv("METRICS_PORT", "0") or 0)
+    if not port:
+        return None
+    host = os.getenv("METRICS_HOST", "0.0.0.0")
+    httpd = start_http_server(port + offset, host)
+    print(f"📈 Metrics: http://{host}:{port + offset}/metrics")
+    return httpd
@@ -0,0 +1,639 @@
+"""Lõi server asyncio dùng chung: listener TCP / TLS / UDP trên 1 event loop.
+
+Mỗi lab chỉ viết phần giao thức (StreamHandler / DatagramHandler); runtime lo
+accept, giới hạn số kết nối, idle timeout, bắt tay TLS có deadline, drain khi
+nhận SIGTERM và chế độ nhiều worker (fork + SO_REUSEPORT, worker chết thì
+restart).
+
+    from common import runtime
+
+    class Echo(runtime.StreamHandler):
+        async def handle(self, conn):
+            while data := await conn.read():
+                conn.write(data)
+                await conn.flush()
+
+    server = runtime.Server()
+    server.add_tcp(Echo(), port=9001)
+    runtime.serve(server, workers=4)
+
+Khi đủ max_connections, vòng accept dừng lại (không accept rồi đóng): client
+mới nằm chờ trong backlog của kernel như SelectorEchoServer ở lab 01. Giới hạn
+theo IP / tốc độ accept (common.admission) thì ngược lại: accept rồi trả
+BUSY và đóng ngay, không tạo task.
+
+Deadline idle / read / write / handshake của mọi kết nối nằm chung 1 TimerWheel
+(common.timerwheel), kim quay mỗi TIMER_TICK giây; kết nối hết hạn bị huỷ
+theo lô, sai số tối đa 1 tick. Deadline chỉ chạy trong lúc chờ peer (đang
+đọc hoặc drain): handler chỉ ghi (SSE) hay đang chờ đĩa không bị tính idle.
+"""
+
+import asyncio
+import mmap
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+
+from . import log, metrics
+from .admission import BUSY, LISTEN_BACKLOG, MAX_CONNECTIONS, Admission, reject
+from .timerwheel import TimerWheel
+
+HOST = os.getenv("HOST", "0.0.0.0")
+IDLE_TIMEOUT = float(os.getenv("IDLE_TIMEOUT", "300"))  # 0 = không giới hạn
+HANDSHAKE_TIMEOUT = float(os.getenv("HANDSHAKE_TIMEOUT", "5"))
+MAX_PENDING_HANDSHAKES = int(os.getenv("MAX_PENDING_HANDSHAKES", "512"))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "10"))
+WORKERS = int(os.getenv("WORKERS", "1"))
+USE_UVLOOP = os.getenv("USE_UVLOOP", "1") == "1"
+WRITE_HIGH_WATER = int(os.getenv("WRITE_HIGH_WATER", str(256 * 1024)))
+WRITE_LOW_WATER = int(os.getenv("WRITE_LOW_WATER", str(64 * 1024)))
+REPORT_INTERVAL = float(os.getenv("REPORT_INTERVAL", "10"))
+TIMER_TICK = float(os.getenv("TIMER_TICK", "1"))
+READ_CHUNK = 64 * 1024
+
+CLOSE_REASONS = ("eof", "idle", "read", "write", "reset", "error", "drain", "handshake", "tls")
+
+try:
+    import uvloop  # optional: pip install uvloop
+except ImportError:
+    uvloop = None
+
+# Mỗi worker có 1 slot trong vùng nhớ chia sẻ: (active, total)
+_SLOT = struct.Struct("qq")
+
+
+class StreamHandler:
+    """Giao thức trên 1 kết nối TCP/TLS. 1 instance dùng chung cho mọi kết nối của listener."""
+
+    async def started(self):
+        """Gọi 1 lần trong event loop khi server (worker) bắt đầu chạy."""
+
+    async def handle(self, conn: "Connection"):
+        raise NotImplementedError
+
+    def closed(self, conn: "Connection", reason: str, exc: BaseException = None):
+        """reason: eof | timeout | reset | error | drain (conn.timed_out: idle | read | write)."""
+        if reason == "error":
+            print(f"❌ [ERROR] {conn.addr}: {exc}")
+
+    def handshake_done(self, conn: "Connection", seconds: float):
+        pass
+
+    def handshake_failed(self, addr, exc: BaseException):
+        """exc là TimeoutError nếu quá HANDSHAKE_TIMEOUT."""
+        print(f"❌ [TLS HANDSHAKE FAIL] {addr}: {exc!r}")
+
+    def rejected(self, addr, reason: str):
+        """Kết nối bị đóng ngay sau accept.
+
+        reason: handshakes (quá nhiều handshake đang chờ), per_ip | rate | total (admission).
+        """
+
+
+class DatagramHandler:
+    async def started(self):
+        pass
+
+    def datagram_received(self, data: bytes, addr, transport: asyncio.DatagramTransport):
+        raise NotImplementedError
+
+    def error_received(self, exc: OSError):
+        pass
+
+
+class Connection:
+    """reader/writer của 1 kết nối + đọc có idle timeout, ghi có high-water."""
+
+    __slots__ = ("reader", "writer", "transport", "addr", "listener", "idle_timeout", "high_water",
+                 "tls", "wheel", "timer", "task", "timed_out")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, addr,
+                 listener: "Listener", wheel: TimerWheel):
+        self.reader = reader
+        self.writer = writer
+        self.transport = writer.transport
+        self.addr = addr
+        self.listener = listener
+        self.idle_timeout = listener.idle_timeout
+        self.high_water = listener.write_high_water
+        self.tls = writer.get_extra_info("ssl_object")
+        self.wheel = wheel
+        self.timer = None
+        self.task = asyncio.current_task()
+        self.timed_out = None
+        self.transport.set_write_buffer_limits(high=listener.write_high_water, low=listener.write_low_water)
+
+    def _arm(self, reason: str, timeout: float):
+        """Deadline chỉ tính trong lúc chờ peer (1 lần đọc / drain), xong thì _disarm()."""
+        if not timeout:
+            return
+        if self.timer is None:
+            self.timer = self.wheel.schedule(self, timeout, reason)
+        else:
+            self.wheel.rearm(self.timer, self.wheel.now + timeout, reason)
+
+    def _disarm(self):
+        if self.timer is not None:
+            self.wheel.cancel(self.timer)
+
+    def expire(self, reason: str):
+        """Gọi từ TimerWheel: huỷ task đang phục vụ kết nối."""
+        self.timed_out = reason
+        self.task.cancel()
+
+    async def read(self, n: int = READ_CHUNK) -> bytes:
+        self._arm("idle", self.idle_timeout)
+        try:
+            return await self.reader.read(n)
+        finally:
+            self._disarm()
+
+    async def readline(self) -> bytes:
+        self._arm("idle", self.idle_timeout)
+        try:
+            return await self.reader.readline()
+        finally:
+            self._disarm()
+
+    async def readuntil(self, sep: bytes = b"\n") -> bytes:
+        self._arm("idle", self.idle_timeout)
+        try:
+            return await self.reader.readuntil(sep)
+        finally:
+            self._disarm()
+
+    async def readexactly(self, n: int, timeout: float = None) -> bytes:
+        """timeout: deadline riêng cho cả n byte (vd. thân 1 chunk), mặc định = idle."""
+        if timeout is None:
+            self._arm("idle", self.idle_timeout)
+        else:
+            self._arm("read", timeout)
+        try:
+            return await self.reader.readexactly(n)
+        finally:
+            self._disarm()
+
+    def write(self, data):
+        self.writer.write(data)
+
+    async def drain(self):
+        # Peer không đọc reply quá idle_timeout -> coi như treo
+        self._arm("write", self.idle_timeout)
+        try:
+            await self.writer.drain()
+        finally:
+            self._disarm()
+
+    async def flush(self):
+        """Chỉ chờ khi buffer ghi vượt high-water (client không đọc reply)."""
+        if self.transport.get_write_buffer_size() > self.high_water:
+            await self.drain()
+
+    async def close(self, abort: bool = False):
+        if self.timer is not None:
+            self.wheel.cancel(self.timer)
+            self.timer = None
+        if abort:
+            # Hết hạn / bị huỷ khi drain: bỏ dữ liệu chưa gửi, không chờ client
+            # chậm đọc nốt (TLS còn chờ close_notify tới 30s)
+            self.transport.abort()
+            return
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+class _Handshake:
+    """Chủ của timer bắt tay TLS: hết hạn -> huỷ task đang bắt tay."""
+
+    __slots__ = ("task", "timed_out")
+
+    def __init__(self):
+        self.task = asyncio.current_task()
+        self.timed_out = None
+
+    def expire(self, reason: str):
+        self.timed_out = reason
+        self.task.cancel()
+
+
+class Listener:
+    def __init__(self, handler: StreamHandler, host: str, port: int, ssl=None, name: str = "",
+                 idle_timeout: float = IDLE_TIMEOUT, handshake_timeout: float = HANDSHAKE_TIMEOUT,
+                 max_handshakes: int = MAX_PENDING_HANDSHAKES, limit: int = READ_CHUNK,
+                 write_high_water: int = WRITE_HIGH_WATER, write_low_water: int = WRITE_LOW_WATER,
+                 admission: Admission = None, busy_reply: bytes = BUSY):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        # SSLContext, hoặc hàm trả về SSLContext hiện tại (xoay khoá ticket ở lab 07)
+        self.ssl = ssl
+        self.name = name or f"{'tls' if ssl else 'tcp'}:{port}"
+        self.idle_timeout = idle_timeout
+        self.handshake_timeout = handshake_timeout
+        self.max_handshakes = max_handshakes
+        self.limit = limit
+        self.write_high_water = write_high_water
+        self.write_low_water = write_low_water
+        self.admission = admission
+        # TLS: client chưa bắt tay không đọc được plaintext -> chỉ đóng
+        self.busy_reply = b"" if ssl else busy_reply
+        self.sock = None
+        self.pending_handshakes = 0
+        self.active = metrics.gauge("runtime_connections_active", "Kết nối đang mở", listener=self.name)
+        self.accepted = metrics.counter("runtime_connections_total", "Kết nối đã accept", listener=self.name)
+        self.closed = {
+            reason: metrics.counter("runtime_closed_total", "Kết nối đã đóng theo lý do",
+                                    listener=self.name, reason=reason)
+            for reason in CLOSE_REASONS
+        }
+
+    def ssl_context(self):
+        return self.ssl() if callable(self.ssl) else self.ssl
+
+
+class DatagramListener:
+    def __init__(self, handler: DatagramHandler, host: str, port: int, name: str = "", rcvbuf: int = 0):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.name = name or f"udp:{port}"
+        self.rcvbuf = rcvbuf
+        self.transport = None
+
+
+class _DatagramAdapter(asyncio.DatagramProtocol):
+    def __init__(self, handler: DatagramHandler):
+        self.handler = handler
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.handler.datagram_received(data, addr, self.transport)
+
+    def error_received(self, exc):
+        self.handler.error_received(exc)
+
+
+def _listen_socket(host: str, port: int, kind: int, reuse_port: bool) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, kind)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.setblocking(False)
+    return sock
+
+
+class Server:
+    def __init__(self, max_connections: int = MAX_CONNECTIONS, drain_timeout: float = DRAIN_TIMEOUT,
+                 backlog: int = LISTEN_BACKLOG, tick: float = TIMER_TICK):
+        self.max_connections = max_connections
+        self.drain_timeout = drain_timeout
+        self.backlog = backlog
+        self.listeners = []
+        self.datagrams = []
+        self.conns = set()  # task phục vụ từng kết nối
+        self.total = 0
+        self.stats = None  # mmap chia sẻ với process cha (chế độ nhiều worker)
+        self.slot = 0
+        self._slots = None
+        self._accepting = []
+        self.tick = tick
+        self.wheel = None
+
+    def add_tcp(self, handler: StreamHandler, port: int, host: str = HOST, **kwargs) -> Listener:
+        """kwargs: ssl, name, idle_timeout, handshake_timeout, max_handshakes, limit, write_*_water,
+        admission, busy_reply."""
+        lst = Listener(handler, host, port, **kwargs)
+        self.listeners.append(lst)
+        return lst
+
+    def add_udp(self, handler: DatagramHandler, port: int, host: str = HOST, **kwargs) -> DatagramListener:
+        lst = DatagramListener(handler, host, port, **kwargs)
+        self.datagrams.append(lst)
+        return lst
+
+    @property
+    def active(self) -> int:
+        return len(self.conns)
+
+    def _publish(self):
+        if self.stats is not None:
+            _SLOT.pack_into(self.stats, self.slot * _SLOT.size, len(self.conns), self.total)
+
+    # ---------- start / accept ----------
+    async def start(self, reuse_port: bool = False):
+        loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_connections)
+        self.wheel = TimerWheel(self.tick, now=loop.time())
+        self._accepting.append(loop.create_task(self._tick_loop()))
+        for lst in self.listeners:
+            lst.sock = _listen_socket(lst.host, lst.port, socket.SOCK_STREAM, reuse_port)
+            lst.sock.listen(self.backlog)
+            self._accepting.append(loop.create_task(self._accept_loop(lst)))
+        for lst in self.datagrams:
+            sock = _listen_socket(lst.host, lst.port, socket.SOCK_DGRAM, reuse_port)
+            if lst.rcvbuf:
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, lst.rcvbuf)
+                except OSError:
+                    pass
+            lst.transport, _ = await loop.create_datagram_endpoint(
+                lambda h=lst.handler: _DatagramAdapter(h), sock=sock)
+
+        handlers = {id(l.handler): l.handler for l in self.listeners + self.datagrams}
+        for handler in handlers.values():
+            await handler.started()
+
+        names = ", ".join(l.name for l in self.listeners + self.datagrams)
+        loop_name = type(loop).__module__.split(".")[0]
+        print(f"📡 [RUNTIME] {names} (pid={os.getpid()}, loop={loop_name}, "
+              f"max_conns={self.max_connections}, backlog={self.backlog})")
+
+    async def _tick_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.tick)
+            # Cả lô kết nối hết hạn trong tick này bị huỷ 1 lượt
+            for timer in self.wheel.advance(loop.time()):
+                timer.owner.expire(timer.reason)
+
+    async def _accept_loop(self, lst: Listener):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Hết slot -> không gọi accept nữa, client chờ trong backlog của kernel
+            await self._slots.acquire()
+            try:
+                sock, addr = await loop.sock_accept(lst.sock)
+            except OSError as e:
+                # EMFILE/ENFILE: hết fd -> chờ 1 chút rồi thử lại
+                self._slots.release()
+                print(f"❌ [ACCEPT] {lst.name}: {e}")
+                await asyncio.sleep(0.1)
+                continue
+            except BaseException:
+                self._slots.release()
+                raise
+
+            if lst.ssl is not None and lst.pending_handshakes >= lst.max_handshakes:
+                # Quá nhiều handshake đang chờ -> từ chối ngay thay vì xếp hàng vô hạn
+                self._slots.release()
+                sock.close()
+                lst.handler.rejected(addr, "handshakes")
+                continue
+
+            if lst.admission is not None:
+                reason = lst.admission.check(addr)
+                if reason is not None:
+                    self._slots.release()
+                    reject(sock, lst.busy_reply)
+                    lst.handler.rejected(addr, reason)
+                    continue
+
+            task = loop.create_task(self._serve(lst, sock, addr))
+            self.conns.add(task)
+            self.total += 1
+            lst.accepted.inc()
+            lst.active.inc()
+            self._publish()
+
+    async def _open(self, lst: Listener, sock: socket.socket, addr):
+        """accept xong -> (reader, writer); với TLS là bắt tay có deadline."""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=lst.limit)
+        protocol = asyncio.StreamReaderProtocol(reader)
+        ctx = lst.ssl_context()
+        if ctx is None:
+            transport, _ = await loop.connect_accepted_socket(lambda: protocol, sock=sock)
+        else:
+            lst.pending_handshakes += 1
+            hs = _Handshake()
+            timer = self.wheel.schedule(hs, lst.handshake_timeout, "handshake", loop.time())
+            try:
+                # ssl_handshake_timeout chỉ là dự phòng; timer trong wheel mới là deadline
+                transport, _ = await loop.connect_accepted_socket(
+                    lambda: protocol, sock=sock, ssl=ctx,
+                    ssl_handshake_timeout=lst.handshake_timeout + self.tick + 1,
+                )
+            except asyncio.CancelledError:
+                if not hs.timed_out:
+                    raise
+                hs.task.uncancel()
+                raise TimeoutError("TLS handshake timed out") from None
+            finally:
+                self.wheel.cancel(timer)
+                lst.pending_handshakes -= 1
+        return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+    async def _serve(self, lst: Listener, sock: socket.socket, addr):
+        handler = lst.handler
+        try:
+            t0 = time.perf_counter()
+            try:
+                reader, writer = await self._open(lst, sock, addr)
+            except (OSError, TimeoutError) as e:  # ssl.SSLError là OSError
+                sock.close()
+                lst.closed["handshake" if isinstance(e, TimeoutError) else "tls"].inc()
+                handler.handshake_failed(addr, e)
+                return
+
+            conn = Connection(reader, writer, addr, lst, self.wheel)
+            if conn.tls is not None:
+                handler.handshake_done(conn, time.perf_counter() - t0)
+
+            reason, exc = "eof", None
+            try:
+                await handler.handle(conn)
+            except (ConnectionResetError, BrokenPipeError):
+                reason = "reset"
+            except asyncio.CancelledError:
+                if conn.timed_out:
+                    conn.task.uncancel()
+                    reason = "timeout"
+                else:
+                    reason = "drain"
+            except Exception as e:
+                reason, exc = "error", e
+            lst.closed[conn.timed_out or reason].inc()
+            handler.closed(conn, reason, exc)
+            await conn.close(abort=reason in ("timeout", "drain"))
+        except asyncio.CancelledError:
+            sock.close()  # huỷ lúc đang bắt tay (drain)
+        finally:
+            self._slots.release()
+            if lst.admission is not None:
+                lst.admission.release(addr)
+            self.conns.discard(asyncio.current_task())
+            lst.active.dec()
+            self._publish()
+
+    # ---------- stop ----------
+    async def shutdown(self):
+        """Ngừng accept, chờ kết nối đang mở tự đóng tối đa drain_timeout, quá thì huỷ."""
+        for task in self._accepting:
+            task.cancel()
+        await asyncio.gather(*self._accepting, return_exceptions=True)
+        self._accepting = []
+        for lst in self.listeners:
+            if lst.sock is not None:
+                lst.sock.close()
+        for lst in self.datagrams:
+            if lst.transport is not None:
+                lst.transport.close()
+
+        pending = set(self.conns)
+        if not pending:
+            return
+        print(f"⏳ Draining {len(pending)} connection(s) (max {self.drain_timeout:.0f}s)...")
+        _done, pending = await asyncio.wait(pending, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def serve_forever(self, reuse_port: bool = False):
+        """Chạy tới khi nhận SIGINT/SIGTERM rồi drain."""
+        await self.start(reuse_port)
+        # Mỗi worker 1 exporter riêng: METRICS_PORT + slot
+        metrics.start_from_env(offset=self.slot)
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+
+        await stop_event.wait()
+        await self.shutdown()
+        print(f"🛑 Server stopping... (pid={os.getpid()})")
+
+
+def run(coro, use_uvloop: bool = False):
+    """asyncio.run(), dùng uvloop nếu được yêu cầu và đã cài."""
+    if use_uvloop and USE_UVLOOP and uvloop is not None:
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            return runner.run(coro)
+    return asyncio.run(coro)
+
+
+def serve(server: Server, workers: int = WORKERS, use_uvloop: bool = False):
+    """workers = 1: chạy ngay trong process này; > 1: fork N worker chung port.
+
+    Worker chỉ mang theo event loop: thread tạo trước serve() không có trong
+    process con và state trong RAM không chia sẻ giữa các worker. Lab có thread
+    nền hoặc state dùng chung thì truyền workers=1 thay vì để env WORKERS quyết định.
+    """
+    if workers > 1:
+        run_workers(server, workers, use_uvloop)
+    else:
+        run(server.serve_forever(), use_uvloop)
+
+
+def _run_worker(server: Server, stats: mmap.mmap, slot: int, use_uvloop: bool):
+    """Chạy trong process con sau fork()."""
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_DFL)
+    server.stats, server.slot = stats, slot
+    server._publish()
+
+    code = 0
+    try:
+        run(server.serve_forever(reuse_port=True), use_uvloop)
+    except Exception as e:
+        print(f"❌ [WORKER {slot}] {e}")
+        code = 1
+    finally:
+        # os._exit bỏ qua atexit và không xả buffer của sys.stdout: ghi nốt log
+        # còn trong queue, rồi các dòng print() (vd. [WORKER] lỗi ở trên)
+        log.shutdown()
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+        os._exit(code)
+
+
+def run_workers(server: Server, n: int, use_uvloop: bool = False):
+    """Process cha: fork N worker, restart worker chết, forward SIGTERM, gộp số liệu."""
+    stats = mmap.mmap(-1, _SLOT.size * n)
+    children = {}  # pid -> slot
+    stopping = False
+
+    def spawn(slot: int):
+        _SLOT.pack_into(stats, slot * _SLOT.size, 0, 0)
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(server, stats, slot, use_uvloop)
+        children[pid] = slot
+        print(f"👷 [WORKER {slot}] started pid={pid}")
+
+    def _forward(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _forward)
+    signal.signal(signal.SIGINT, _forward)
+
+    print(f"🚀 Starting {n} workers (SO_REUSEPORT)...")
+    for slot in range(n):
+        spawn(slot)
+
+    last_spawn = [0.0] * n
+    totals_done = 0  # tổng kết nối của các worker đã chết
+    next_report = time.monotonic() + REPORT_INTERVAL
+
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+
+        if pid:
+            slot = children.pop(pid)
+            totals_done += _SLOT.unpack_from(stats, slot * _SLOT.size)[1]
+            _SLOT.pack_into(stats, slot * _SLOT.size, 0, 0)
+            code = os.waitstatus_to_exitcode(status)
+            if stopping:
+                print(f"✅ [WORKER {slot}] pid={pid} exited ({code})")
+                continue
+
+            print(f"⚠️ [WORKER {slot}] pid={pid} died ({code}), restarting...")
+            # Tránh restart liên tục nếu worker chết ngay khi khởi động
+            if time.monotonic() - last_spawn[slot] < 1.0:
+                time.sleep(1.0)
+            last_spawn[slot] = time.monotonic()
+            spawn(slot)
+            continue
+
+        time.sleep(0.2)
+        now = time.monotonic()
+        if now >= next_report:
+            report_workers(stats, n, totals_done)
+            next_report = now + REPORT_INTERVAL
+
+    report_workers(stats, n, totals_done)
+    print("🛑 Server stopped.")
+
+
+def report_workers(stats: mmap.mmap, n: int, totals_done: int = 0):
+    rows = [_SLOT.unpack_from(stats, i * _SLOT.size) for i in range(n)]
+    active = sum(r[0] for r in rows)
+    total = sum(r[1] for r in rows) + totals_done
+    per_worker = " ".join(str(r[0]) for r in rows)
+    print(f"📊 [CONNS] active={active} total={total} | per worker: {per_worker}")
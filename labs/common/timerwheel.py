@@ -0,0 +1,125 @@
+"""Hashed timer wheel cho deadline của rất nhiều kết nối (idle / read / handshake).
+
+Mỗi kết nối giữ 1 Timer. Khi có hoạt động chỉ cần gán lại timer.deadline
+(O(1), không đụng tới cấu trúc dữ liệu nào). Timer nằm trong slot theo
+deadline lúc được đặt vào; khi kim quay tới slot đó mà deadline đã bị lùi
+về sau thì timer được chuyển sang slot mới, còn đã quá hạn thì trả về trong
+1 lô để server đóng một lượt.
+
+    wheel = TimerWheel(tick=1.0)
+    t = wheel.schedule(conn, IDLE_TIMEOUT, "idle", now)
+    t.deadline = now + IDLE_TIMEOUT   # có dữ liệu -> lùi deadline (chỉ gán số)
+    wheel.rearm(t, now + 5, "read")   # deadline sớm hơn -> phải qua rearm()
+    for t in wheel.advance(now):      # gọi mỗi tick
+        close(t.owner, t.reason)
+
+So với heap (asyncio.timeout / call_later) không có O(log n) cho mỗi lần
+re-arm, so với quét toàn bộ kết nối thì mỗi tick chỉ xét 1 slot.
+"""
+
+from . import metrics
+
+TICK = 1.0
+SLOTS = 512
+
+
+class Timer:
+    __slots__ = ("owner", "reason", "deadline", "slot")
+
+    def __init__(self, owner, reason: str, deadline: float):
+        self.owner = owner
+        self.reason = reason
+        self.deadline = deadline
+        self.slot = None  # set chứa timer (None = không còn trong wheel)
+
+
+class TimerWheel:
+    def __init__(self, tick: float = TICK, slots: int = SLOTS, now: float = 0.0):
+        self.tick = tick
+        self.size = slots
+        self.slots = [set() for _ in range(slots)]
+        self.current = int(now / tick)  # tick kế tiếp chưa xử lý
+        self.now = now
+        self.count = 0
+        self.expired = {}  # reason -> số timer đã hết hạn
+
+    def _place(self, timer: Timer):
+        # Không đặt vào tick đã qua, nếu không sẽ phải chờ hết 1 vòng mới tới
+        idx = max(int(timer.deadline / self.tick), self.current)
+        bucket = self.slots[idx % self.size]
+        bucket.add(timer)
+        timer.slot = bucket
+
+    def schedule(self, owner, delay: float, reason: str, now: float = None) -> Timer:
+        if now is not None:
+            self.now = now
+        timer = Timer(owner, reason, self.now + delay)
+        self._place(timer)
+        self.count += 1
+        return timer
+
+    def rearm(self, timer: Timer, deadline: float, reason: str = None):
+        """Đặt deadline mới. Lùi về sau chỉ là gán số; kéo sớm lại thì đổi slot.
+
+        Timer đã cancel() (hoặc đã hết hạn) được đặt lại vào wheel.
+        """
+        if reason is not None:
+            timer.reason = reason
+        if timer.slot is None:
+            timer.deadline = deadline
+            self._place(timer)
+            self.count += 1
+        elif deadline < timer.deadline:
+            timer.slot.discard(timer)
+            timer.deadline = deadline
+            self._place(timer)
+        else:
+            timer.deadline = deadline
+
+    def cancel(self, timer: Timer):
+        if timer.slot is not None:
+            timer.slot.discard(timer)
+            timer.slot = None
+            self.count -= 1
+
+    def advance(self, now: float) -> list:
+        """Quay kim tới `now` -> list timer đã hết hạn (đã bỏ khỏi wheel)."""
+        self.now = now
+        target = int(now / self.tick)
+        if target - self.current >= self.size:
+            # Lâu không gọi (vd. loop bị chặn): 1 vòng là đủ để xét mọi slot
+            self.current = target - self.size + 1
+        expired = []
+        while self.current <= target:
+            bucket = self.slots[self.current % self.size]
+            self.current += 1
+            if not bucket:
+                continue
+            for timer in list(bucket):
+                if timer.deadline <= now:
+                    bucket.discard(timer)
+                    timer.slot = None
+                    expired.append(timer)
+                else:
+                    # deadline đã được lùi -> chuyển sang slot mới
+                    bucket.discard(timer)
+                    self._place(timer)
+        self.count -= len(expired)
+        for timer in expired:
+            self.expired[timer.reason] = self.expired.get(timer.reason, 0) + 1
+            _expired_counter(timer.reason).inc()
+        return expired
+
+    def __len__(self) -> int:
+        return self.count
+
+
+_EXPIRED = {}
+
+
+def _expired_counter(reason: str) -> metrics.Counter:
+    counter = _EXPIRED.get(reason)
+    if counter is None:
+        counter = _EXPIRED[reason] = metrics.counter(
+            "timer_expired_total", "Deadline hết hạn theo loại", reason=reason)
+    return counter
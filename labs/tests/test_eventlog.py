@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "08-mcast-bus"))
+from eventlog import EventLog
+
+
+class EventLogTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def test_empty_segment_left_by_crash_is_recreated(self):
+        Path(self.dir, f"{1:020d}.log").touch()
+        log = EventLog(self.dir, segment_size=4096)
+        log.append(1, "multicast", "t", None, "m1")
+        log.close()
+
+        log = EventLog(self.dir, segment_size=4096)
+        self.addCleanup(log.close)
+        self.assertEqual(log.tail(10), [(1, "multicast", "t", None, "m1")])
+
+    def test_submitted_records_written_by_background_thread(self):
+        log = EventLog(self.dir, segment_size=256)  # vài record / segment -> roll nhiều lần
+        for seq in range(1, 41):
+            log.submit([(seq, "broadcast", "t", "a:1", f"m{seq}")])
+        log.close()
+
+        self.assertGreater(len(os.listdir(self.dir)), 2)
+        log = EventLog(self.dir, segment_size=256)
+        self.addCleanup(log.close)
+        self.assertEqual([r[0] for r in log.tail(100)], list(range(1, 41)))
+
+
+if __name__ == "__main__":
+    unittest.main()
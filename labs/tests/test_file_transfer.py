@@ -0,0 +1,137 @@
+import asyncio
+import importlib.util
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+LABS = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(LABS))
+sys.path.insert(0, str(LABS / "03-file-transfer"))
+from common import runtime
+
+_spec = importlib.util.spec_from_file_location("ft_server", LABS / "03-file-transfer" / "server.py")
+ft = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ft)
+
+from protocol import pack_v2_header
+
+
+class SlowDiskTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patch("UPLOAD_DIR", Path(self.tmp.name))
+        self.patch("READ_TIMEOUT", 0.3)
+        self.patch("WRITE_CHUNK", 64 * 1024)
+        pwrite_all = ft.pwrite_all
+
+        def slow_pwrite(fd, data, offset):
+            time.sleep(0.5)  # mỗi buffer chờ đĩa lâu hơn READ_TIMEOUT
+            pwrite_all(fd, data, offset)
+
+        self.patch("pwrite_all", slow_pwrite)
+
+        self.server = runtime.Server(tick=0.1)
+        lst = self.server.add_tcp(ft.AsyncFileTransfer(disk_threads=1), 0, "127.0.0.1")
+        await self.server.start()
+        self.port = lst.sock.getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.server.shutdown()
+        self.tmp.cleanup()
+
+    def patch(self, name, value):
+        old = getattr(ft, name)
+        setattr(ft, name, value)
+        self.addCleanup(setattr, ft, name, old)
+
+    async def test_upload_held_by_slow_disk_is_not_a_read_timeout(self):
+        payload = bytes(range(256)) * 1024  # 4 buffer -> ~2s chờ đĩa
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.assertEqual(await reader.readline(), b"READY\n")
+        writer.write(pack_v2_header("slow.bin", len(payload)) + payload)
+        reply = await asyncio.wait_for(reader.readline(), timeout=10)
+        writer.close()
+
+        self.assertEqual(reply, b"DONE\n")
+        self.assertEqual((Path(self.tmp.name) / "slow.bin").read_bytes(), payload)
+
+
+class UploadRegistryTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        for name, value in (("UPLOAD_DIR", self.dir), ("PARTIAL_DIR", self.dir)):
+            old = getattr(ft, name)
+            setattr(ft, name, value)
+            self.addCleanup(setattr, ft, name, old)
+        self.reg = ft.UploadRegistry(max_open=2, idle=60)
+
+    def test_commit_waits_for_inflight_write(self):
+        up = self.reg.open("u1", "a.bin", 4)
+        up.write_chunk(0, b"abcd")
+        writing = self.reg.acquire("u1")  # CHUNK trùng đang ghi
+
+        save_path, missing = self.reg.commit("u1")
+        self.assertEqual(missing, [])
+        writing.write_chunk(0, b"abcd")  # fd vẫn mở
+        self.reg.release(writing)
+
+        self.assertRaises(OSError, os.fstat, up.fd)
+        self.assertEqual(save_path.read_bytes(), b"abcd")
+        self.assertFalse((self.dir / "u1.json").exists())
+
+    def test_idle_upload_closed_and_resumed_from_sidecar(self):
+        up = self.reg.open("u1", "a.bin", 8)
+        up.write_chunk(0, b"abcd")
+        up.last_used -= 120
+
+        self.assertEqual(self.reg.sweep(), 1)
+        self.assertRaises(OSError, os.fstat, up.fd)
+
+        again = self.reg.get("u1")
+        self.assertIsNot(again, up)
+        self.assertEqual(again.missing(), [[4, 8]])
+
+    def test_stale_part_without_sidecar_is_truncated(self):
+        (self.dir / "u1.part").write_bytes(b"old data, longer than the new upload")
+        up = self.reg.open("u1", "a.bin", 4)
+        up.write_chunk(0, b"abcd")
+
+        save_path, _missing = self.reg.commit("u1")
+        self.assertEqual(save_path.read_bytes(), b"abcd")
+
+    def test_open_upload_cap(self):
+        self.reg.open("u1", "a.bin", 1)
+        self.reg.open("u2", "b.bin", 1)
+        with self.assertRaises(ValueError):
+            self.reg.open("u3", "c.bin", 1)
+
+    def test_init_rejects_oversized_upload(self):
+        with self.assertRaises(ValueError):
+            ft.run_command("INIT", ["INIT", "u1", str(ft.MAX_UPLOAD_SIZE + 1), "a.bin"], None, "")
+
+
+class ThreadChunkBudgetTest(unittest.TestCase):
+    def test_chunk_bodies_wait_for_budget(self):
+        budget = ft.ThreadByteBudget(100)
+        self.assertEqual(budget.acquire(80), 80)
+        got = []
+        t = threading.Thread(target=lambda: got.append(budget.acquire(50)))
+        t.start()
+        t.join(0.2)
+        self.assertTrue(t.is_alive())  # 80 + 50 > 100 -> chờ
+
+        budget.release(80)
+        t.join(2)
+        self.assertEqual(got, [50])
+        budget.release(50)
+        self.assertEqual(budget.acquire(500), 100)  # chunk lớn hơn cả budget: giữ toàn bộ
+
+
+if __name__ == "__main__":
+    unittest.main()
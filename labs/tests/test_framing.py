@@ -0,0 +1,24 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import framing
+
+
+class ReplyLinesTest(unittest.TestCase):
+    def test_echo_batch_in_order(self):
+        seen = []
+        out, quit_ = framing.reply_lines([b"a", b" b \r"], b"TLS-ECHO: ", on_message=seen.append)
+        self.assertEqual(out, b"TLS-ECHO: a\nTLS-ECHO: b\n")
+        self.assertFalse(quit_)
+        self.assertEqual(seen, ["a", "b"])
+
+    def test_quit_stops_batch(self):
+        out, quit_ = framing.reply_lines([b"a", b"QUIT", b"ignored"], bye=b"Bye TLS!\n")
+        self.assertEqual(out, b"ECHO: a\nBye TLS!\n")
+        self.assertTrue(quit_)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import importlib.util
+import sys
+import unittest
+from pathlib import Path
+
+LABS = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(LABS))
+sys.path.insert(0, str(LABS / "08-mcast-bus"))
+
+_spec = importlib.util.spec_from_file_location("bus_server", LABS / "08-mcast-bus" / "server.py")
+bus = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bus)
+
+
+class FeedCursorTest(unittest.TestCase):
+    def setUp(self):
+        self.store = bus.EventStore(capacity=100, per_type=100)
+        for i in range(1, 21):
+            kind = "multicast" if i % 2 else "broadcast"
+            self.store.append(kind, f"m{i}", None, "t")
+
+    def page(self, kind, limit, since):
+        events = self.store.query(kind, limit, since)
+        return [ev.seq for ev in events], self.store.cursor(events, limit, since)
+
+    def test_since_returns_oldest_events_first(self):
+        seqs, cursor = self.page("all", 5, 3)
+        self.assertEqual(seqs, [4, 5, 6, 7, 8])
+        self.assertEqual(cursor, 8)
+
+    def test_paging_with_cursor_misses_nothing(self):
+        seen, since = [], 0
+        while True:
+            seqs, cursor = self.page("multicast", 3, since)
+            seen += seqs
+            if cursor == since:
+                break
+            since = cursor
+        self.assertEqual(seen, list(range(1, 21, 2)))
+        self.assertEqual(since, self.store.seq)
+
+    def test_latest_without_since(self):
+        seqs, cursor = self.page("all", 3, -1)
+        self.assertEqual(seqs, [18, 19, 20])
+        self.assertEqual(cursor, 20)
+
+
+class FlakySender:
+    def send_many(self, payloads, rate=0.0):
+        return [i for i, p in enumerate(payloads) if p.startswith(b"bad")]
+
+
+class SendBatchTest(unittest.TestCase):
+    def setUp(self):
+        for name, value in (("_store", bus.EventStore(100, 100)), ("_senders", {"multicast": FlakySender()})):
+            old = getattr(bus, name)
+            setattr(bus, name, value)
+            self.addCleanup(setattr, bus, name, old)
+
+    def test_only_sent_messages_reach_the_feed(self):
+        code, body = bus.handle_send("/send/batch", {"messages": ["a", "bad1", "b", "bad2"]})
+        self.assertEqual((code, body["sent"], body["failed"]), (200, 2, 2))
+        self.assertEqual([ev.message for ev in bus._store.query("all", 10)], ["a", "b"])
+
+    def test_slow_rates_rejected(self):
+        code, _ = bus.handle_send("/send/batch", {"messages": ["a"], "rate": 0.001})
+        self.assertEqual(code, 400)
+        messages = ["a"] * int(bus.MAX_BATCH_SECONDS * 10 + 1)
+        code, _ = bus.handle_send("/send/batch", {"messages": messages, "rate": 10})
+        self.assertEqual(code, 413)
+        self.assertEqual(bus._store.seq, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import metrics
+
+
+class ShardedCellsTest(unittest.TestCase):
+    def test_dead_thread_cells_pruned_without_render(self):
+        counter = metrics.Counter()
+        hist = metrics.Histogram(buckets=(1.0,))
+        for _ in range(1000):
+            t = threading.Thread(target=lambda: (counter.inc(), hist.observe(0.5)))
+            t.start()
+            t.join()
+
+        self.assertLessEqual(len(counter._cells), metrics.PRUNE_MIN)
+        self.assertLessEqual(len(hist._cells), metrics.PRUNE_MIN)
+        self.assertEqual(counter.value(), 1000)
+        self.assertEqual(hist.snapshot()[-1], 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
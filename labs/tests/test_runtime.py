@@ -0,0 +1,67 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common import runtime
+
+IDLE = 0.5
+TICK = 0.1
+
+
+class WriteOnly(runtime.StreamHandler):
+    """Đọc 1 dòng rồi chỉ ghi (như /feed/stream của lab 08) lâu hơn idle_timeout."""
+
+    def __init__(self, ticks: int):
+        self.ticks = ticks
+        self.closed_with = None
+
+    async def handle(self, conn):
+        await conn.readline()
+        for _ in range(self.ticks):
+            conn.write(b"tick\n")
+            await conn.drain()
+            await asyncio.sleep(IDLE / 2)
+
+    def closed(self, conn, reason, exc=None):
+        self.closed_with = (reason, conn.timed_out)
+
+
+class ReadForever(WriteOnly):
+    async def handle(self, conn):
+        while await conn.readline():
+            pass
+
+
+class IdleTimeoutTest(unittest.IsolatedAsyncioTestCase):
+    async def serve(self, handler) -> int:
+        self.server = runtime.Server(tick=TICK)
+        lst = self.server.add_tcp(handler, 0, "127.0.0.1", idle_timeout=IDLE)
+        await self.server.start()
+        self.addAsyncCleanup(self.server.shutdown)
+        return lst.sock.getsockname()[1]
+
+    async def test_write_only_handler_outlives_idle_timeout(self):
+        handler = WriteOnly(ticks=6)  # ~1.5s, gấp 3 lần IDLE
+        reader, writer = await asyncio.open_connection("127.0.0.1", await self.serve(handler))
+        writer.write(b"subscribe\n")
+        data = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+
+        self.assertEqual(data.count(b"tick\n"), 6)
+        await asyncio.sleep(TICK)
+        self.assertEqual(handler.closed_with, ("eof", None))
+
+    async def test_silent_peer_still_times_out(self):
+        handler = ReadForever(ticks=0)
+        reader, writer = await asyncio.open_connection("127.0.0.1", await self.serve(handler))
+        data = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+
+        self.assertEqual(data, b"")
+        self.assertEqual(handler.closed_with, ("timeout", "idle"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import errno
+import importlib.util
+import selectors
+import socket
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+LABS = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(LABS))
+
+_spec = importlib.util.spec_from_file_location("echo_server", LABS / "01-tcp-echo" / "server.py")
+echo = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(echo)
+
+
+class FailingSocket(socket.socket):
+    def recv(self, *args):
+        raise OSError(errno.ETIMEDOUT, "Connection timed out")
+
+
+class SelectorRecvErrorTest(unittest.TestCase):
+    def test_recv_error_closes_only_that_connection(self):
+        listener = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(listener.close)
+        server = echo.SelectorEchoServer(listener)
+
+        a, b = socket.socketpair()
+        self.addCleanup(b.close)
+        sock = FailingSocket(fileno=a.detach())
+        addr = ("198.51.100.1", 1)
+        conn = echo.Connection(sock, addr)
+        # Nhận qua ADMISSION như _accept() để _close() release đúng 1 lần
+        total = echo.ADMISSION.total
+        self.assertIsNone(echo.ADMISSION.check(addr))
+        server.conns[sock.fileno()] = conn
+        errors = echo.ERRORS.value()
+
+        server._on_readable(conn)
+
+        self.assertEqual(server.conns, {})
+        self.assertEqual(echo.ADMISSION.total, total)
+        self.assertNotIn(addr[0], echo.ADMISSION.per_ip)
+        self.assertEqual(sock.fileno(), -1)
+        self.assertEqual(echo.ERRORS.value(), errors + 1)
+
+
+class SelectorBackpressureTest(unittest.TestCase):
+    HIGH = 64 * 1024
+    LINE = b"x" * 999 + b"\n"
+    LINES = 4000  # ~4 MB reply, gấp nhiều lần HIGH + buffer của kernel
+
+    def setUp(self):
+        for name, value in (("WRITE_HIGH_WATER", self.HIGH), ("WRITE_LOW_WATER", self.HIGH // 4)):
+            old = getattr(echo, name)
+            setattr(echo, name, value)
+            self.addCleanup(setattr, echo, name, old)
+
+    def test_pipelining_without_reading_pauses_the_reader(self):
+        listener = socket.socket()
+        # Buffer kernel nhỏ (kết nối accept kế thừa) để thấy rõ buffer của server
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        server = echo.SelectorEchoServer(listener)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        client = socket.socket()
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        client.connect(listener.getsockname())
+        self.addCleanup(client.close)
+
+        # Gửi tới khi server ngừng đọc (send bị chặn ~0.5s), không đọc reply nào
+        payload = self.LINE * self.LINES
+        client.setblocking(False)
+        sent, stalled = 0, None
+        while sent < len(payload):
+            try:
+                sent += client.send(payload[sent:])
+                stalled = None
+            except BlockingIOError:
+                stalled = stalled or time.monotonic()
+                if time.monotonic() - stalled > 0.5:
+                    break
+                time.sleep(0.01)
+        self.assertLess(sent, len(payload))
+
+        (conn,) = list(server.conns.values())
+        self.assertEqual(conn.events, selectors.EVENT_WRITE)
+        self.assertLess(len(conn.outbuf), self.HIGH + 8 * echo.RECV_SIZE)
+
+        # Client đọc reply -> server đọc tiếp, cuối cùng echo đủ mọi dòng
+        client.setblocking(True)
+        writer = threading.Thread(target=client.sendall, args=(payload[sent:],))
+        writer.start()
+        received = 0
+        client.settimeout(10)
+        while received < self.LINES + 1:
+            received += client.recv(1 << 20).count(b"\n")
+        writer.join()
+        self.assertEqual(received, self.LINES + 1)  # + dòng Welcome
+
+
+if __name__ == "__main__":
+    unittest.main()